@@ -0,0 +1,17 @@
+import sys
+
+CLI_COMMANDS = ("batch", "export", "postprocess", "takes")
+
+
+def main():
+    # 命令行子命令走无界面路径，避免导入 customtkinter/winsound
+    if len(sys.argv) > 1 and (sys.argv[1] in CLI_COMMANDS or sys.argv[1] in ("-h", "--help")):
+        from dubbing_tool.cli import main as cli_main
+        sys.exit(cli_main(sys.argv[1:]))
+
+    from dubbing_tool.main import main as gui_main
+    gui_main()
+
+
+if __name__ == '__main__':
+    main()
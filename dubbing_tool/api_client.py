@@ -1,27 +1,525 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+import io
+import os
+import re
+import zipfile
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
 from urllib.parse import urlparse, urljoin
+from threading import Event, Lock, Thread, local
+from dubbing_tool.audio import split_text, stitch_wav
+from dubbing_tool.scheduler import RequestScheduler, PRIORITY_BATCH
+from dubbing_tool import metrics
+from dubbing_tool.utils import atomic_open
+
+DEFAULT_POOL_SIZE = 16
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# 服务器报告处理耗时 (秒) 的响应头，用于耗时统计
+PROCESS_TIME_HEADER = "X-Process-Time"
+
+# 连续失败多少次后将后端移出轮换
+BACKEND_FAILURE_THRESHOLD = 3
+DEFAULT_HEALTH_CHECK_INTERVAL = 15
+HEALTH_CHECK_TIMEOUT = 5
+# 延迟的指数滑动平均系数
+LATENCY_EWMA_ALPHA = 0.3
+# 长句切分：0 表示不切分
+DEFAULT_SPLIT_MAX_CHARS = 0
+DEFAULT_SPLIT_WORKERS = 4
+
+# 合成方式：infer_single 为 POST /infer_single + GET 下载两步；
+# openai 为 POST /v1/audio/speech，一次请求直接返回音频
+TRANSPORT_INFER_SINGLE = "infer_single"
+TRANSPORT_OPENAI = "openai"
+TRANSPORTS = (TRANSPORT_INFER_SINGLE, TRANSPORT_OPENAI)
+
+# /v1/audio/speech 的 other_params 字段，键为 inference_defaults 中的参数名，值为 otherParams 中的字段名
+OPENAI_OTHER_PARAMS = {
+    "app_key": "app_key", "text_lang": "text_lang", "prompt_text_lang": "prompt_lang", "emotion": "emotion",
+    "top_k": "top_k", "top_p": "top_p", "temperature": "temperature", "text_split_method": "text_split_method",
+    "batch_size": "batch_size", "batch_threshold": "batch_threshold", "split_bucket": "split_bucket",
+    "fragment_interval": "fragment_interval", "parallel_infer": "parallel_infer",
+    "repetition_penalty": "repetition_penalty", "sample_steps": "sample_steps", "if_sr": "if_sr", "seed": "seed",
+}
+
+# /infer_multi 的 content 字段中每行的格式
+DEFAULT_MULTI_LINE_FORMAT = "{model_name}|{emotion}|{text}"
+# inferWithMulti 接受的请求参数 (模型、情感、文本都在 content 中)
+MULTI_PARAM_KEYS = (
+    "app_key", "dl_url", "top_k", "top_p", "temperature", "text_split_method", "batch_size",
+    "batch_threshold", "split_bucket", "fragment_interval", "media_type", "parallel_infer",
+    "repetition_penalty", "seed", "sample_steps", "if_sr",
+)
+
+
+class ConnectionStats:
+    """
+    线程安全的连接复用计数器。
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self.requests = 0
+        self.connections_opened = 0
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def record_new_connection(self):
+        with self._lock:
+            self.connections_opened += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "connections_opened": self.connections_opened,
+                "connections_reused": max(0, self.requests - self.connections_opened),
+            }
+
+
+class _CountingHTTPAdapter(HTTPAdapter):
+    """
+    在 urllib3 连接池新建连接时计数的 HTTPAdapter。
+    """
+
+    def __init__(self, stats: ConnectionStats, **kwargs):
+        self._stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        stats = self._stats
+
+        class CountingHTTPConnectionPool(HTTPConnectionPool):
+            def _new_conn(self):
+                stats.record_new_connection()
+                return super()._new_conn()
+
+        class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+            def _new_conn(self):
+                stats.record_new_connection()
+                return super()._new_conn()
+
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool,
+        }
+
+
+def build_openai_speech_payload(params: dict) -> dict:
+    """
+    将 /infer_single 风格的参数 (inference_defaults + text/model_name/emotion) 转换为
+    /v1/audio/speech (openaiLikeInfer) 的请求体。
+    """
+    return {
+        "model": f"tts-{params.get('version', 'v4')}",
+        "input": params.get("text", ""),
+        "voice": params.get("model_name", ""),
+        "response_format": params.get("media_type", "wav"),
+        "speed": params.get("speed_facter", 1.0),
+        "other_params": {
+            target: params[source] for source, target in OPENAI_OTHER_PARAMS.items() if source in params
+        },
+    }
+
+
+class Backend:
+    """
+    一个 GPT-SoVITS 推理服务实例及其负载/健康统计。
+    字段由 ApiClient 在持有锁时更新。
+    """
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip('/')
+        self.healthy = True
+        self.outstanding = 0
+        self.completed = 0
+        self.failed = 0
+        self.consecutive_failures = 0
+        self.bytes_received = 0
+        self.ewma_latency = None
+        self.last_error = None
+        self.created_at = time.monotonic()
+
+    def load_key(self):
+        """负载排序键：在途请求数优先，其次是最近的平均延迟。"""
+        return (self.outstanding, self.ewma_latency if self.ewma_latency is not None else 0.0)
+
+    def snapshot(self) -> dict:
+        elapsed = max(time.monotonic() - self.created_at, 1e-9)
+        return {
+            "base_url": self.base_url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "completed": self.completed,
+            "failed": self.failed,
+            "bytes_received": self.bytes_received,
+            "avg_latency": round(self.ewma_latency, 3) if self.ewma_latency is not None else None,
+            "throughput_per_min": round(self.completed / elapsed * 60, 2),
+            "last_error": self.last_error,
+        }
+
+
+def is_backend_fault(error: Exception) -> bool:
+    """连接错误、超时和 5xx 视为后端故障；4xx 是请求本身的问题，不影响后端健康状态。"""
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        return error.response.status_code >= 500
+    return True
+
 
 class ApiClient:
     """
     与 GPT-SoVITS API 交互的客户端。
+    内部持有一个带连接池的 requests.Session，可被多个工作线程共享。
+
+    可以配置多个后端 (多个 GPU 上的推理服务实例)：每个请求被路由到在途请求最少、
+    最近延迟最低的健康后端；连续失败的后端会被移出轮换，由后台健康检查 (/version)
+    在其恢复后重新加入。两步合成中的下载请求总是发往执行推理的同一个后端。
+
+    设置 split_max_chars 后，超过该长度的句子在客户端按标点切分，各片段并行合成
+    (多后端时分散到各个后端)，再以 fragment_interval 的间隔拼接为一个 WAV 文件，
+    避免单个超长请求拖慢整批任务或超时。
     """
 
-    def __init__(self, base_url: str, default_params: dict):
+    def __init__(self, base_url: str | list, default_params: dict, pool_size: int = DEFAULT_POOL_SIZE,
+                 multi_line_format: str = DEFAULT_MULTI_LINE_FORMAT, transport: str = TRANSPORT_INFER_SINGLE,
+                 split_max_chars: int = DEFAULT_SPLIT_MAX_CHARS, split_workers: int = DEFAULT_SPLIT_WORKERS,
+                 max_concurrent_requests: int = 0, health_check_interval: float = DEFAULT_HEALTH_CHECK_INTERVAL):
         """
         初始化 API 客户端。
 
-        :param base_url: API 的基础 URL。
+        :param base_url: API 的基础 URL，或多个后端的 URL 列表。
         :param default_params: /infer_single 接口的默认参数字典。
+        :param pool_size: 每个主机保持的最大 keep-alive 连接数，应不小于并发工作线程数。
+        :param multi_line_format: /infer_multi 的 content 中每行的格式，可用 {model_name} {emotion} {text}。
+        :param transport: 合成方式，"infer_single" (默认) 或 "openai" (/v1/audio/speech，一次请求直接返回音频)。
+        :param split_max_chars: 超过该字符数的句子切分后并行合成，0 表示不切分。
+        :param split_workers: 并行合成片段的线程数 (所有句子共享)。
+        :param max_concurrent_requests: 同时发往服务器的请求数上限，超出的请求按优先级排队
+            (交互 > 预取 > 批量，见 request_priority)；0 表示不限制。
+        :param health_check_interval: 多后端时后台健康检查的间隔 (秒)。
         """
-        self.base_url = base_url.rstrip('/')
+        if transport not in TRANSPORTS:
+            raise ValueError(f"未知的合成方式: {transport}，可选: {', '.join(TRANSPORTS)}")
+        self._lock = Lock()
+        self.backends = [Backend(url) for url in ([base_url] if isinstance(base_url, str) else base_url)]
+        if not self.backends:
+            raise ValueError("至少需要配置一个 API 地址")
+        self._health_stop = None
+        self.health_check_interval = float(health_check_interval)
+        self._pins = {}  # model_name -> Backend，同一模型固定发往同一后端
+        self._local = local()  # 每个线程最近一次失败的原因和请求优先级
+        self.scheduler = RequestScheduler(max_concurrent_requests) if max_concurrent_requests else None
         self.default_params = default_params if default_params else {}
+        self.pool_size = max(1, int(pool_size))
+        self.multi_line_format = multi_line_format
+        self.transport = transport
+        self.split_max_chars = max(0, int(split_max_chars))
+        self.split_workers = max(1, int(split_workers))
+        self._split_executor = None
+        self.connection_stats = ConnectionStats()
+
+        self.session = requests.Session()
+        self.session.headers.update({"Connection": "keep-alive"})
+        adapter = _CountingHTTPAdapter(self.connection_stats, pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @classmethod
+    def from_config(cls, api_config: dict, default_params: dict):
+        """
+        根据 config.yaml 中的 api 配置段创建实例。
+        配置了多个后端 (base_urls) 时会启动后台健康检查。
+        """
+        client = cls(
+            base_url=api_config.get('base_urls') or api_config['base_url'],
+            default_params=default_params,
+            pool_size=api_config.get('pool_size', DEFAULT_POOL_SIZE),
+            multi_line_format=api_config.get('multi_line_format', DEFAULT_MULTI_LINE_FORMAT),
+            transport=api_config.get('transport', TRANSPORT_INFER_SINGLE),
+            split_max_chars=api_config.get('split_max_chars', DEFAULT_SPLIT_MAX_CHARS),
+            split_workers=api_config.get('split_workers', DEFAULT_SPLIT_WORKERS),
+            max_concurrent_requests=api_config.get('max_concurrent_requests', 0),
+            health_check_interval=api_config.get('health_check_interval', DEFAULT_HEALTH_CHECK_INTERVAL),
+        )
+        if len(client.backends) > 1:
+            client.start_health_monitor()
+        return client
+
+    @property
+    def base_url(self) -> str:
+        """第一个后端的 URL (单后端时即为唯一的 API 地址)。"""
+        return self.backends[0].base_url
+
+    @base_url.setter
+    def base_url(self, value: str):
+        self.base_urls = [value]
+
+    @property
+    def base_urls(self) -> list:
+        return [backend.base_url for backend in self.backends]
+
+    @base_urls.setter
+    def base_urls(self, values: list):
+        """替换后端列表；多后端时启动后台健康检查，只剩一个后端时停止。"""
+        urls = [url.rstrip('/') for url in values if url]
+        if urls and urls != self.base_urls:
+            with self._lock:
+                self.backends = [Backend(url) for url in urls]
+                self._pins.clear()
+            if len(urls) > 1:
+                self.start_health_monitor()
+            else:
+                self.stop_health_monitor()
+
+    # --- 后端选择与健康检查 ---
+
+    def _select_backend(self, model_name: str | None = None) -> Backend:
+        """
+        在持有锁时调用：选择负载最低的健康后端；全部不健康时仍从全部后端中选择。
+        指定 model_name 时优先使用该模型已固定的后端，首次出现的模型固定到已固定模型最少的后端，
+        避免多个后端反复加载同一个模型。
+        """
+        candidates = [backend for backend in self.backends if backend.healthy] or self.backends
+        if model_name is None or len(self.backends) == 1:
+            return min(candidates, key=Backend.load_key)
+        pinned = self._pins.get(model_name)
+        if pinned is not None and pinned in candidates:
+            return pinned
+        pinned_counts = {id(backend): 0 for backend in candidates}
+        for backend in self._pins.values():
+            if id(backend) in pinned_counts:
+                pinned_counts[id(backend)] += 1
+        backend = min(candidates, key=lambda b: (pinned_counts[id(b)], b.load_key()))
+        self._pins[model_name] = backend
+        return backend
+
+    def healthy_backend_count(self) -> int:
+        with self._lock:
+            return sum(1 for backend in self.backends if backend.healthy)
+
+    def pin_models(self, lane_models: list):
+        """
+        把 lane_models[i] 中的模型固定到第 i 个健康后端 (来自 batch.schedule_jobs_by_model)。
+        """
+        with self._lock:
+            candidates = [backend for backend in self.backends if backend.healthy] or self.backends
+            for i, models in enumerate(lane_models):
+                for model_name in models:
+                    self._pins[model_name] = candidates[i % len(candidates)]
+
+    @contextmanager
+    def request_priority(self, priority: int):
+        """
+        在 with 块内，当前线程发出的请求使用 priority 排队 (见 dubbing_tool.scheduler)。
+        未指定时按批量优先级 (最低) 处理。
+        """
+        previous = self.current_priority()
+        self._local.priority = priority
+        try:
+            yield
+        finally:
+            self._local.priority = previous
+
+    def current_priority(self) -> int:
+        return getattr(self._local, 'priority', PRIORITY_BATCH)
+
+    def get_scheduler_stats(self) -> dict | None:
+        """返回各优先级的排队数、在途数和等待时间 (见 RequestScheduler.get_stats)；未限制并发时返回 None。"""
+        return self.scheduler.get_stats() if self.scheduler else None
+
+    @contextmanager
+    def _use_backend(self, backend: Backend | None = None, model_name: str | None = None):
+        """
+        占用一个后端执行一次操作，并记录其延迟和成败。
+        backend 为 None 时自动选择后端 (选择与计数在同一把锁内完成)，model_name 用于模型亲和；
+        长句片段线程中忽略 model_name，只按负载选择 (见 generate_split_to_file)。
+        设置了并发上限时，先按当前线程的优先级排队获取请求名额。
+        """
+        with self.scheduler.slot(self.current_priority()) if self.scheduler else nullcontext() as waited:
+            if waited:
+                metrics.add_phase(metrics.PHASE_QUEUE_WAIT, waited)
+            with self._lock:
+                if backend is None:
+                    backend = self._select_backend(None if getattr(self._local, 'spread', False) else model_name)
+                    metrics.set_backend(backend.base_url)
+                backend.outstanding += 1
+            start = time.monotonic()
+            try:
+                with metrics.measure_request():
+                    yield backend
+            except requests.exceptions.RequestException as e:
+                self._record_result(backend, e, time.monotonic() - start)
+                raise
+            else:
+                self._record_result(backend, None, time.monotonic() - start)
+            finally:
+                with self._lock:
+                    backend.outstanding -= 1
+
+    def _record_result(self, backend: Backend, error: Exception | None, latency: float):
+        with self._lock:
+            if error is not None and is_backend_fault(error):
+                backend.failed += 1
+                backend.consecutive_failures += 1
+                backend.last_error = str(error)
+                if backend.healthy and backend.consecutive_failures >= BACKEND_FAILURE_THRESHOLD:
+                    backend.healthy = False
+                    print(f"后端 {backend.base_url} 连续失败 {backend.consecutive_failures} 次，已移出轮换。")
+                return
+            backend.completed += 1
+            backend.consecutive_failures = 0
+            if backend.ewma_latency is None:
+                backend.ewma_latency = latency
+            else:
+                backend.ewma_latency += LATENCY_EWMA_ALPHA * (latency - backend.ewma_latency)
+
+    def _backend_for_url(self, url: str) -> Backend:
+        """找到 url 所属的后端；不属于任何已配置后端时 (如服务器返回的 0.0.0.0 地址) 返回第一个后端。"""
+        for backend in self.backends:
+            if url.startswith(backend.base_url + '/'):
+                return backend
+        return self.backends[0]
+
+    def check_health(self) -> dict:
+        """
+        通过 GET /version 探测所有后端，更新其健康状态。
+
+        :return: {base_url: 是否健康}。
+        """
+        results = {}
+        for backend in list(self.backends):
+            try:
+                response = self._request("GET", backend.base_url + "/version", timeout=HEALTH_CHECK_TIMEOUT)
+                response.raise_for_status()
+                healthy = True
+            except requests.exceptions.RequestException as e:
+                healthy = False
+                backend.last_error = str(e)
+            with self._lock:
+                if healthy and not backend.healthy:
+                    print(f"后端 {backend.base_url} 已恢复，重新加入轮换。")
+                    backend.consecutive_failures = 0
+                elif not healthy and backend.healthy:
+                    print(f"后端 {backend.base_url} 健康检查失败，已移出轮换。")
+                backend.healthy = healthy
+            results[backend.base_url] = healthy
+        return results
+
+    def start_health_monitor(self, interval: float | None = None):
+        """启动后台守护线程，每隔 interval 秒 (默认为 health_check_interval) 检查一次所有后端；已在运行时什么也不做。"""
+        if self._health_stop is not None:
+            return
+        interval = self.health_check_interval if interval is None else float(interval)
+        self._health_stop = Event()
+
+        def monitor(stop):
+            while not stop.wait(interval):
+                self.check_health()
+
+        Thread(target=monitor, args=(self._health_stop,), name="api-health", daemon=True).start()
+
+    def stop_health_monitor(self):
+        if self._health_stop is not None:
+            self._health_stop.set()
+            self._health_stop = None
+
+    def get_backend_stats(self) -> list:
+        """
+        返回每个后端的统计：健康状态、在途请求数、完成/失败数、接收字节数、平均延迟和每分钟吞吐量。
+        """
+        with self._lock:
+            return [backend.snapshot() for backend in self.backends]
+
+    @property
+    def two_step(self) -> bool:
+        """当前合成方式是否为先推理、再下载的两步流程 (可用于推理/下载流水线)。"""
+        return self.transport == TRANSPORT_INFER_SINGLE
+
+    def get_connection_stats(self) -> dict:
+        """
+        返回连接复用统计：{'requests', 'connections_opened', 'connections_reused'}。
+        """
+        return self.connection_stats.snapshot()
+
+    def close(self):
+        """停止健康检查并关闭连接池中的所有连接。"""
+        self.stop_health_monitor()
+        if self._split_executor is not None:
+            self._split_executor.shutdown(wait=False)
+            self._split_executor = None
+        self.session.close()
+
+    def _fail(self, message: str, error: Exception | None = None):
+        """打印错误信息，并记录为当前线程最近一次失败的原因 (见 get_last_error)。"""
+        print(message)
+        self._local.last_error = (message, error is None or is_backend_fault(error))
+
+    def get_last_error(self) -> tuple[str, bool] | None:
+        """
+        返回当前线程最近一次生成失败的原因 (message, retryable)。
+        retryable 为 False 表示请求本身有问题 (如 4xx)，重试不会成功。
+        """
+        return getattr(self._local, 'last_error', None)
+
+    def clear_last_error(self):
+        self._local.last_error = None
+
+    def _request(self, method: str, url: str, backend: Backend | None = None, **kwargs) -> requests.Response:
+        self.connection_stats.record_request()
+        response = self.session.request(method, url, **kwargs)
+        if backend is not None:
+            length = response.headers.get("Content-Length")
+            if length and length.isdigit():
+                with self._lock:
+                    backend.bytes_received += int(length)
+        return response
+
+    @staticmethod
+    def _record_server_time(response: requests.Response):
+        """记录服务器处理时间：优先使用 X-Process-Time 响应头，没有时使用收到响应头所用的时间。"""
+        try:
+            seconds = float(response.headers.get(PROCESS_TIME_HEADER, ""))
+        except ValueError:
+            seconds = response.elapsed.total_seconds()
+        metrics.add_phase(metrics.PHASE_SERVER, seconds)
+
+    @staticmethod
+    def _stream_to_file(response: requests.Response, output_path: str, started: float | None = None):
+        """
+        把响应体分块原子写入 output_path，分别记录接收和写盘的耗时。
+
+        :param started: 发出请求的时刻 (time.monotonic())，接收耗时从此时算起；为 None 时从开始读取响应体算起。
+        """
+        start = started if started is not None else time.monotonic()
+        write_time = 0.0
+        received = 0
+        with atomic_open(output_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                write_start = time.monotonic()
+                f.write(chunk)
+                write_time += time.monotonic() - write_start
+                received += len(chunk)
+            write_start = time.monotonic()
+        # 包括临时文件落盘和重命名
+        write_time += time.monotonic() - write_start
+        metrics.add_phase(metrics.PHASE_DOWNLOAD, time.monotonic() - start - write_time)
+        metrics.add_phase(metrics.PHASE_DISK_WRITE, write_time)
+        metrics.add_bytes(received)
 
     def generate_audio(self, text: str, model_name: str, emotion: str, **kwargs) -> bytes | None:
         """
         调用 /infer_single 接口生成音频。
         此方法执行两步操作：
-        1. POST 请求到 /infer_single，获取一个包含音频文件 URL 的 JSON 响应。
-        2. GET 请求该 URL，下载音频数据。
+        1. POST 请求到 /infer_single，获取一个包含音频文件 URL 的 JSON 响应 (request_audio_url)。
+        2. GET 请求该 URL，下载音频数据 (download_audio)。
+        transport 为 "openai" 时改为一次 POST /v1/audio/speech 请求。
 
         :param text: 要转换为语音的文本。
         :param model_name: 使用的声音模型 (对应 'model_name' 参数)。
@@ -29,9 +527,129 @@ class ApiClient:
         :param kwargs: 其他需要覆盖默认值的 API 参数 (如 speed_facter, seed 等)。
         :return: 音频文件的二进制数据，如果失败则返回 None。
         """
-        # --- 步骤 1: POST 请求，获取音频 URL ---
+        if self.transport == TRANSPORT_OPENAI:
+            try:
+                with metrics.measure_request(), self._speech_request(text, model_name, emotion, **kwargs) as response:
+                    return response.content
+            except requests.exceptions.RequestException as e:
+                self._fail(f"调用 /v1/audio/speech 失败: {e}", e)
+                return None
+
+        audio_url = self.request_audio_url(text, model_name, emotion, **kwargs)
+        if not audio_url:
+            return None
+        return self.download_audio(audio_url)
+
+    def generate_audio_to_file(self, output_path: str, text: str, model_name: str, emotion: str, **kwargs) -> bool:
+        """
+        与 generate_audio 相同，但以流式方式将音频直接写入磁盘，不在内存中保留整个文件。
+
+        :param output_path: 音频输出路径。
+        :return: 是否成功。
+        """
+        if self.should_split(text, kwargs.get('media_type')):
+            return self.generate_split_to_file(output_path, text, model_name, emotion, **kwargs)
+        if self.transport == TRANSPORT_OPENAI:
+            return self.speech_to_file(output_path, text, model_name, emotion, **kwargs)
+
+        audio_url = self.request_audio_url(text, model_name, emotion, **kwargs)
+        if not audio_url:
+            return False
+        return self.download_audio_to_file(audio_url, output_path)
+
+    def should_split(self, text: str, media_type: str | None = None) -> bool:
+        """该句是否需要在客户端切分合成 (只支持 WAV 输出)。"""
+        media_type = media_type or self.default_params.get('media_type', 'wav')
+        return bool(self.split_max_chars) and len(text) > self.split_max_chars and media_type == 'wav'
+
+    def generate_split_to_file(self, output_path: str, text: str, model_name: str, emotion: str, **kwargs) -> bool:
+        """
+        把长句按标点切分为不超过 split_max_chars 的片段，并行合成后拼接写入 output_path。
+        片段之间插入 fragment_interval 秒的静音，与服务器端切分的效果一致。
+        任一片段失败时整句失败，不会写出不完整的音频。
+        多后端时各片段不受模型固定的约束，按负载分散到各个后端，而不是全部排在该模型固定的后端上。
+
+        参数同 generate_audio_to_file。
+        :return: 是否成功。
+        """
+        fragments = split_text(text, self.split_max_chars)
+        with self._lock:
+            if self._split_executor is None:
+                self._split_executor = ThreadPoolExecutor(max_workers=self.split_workers, thread_name_prefix="split")
+            executor = self._split_executor
+
+        priority = self.current_priority()
+        trace = metrics.current_trace()
+
+        def synthesize(fragment):
+            # 片段线程沿用调用线程的优先级和耗时记录；失败原因记录在片段线程中，需要带回调用线程
+            self.clear_last_error()
+            self._local.spread = True
+            try:
+                with self.request_priority(priority), metrics.tracing(trace):
+                    return self.generate_audio(fragment, model_name, emotion, **kwargs), self.get_last_error()
+            finally:
+                self._local.spread = False
+
+        results = list(executor.map(synthesize, fragments))
+        for audio_data, error in results:
+            if audio_data is None:
+                self._local.last_error = error if error else ("合成长句片段失败", True)
+                return False
+        try:
+            with metrics.measure(metrics.PHASE_DISK_WRITE):
+                stitch_wav([audio_data for audio_data, _ in results], output_path,
+                           float(kwargs.get('fragment_interval', self.default_params.get('fragment_interval', 0.3))))
+            return True
+        except (ValueError, wave.Error, EOFError) as e:
+            self._fail(f"拼接长句的音频片段失败: {e}")
+            return False
+        except OSError as e:
+            self._fail(f"写入音频文件失败: {e}", e)
+            return False
+
+    def _speech_request(self, text: str, model_name: str, emotion: str, **kwargs) -> requests.Response:
+        """POST /v1/audio/speech 并以流式方式返回响应 (调用者负责关闭)。"""
+        params = {**self.default_params, "text": text, "model_name": model_name, "emotion": emotion, **kwargs}
+        with self._use_backend(model_name=model_name) as backend, metrics.measure(metrics.PHASE_INFER):
+            response = self._request("POST", backend.base_url + "/v1/audio/speech", backend=backend,
+                                     json=build_openai_speech_payload(params), timeout=300, stream=True)
+            try:
+                response.raise_for_status()
+            except requests.exceptions.HTTPError:
+                response.close()
+                raise
+        self._record_server_time(response)
+        return response
+
+    def speech_to_file(self, output_path: str, text: str, model_name: str, emotion: str, **kwargs) -> bool:
+        """
+        通过 OpenAI 兼容的 /v1/audio/speech 接口合成，一次请求直接得到音频，
+        并把响应体流式原子写入 output_path。服务器无需保存生成的文件，也省去一次下载往返。
+
+        参数同 generate_audio。
+        :return: 是否成功。
+        """
+        try:
+            # 响应体在 _use_backend 之外读取，同样计入请求时间
+            with metrics.measure_request(), self._speech_request(text, model_name, emotion, **kwargs) as response:
+                self._stream_to_file(response, output_path)
+            return True
+        except requests.exceptions.RequestException as e:
+            self._fail(f"调用 /v1/audio/speech 失败: {e}", e)
+            return False
+        except OSError as e:
+            self._fail(f"写入音频文件失败: {e}", e)
+            return False
+
+    def request_audio_url(self, text: str, model_name: str, emotion: str, **kwargs) -> str | None:
+        """
+        步骤 1: POST 请求到 /infer_single，返回服务器生成的音频文件 URL。
+
+        参数同 generate_audio。
+        :return: 音频文件的下载 URL (已指向执行推理的后端)，如果失败则返回 None。
+        """
         infer_endpoint = "/infer_single"
-        infer_url = self.base_url + infer_endpoint
 
         payload = self.default_params.copy()
         payload.update({
@@ -41,45 +659,181 @@ class ApiClient:
         })
         payload.update(kwargs)
 
+        infer_response = None
         try:
-            infer_response = requests.post(infer_url, json=payload, timeout=300)
-            infer_response.raise_for_status()
+            with self._use_backend(model_name=model_name) as backend, metrics.measure(metrics.PHASE_INFER):
+                infer_response = self._request("POST", backend.base_url + infer_endpoint, backend=backend, json=payload, timeout=300)
+                infer_response.raise_for_status()
+            self._record_server_time(infer_response)
             response_json = infer_response.json()
 
             audio_url_from_server = response_json.get("audio_url")
             if not audio_url_from_server:
-                print(f"API 未返回 audio_url。响应: {response_json}")
+                self._fail(f"API 未返回 audio_url。响应: {response_json}")
                 return None
+            # 文件保存在执行推理的后端上，下载也必须发往同一个后端
+            return self.resolve_download_url(audio_url_from_server, backend)
 
         except requests.exceptions.RequestException as e:
-            print(f"调用推理 API 失败: {e}")
-            try:
-                error_details = infer_response.json()
-                print(f"错误详情: {error_details}")
-            except (ValueError, AttributeError):
-                 print(f"无法解析错误响应: {infer_response.text}")
+            message = f"调用推理 API 失败: {e}"
+            if infer_response is not None:
+                try:
+                    message += f"\n错误详情: {infer_response.json()}"
+                except ValueError:
+                    message += f"\n无法解析错误响应: {infer_response.text}"
+            self._fail(message, e)
             return None
         except ValueError: # JSONDecodeError
-            print(f"无法解析 API 响应为 JSON。响应内容: {infer_response.text}")
+            self._fail(f"无法解析 API 响应为 JSON。响应内容: {infer_response.text}")
             return None
 
-        # --- 步骤 2: GET 请求，下载音频文件 ---
+    def resolve_download_url(self, audio_url: str, backend: Backend | None = None) -> str:
+        """
+        服务器可能返回一个非外部可访问的 URL (如 http://0.0.0.0:8000/...)，
+        提取其路径，并与我们配置的后端 base_url 结合。
+
+        :param backend: 生成该文件的后端；为 None 时根据 URL 推断。
+        """
+        if backend is None:
+            backend = self._backend_for_url(audio_url)
+        audio_path = urlparse(audio_url).path
+        return urljoin(backend.base_url, audio_path)
+
+    def download_audio(self, audio_url: str) -> bytes | None:
+        """
+        步骤 2: GET 请求音频 URL，下载音频数据。
+
+        :param audio_url: request_audio_url 返回的 URL。
+        :return: 音频文件的二进制数据，如果失败则返回 None。
+        """
         try:
-            # 服务器可能返回一个非外部可访问的 URL (如 http://0.0.0.0:8000/...)
-            # 我们需要提取其路径，并与我们配置的 base_url 结合。
-            parsed_url = urlparse(audio_url_from_server)
-            audio_path = parsed_url.path
-            
-            download_url = urljoin(self.base_url, audio_path)
-
-            audio_response = requests.get(download_url, timeout=120)
-            audio_response.raise_for_status()
-            
+            download_url = self.resolve_download_url(audio_url)
+
+            with self._use_backend(self._backend_for_url(download_url)) as backend, metrics.measure(metrics.PHASE_DOWNLOAD):
+                audio_response = self._request("GET", download_url, backend=backend, timeout=120)
+                audio_response.raise_for_status()
+            metrics.add_bytes(len(audio_response.content))
             return audio_response.content
 
         except requests.exceptions.RequestException as e:
-            print(f"下载音频文件失败: {e}")
+            self._fail(f"下载音频文件失败: {e}", e)
             return None
         except Exception as e:
-            print(f"处理音频时发生未知错误: {e}")
-            return None 
\ No newline at end of file
+            self._fail(f"处理音频时发生未知错误: {e}", e)
+            return None
+
+    def download_audio_to_file(self, audio_url: str, output_path: str) -> bool:
+        """
+        步骤 2 (流式): 分块下载音频并写入目标目录下的临时文件，完成后原子重命名为 output_path。
+        下载失败或中断时不会在 output_path 留下被截断的文件。
+
+        :param audio_url: request_audio_url 返回的 URL。
+        :param output_path: 音频输出路径。
+        :return: 是否成功。
+        """
+        try:
+            download_url = self.resolve_download_url(audio_url)
+
+            with self._use_backend(self._backend_for_url(download_url)) as backend:
+                started = time.monotonic()
+                with self._request("GET", download_url, backend=backend, timeout=120, stream=True) as audio_response:
+                    audio_response.raise_for_status()
+                    self._stream_to_file(audio_response, output_path, started)
+            return True
+
+        except requests.exceptions.RequestException as e:
+            self._fail(f"下载音频文件失败: {e}", e)
+            return False
+        except OSError as e:
+            self._fail(f"写入音频文件失败: {e}", e)
+            return False
+
+    def generate_multi_to_files(self, lines: list, output_paths: list, **kwargs) -> list | None:
+        """
+        调用 /infer_multi 接口一次合成多句对话，并把结果逐句写入对应的文件。
+
+        服务器的返回结果按以下顺序尝试解析：
+        1. 与输入行数相同的 URL 列表 ("audio_urls"，或 "results" 中每项的 "audio_url")；
+        2. 单个 "audio_url"，指向一个按顺序包含每句音频的 zip 压缩包。
+        无法与输入逐行对应时视为失败，由调用者退回逐句合成。
+
+        :param lines: 每句的 {'text', 'model_name', 'emotion'} 字典列表。
+        :param output_paths: 与 lines 一一对应的输出路径。
+        :param kwargs: 推理参数，只会发送 inferWithMulti 支持的字段。
+        :return: 每句是否写入成功的列表；整个请求失败或结果无法对应时返回 None。
+        """
+        params = {k: v for k, v in {**self.default_params, **kwargs}.items() if k in MULTI_PARAM_KEYS}
+        try:
+            content = "\n".join(self.multi_line_format.format(**line) for line in lines)
+        except (KeyError, IndexError, ValueError) as e:
+            self._fail(f"multi_line_format 格式有误，无法构建 /infer_multi 请求: {e!r}")
+            return None
+        payload = {**params, "content": content}
+
+        infer_response = None
+        try:
+            with self._use_backend(model_name=lines[0].get("model_name")) as backend, metrics.measure(metrics.PHASE_INFER):
+                infer_response = self._request("POST", backend.base_url + "/infer_multi", backend=backend,
+                                               json=payload, timeout=300 * len(lines))
+                infer_response.raise_for_status()
+            self._record_server_time(infer_response)
+            response_json = infer_response.json()
+        except requests.exceptions.RequestException as e:
+            self._fail(f"调用 /infer_multi 失败: {e}", e)
+            return None
+        except ValueError:
+            self._fail(f"无法解析 /infer_multi 响应为 JSON。响应内容: {infer_response.text}")
+            return None
+
+        audio_urls = self._parse_multi_urls(response_json)
+        if audio_urls is not None and len(audio_urls) == len(lines):
+            return [self.download_audio_to_file(self.resolve_download_url(url, backend), path)
+                    for url, path in zip(audio_urls, output_paths)]
+
+        audio_url = response_json.get("audio_url") if isinstance(response_json, dict) else None
+        if audio_url:
+            return self._extract_multi_archive(self.resolve_download_url(audio_url, backend), output_paths)
+
+        self._fail(f"/infer_multi 返回的结果无法与输入逐句对应。响应: {response_json}")
+        return None
+
+    @staticmethod
+    def _parse_multi_urls(response_json) -> list | None:
+        if isinstance(response_json, list):
+            items = response_json
+        elif isinstance(response_json, dict) and isinstance(response_json.get("audio_urls"), list):
+            items = response_json["audio_urls"]
+        elif isinstance(response_json, dict) and isinstance(response_json.get("results"), list):
+            items = response_json["results"]
+        else:
+            return None
+        urls = [item.get("audio_url") if isinstance(item, dict) else item for item in items]
+        return urls if all(isinstance(url, str) and url for url in urls) else None
+
+    def _extract_multi_archive(self, audio_url: str, output_paths: list) -> list | None:
+        audio_data = self.download_audio(audio_url)
+        if not audio_data:
+            return None
+        if not zipfile.is_zipfile(io.BytesIO(audio_data)):
+            self._fail("/infer_multi 只返回了一个音频文件，无法拆分为逐句结果。")
+            return None
+
+        with zipfile.ZipFile(io.BytesIO(audio_data)) as archive:
+            # 按文件名中的数字自然排序 (1, 2, 10 而不是 1, 10, 2)
+            natural_key = lambda name: [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+            members = sorted((info.filename for info in archive.infolist() if not info.is_dir()), key=natural_key)
+            if len(members) != len(output_paths):
+                self._fail(f"/infer_multi 压缩包中有 {len(members)} 个文件，与请求的 {len(output_paths)} 句不符。")
+                return None
+            results = []
+            for member, output_path in zip(members, output_paths):
+                try:
+                    with metrics.measure(metrics.PHASE_DISK_WRITE), archive.open(member) as src, \
+                            atomic_open(output_path, 'wb') as dst:
+                        while chunk := src.read(DOWNLOAD_CHUNK_SIZE):
+                            dst.write(chunk)
+                    results.append(True)
+                except (OSError, zipfile.BadZipFile) as e:
+                    self._fail(f"写入音频文件 {os.path.basename(output_path)} 失败: {e}", e)
+                    results.append(False)
+            return results
@@ -0,0 +1,687 @@
+import asyncio
+import aiohttp
+import os
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from contextvars import ContextVar
+from functools import partial
+from threading import Thread
+from dubbing_tool.api_client import (DOWNLOAD_CHUNK_SIZE, PROCESS_TIME_HEADER, TRANSPORT_OPENAI,
+                                     build_openai_speech_payload)
+from dubbing_tool.audio import split_text, stitch_wav
+from dubbing_tool.batch import save_audio_metadata
+from dubbing_tool.scheduler import PRIORITY_BATCH
+from dubbing_tool import metrics
+from dubbing_tool.utils import atomic_open
+
+DEFAULT_MAX_CONCURRENCY = 64
+DEFAULT_IO_WORKERS = 4
+DEFAULT_INFER_TIMEOUT = 300
+DEFAULT_DOWNLOAD_TIMEOUT = 120
+DEFAULT_REQUEST_TIMEOUT = 30
+
+# 以下状态按协程任务区分 (asyncio 为每个任务复制一份上下文)，作用同 ApiClient 中的线程局部变量
+_priority = ContextVar('async_request_priority', default=PRIORITY_BATCH)
+_last_error = ContextVar('async_last_error', default=None)
+_deadline = ContextVar('async_deadline', default=None)  # time.monotonic() 时刻
+_spread = ContextVar('async_spread', default=False)  # 长句片段：忽略模型固定，只按负载选择后端
+
+
+def is_backend_fault(error: Exception) -> bool:
+    """同 api_client.is_backend_fault：连接错误、超时和 5xx 视为后端故障；4xx 不影响后端健康状态。"""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status >= 500
+    return True
+
+
+class AsyncApiClient:
+    """
+    ApiClient 的 asyncio 版本，基于 aiohttp，openapi.json 中的接口均为协程。
+
+    与一个 ApiClient 共享后端列表 (负载均衡、模型固定和健康状态)、默认参数、合成方式和请求调度器：
+    协程中的请求与界面、预取和线程中的请求在同一个优先级队列中排队 (RequestScheduler.async_slot)，
+    延迟和成败也记录在同一组后端上。同时在途的请求数另由信号量限制，每个请求都有截止时间。
+    单个事件循环 (见 BackgroundEventLoop) 即可保持数百个请求在途，无需为每个请求占用一个系统线程。
+
+    音频以流式方式原子写入磁盘 (utils.atomic_open)，打开、写入和重命名都在 io 线程池中执行，不阻塞事件循环。
+    失败时打印错误并返回 None/False，原因可由 get_last_error() 取得 (每个协程任务各自独立)。
+    """
+
+    def __init__(self, api_client, max_concurrency: int = DEFAULT_MAX_CONCURRENCY, io_workers: int = DEFAULT_IO_WORKERS):
+        """
+        :param api_client: 共享后端和调度器的 ApiClient 实例。
+        :param max_concurrency: 同时在途的最大请求数。
+        :param io_workers: 执行写盘等阻塞操作的线程数。
+        """
+        self.api_client = api_client
+        self.max_concurrency = max(1, int(max_concurrency))
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._io_executor = ThreadPoolExecutor(max_workers=max(1, int(io_workers)), thread_name_prefix="async-io")
+        self._session = None
+
+    @property
+    def default_params(self) -> dict:
+        return self.api_client.default_params
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # ClientSession 必须在事件循环内创建
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def close(self):
+        """关闭底层的 aiohttp 会话和 io 线程池 (共享的 ApiClient 由调用者关闭)。"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._io_executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def run_io(self, func, *args, **kwargs):
+        """在 io 线程池中执行一个阻塞操作 (写盘、SQLite 等) 并等待其结果。"""
+        return await asyncio.get_running_loop().run_in_executor(self._io_executor, partial(func, *args, **kwargs))
+
+    # --- 优先级、截止时间与错误 ---
+
+    @staticmethod
+    @contextmanager
+    def request_priority(priority: int):
+        """在 with 块内，当前协程任务发出的请求使用 priority 排队 (见 dubbing_tool.scheduler)。"""
+        token = _priority.set(priority)
+        try:
+            yield
+        finally:
+            _priority.reset(token)
+
+    @staticmethod
+    @contextmanager
+    def _within(deadline: float | None):
+        """在 with 块内的请求必须在 deadline 秒内完成 (与外层的截止时间取较早者)。"""
+        if deadline is None:
+            yield
+            return
+        until = time.monotonic() + deadline
+        outer = _deadline.get()
+        token = _deadline.set(until if outer is None else min(outer, until))
+        try:
+            yield
+        finally:
+            _deadline.reset(token)
+
+    @staticmethod
+    def _timeout(default: float) -> aiohttp.ClientTimeout:
+        """单个请求的超时：默认值与剩余截止时间取较小者；已超过截止时间时直接超时。"""
+        deadline = _deadline.get()
+        if deadline is None:
+            return aiohttp.ClientTimeout(total=default)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise asyncio.TimeoutError()
+        return aiohttp.ClientTimeout(total=min(default, remaining))
+
+    def _fail(self, message: str, error: Exception | None = None):
+        """打印错误信息，并记录为当前协程任务最近一次失败的原因 (见 get_last_error)。"""
+        print(message)
+        _last_error.set((message, error is None or is_backend_fault(error)))
+
+    @staticmethod
+    def get_last_error() -> tuple[str, bool] | None:
+        """返回当前协程任务最近一次失败的原因 (message, retryable)，含义同 ApiClient.get_last_error。"""
+        return _last_error.get()
+
+    @staticmethod
+    def clear_last_error():
+        _last_error.set(None)
+
+    @staticmethod
+    def _describe(error: Exception) -> str:
+        return "超时 (超过截止时间)" if isinstance(error, asyncio.TimeoutError) else str(error)
+
+    # --- 后端与请求 ---
+
+    @asynccontextmanager
+    async def _use_backend(self, backend=None, model_name: str | None = None):
+        """
+        同 ApiClient._use_backend：按当前任务的优先级获取请求名额，占用一个后端执行一次操作，
+        并把延迟和成败记入共享的后端统计。
+        """
+        client = self.api_client
+        scheduler = client.scheduler
+        # 先受本客户端的信号量限制，再排队获取全局名额，避免占着名额等待信号量
+        async with self._semaphore, scheduler.async_slot(_priority.get()) if scheduler else nullcontext() as waited:
+            if waited:
+                metrics.add_phase(metrics.PHASE_QUEUE_WAIT, waited)
+            with client._lock:
+                if backend is None:
+                    backend = client._select_backend(None if _spread.get() else model_name)
+                    metrics.set_backend(backend.base_url)
+                backend.outstanding += 1
+            start = time.monotonic()
+            try:
+                with metrics.measure_request():
+                    yield backend
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                client._record_result(backend, e if is_backend_fault(e) else None, time.monotonic() - start)
+                raise
+            else:
+                client._record_result(backend, None, time.monotonic() - start)
+            finally:
+                with client._lock:
+                    backend.outstanding -= 1
+
+    @asynccontextmanager
+    async def _request(self, method: str, url: str, backend=None, timeout: float = DEFAULT_REQUEST_TIMEOUT, **kwargs):
+        """发送一个请求，非 2xx 时抛出 ClientResponseError；with 块内可读取响应体。"""
+        async with self._get_session().request(method, url, timeout=self._timeout(timeout), **kwargs) as response:
+            if backend is not None and response.content_length:
+                with self.api_client._lock:
+                    backend.bytes_received += response.content_length
+            response.raise_for_status()
+            yield response
+
+    @staticmethod
+    def _record_server_time(response: aiohttp.ClientResponse, started: float):
+        """记录服务器处理时间：优先使用 X-Process-Time 响应头，没有时使用收到响应头所用的时间。"""
+        try:
+            seconds = float(response.headers.get(PROCESS_TIME_HEADER, ""))
+        except ValueError:
+            seconds = time.monotonic() - started
+        metrics.add_phase(metrics.PHASE_SERVER, seconds)
+
+    async def _stream_to_file(self, response: aiohttp.ClientResponse, output_path: str, started: float | None = None):
+        """
+        把响应体分块原子写入 output_path，打开、写入和重命名都在 io 线程池中执行。
+        中途失败或被取消时删除临时文件，output_path 上不会出现被截断的文件。
+
+        :param started: 发出请求的时刻 (time.monotonic())，接收耗时从此时算起。
+        """
+        start = started if started is not None else time.monotonic()
+        write_time = 0.0
+        received = 0
+        writer = atomic_open(output_path, 'wb')
+        f = await self.run_io(writer.__enter__)
+        try:
+            async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                write_start = time.monotonic()
+                await self.run_io(f.write, chunk)
+                write_time += time.monotonic() - write_start
+                received += len(chunk)
+        except BaseException as e:
+            await self.run_io(writer.__exit__, type(e), e, e.__traceback__)
+            raise
+        write_start = time.monotonic()
+        # 包括临时文件落盘和重命名
+        await self.run_io(writer.__exit__, None, None, None)
+        write_time += time.monotonic() - write_start
+        metrics.add_phase(metrics.PHASE_DOWNLOAD, time.monotonic() - start - write_time)
+        metrics.add_phase(metrics.PHASE_DISK_WRITE, write_time)
+        metrics.add_bytes(received)
+
+    async def _call(self, method: str, endpoint: str, timeout: float = DEFAULT_REQUEST_TIMEOUT, expect: str = "json", **kwargs):
+        """
+        调用一个服务信息或模型管理接口 (发往负载最低的后端)，失败时打印错误并返回 None。
+
+        :param expect: "json" 返回解析后的 JSON，"bytes" 返回响应体。
+        """
+        try:
+            async with self._use_backend() as backend, \
+                    self._request(method, backend.base_url + endpoint, backend=backend, timeout=timeout, **kwargs) as response:
+                if expect == "bytes":
+                    return await response.read()
+                return await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self._fail(f"调用 {endpoint} 失败: {self._describe(e)}", e)
+            return None
+        except ValueError as e:
+            self._fail(f"无法解析 {endpoint} 的响应: {e}")
+            return None
+
+    # --- 推理 ---
+
+    async def generate_audio(self, text: str, model_name: str, emotion: str, deadline: float | None = None, **kwargs) -> bytes | None:
+        """
+        生成音频并返回其数据：POST /infer_single 后下载音频 (transport 为 "openai" 时为一次 POST /v1/audio/speech)。
+
+        :param text: 要转换为语音的文本。
+        :param model_name: 使用的声音模型。
+        :param emotion: 对话情感。
+        :param deadline: 整个生成 (排队、推理和下载) 的截止时间 (秒)，为 None 时仅使用各请求的默认超时。
+        :param kwargs: 其他需要覆盖默认值的 API 参数。
+        :return: 音频文件的二进制数据，如果失败则返回 None。
+        """
+        with self._within(deadline):
+            if self.api_client.transport == TRANSPORT_OPENAI:
+                try:
+                    async with self._speech_request(text, model_name, emotion, **kwargs) as response:
+                        return await response.read()
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    self._fail(f"调用 /v1/audio/speech 失败: {self._describe(e)}", e)
+                    return None
+
+            audio_url = await self.request_audio_url(text, model_name, emotion, **kwargs)
+            if not audio_url:
+                return None
+            return await self.download_audio(audio_url)
+
+    async def generate_audio_to_file(self, output_path: str, text: str, model_name: str, emotion: str,
+                                     deadline: float | None = None, **kwargs) -> bool:
+        """
+        与 generate_audio 相同，但以流式方式将音频原子写入 output_path，不在内存中保留整个文件。
+        超过 ApiClient.split_max_chars 的长句切分后并行合成 (见 generate_split_to_file)。
+
+        :param output_path: 音频输出路径。
+        :return: 是否成功。
+        """
+        with self._within(deadline):
+            if self.api_client.should_split(text, kwargs.get('media_type')):
+                return await self.generate_split_to_file(output_path, text, model_name, emotion, **kwargs)
+            if self.api_client.transport == TRANSPORT_OPENAI:
+                return await self.speech_to_file(output_path, text, model_name, emotion, **kwargs)
+
+            audio_url = await self.request_audio_url(text, model_name, emotion, **kwargs)
+            if not audio_url:
+                return False
+            return await self.download_audio_to_file(audio_url, output_path)
+
+    async def generate_split_to_file(self, output_path: str, text: str, model_name: str, emotion: str, **kwargs) -> bool:
+        """
+        同 ApiClient.generate_split_to_file：长句按标点切分后各片段并发合成 (按负载分散到各个后端)，
+        在 io 线程池中拼接写入 output_path。任一片段失败时整句失败。
+        """
+        fragments = split_text(text, self.api_client.split_max_chars)
+
+        async def synthesize(fragment):
+            # 每个片段在各自的任务中运行，失败原因需要带回调用者的任务
+            _spread.set(True)
+            return await self.generate_audio(fragment, model_name, emotion, **kwargs), self.get_last_error()
+
+        results = await asyncio.gather(*(synthesize(fragment) for fragment in fragments))
+        for audio_data, error in results:
+            if audio_data is None:
+                _last_error.set(error if error else ("合成长句片段失败", True))
+                return False
+        interval = float(kwargs.get('fragment_interval', self.default_params.get('fragment_interval', 0.3)))
+        try:
+            with metrics.measure(metrics.PHASE_DISK_WRITE):
+                await self.run_io(stitch_wav, [audio_data for audio_data, _ in results], output_path, interval)
+            return True
+        except (ValueError, wave.Error, EOFError) as e:
+            self._fail(f"拼接长句的音频片段失败: {e}")
+            return False
+        except OSError as e:
+            self._fail(f"写入音频文件失败: {e}", e)
+            return False
+
+    @asynccontextmanager
+    async def _speech_request(self, text: str, model_name: str, emotion: str, **kwargs):
+        """POST /v1/audio/speech，with 块内读取响应体 (同样计入请求时间)。"""
+        params = {**self.default_params, "text": text, "model_name": model_name, "emotion": emotion, **kwargs}
+        async with self._use_backend(model_name=model_name) as backend:
+            started = time.monotonic()
+            async with self._request("POST", backend.base_url + "/v1/audio/speech", backend=backend,
+                                     timeout=DEFAULT_INFER_TIMEOUT, json=build_openai_speech_payload(params)) as response:
+                metrics.add_phase(metrics.PHASE_INFER, time.monotonic() - started)
+                self._record_server_time(response, started)
+                yield response
+
+    async def speech_to_file(self, output_path: str, text: str, model_name: str, emotion: str, **kwargs) -> bool:
+        """通过 /v1/audio/speech 合成，并把响应体流式原子写入 output_path。参数同 generate_audio。"""
+        try:
+            async with self._speech_request(text, model_name, emotion, **kwargs) as response:
+                await self._stream_to_file(response, output_path)
+            return True
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self._fail(f"调用 /v1/audio/speech 失败: {self._describe(e)}", e)
+            return False
+        except OSError as e:
+            self._fail(f"写入音频文件失败: {e}", e)
+            return False
+
+    async def request_audio_url(self, text: str, model_name: str, emotion: str, **kwargs) -> str | None:
+        """
+        POST /infer_single，返回服务器生成的音频文件 URL (已指向执行推理的后端)，如果失败则返回 None。
+        """
+        payload = self.default_params.copy()
+        payload.update({
+            "text": text,
+            "model_name": model_name,
+            "emotion": emotion,
+        })
+        payload.update(kwargs)
+
+        try:
+            async with self._use_backend(model_name=model_name) as backend:
+                started = time.monotonic()
+                with metrics.measure(metrics.PHASE_INFER):
+                    async with self._request("POST", backend.base_url + "/infer_single", backend=backend,
+                                             timeout=DEFAULT_INFER_TIMEOUT, json=payload) as response:
+                        self._record_server_time(response, started)
+                        response_json = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self._fail(f"调用推理 API 失败: {self._describe(e)}", e)
+            return None
+        except ValueError as e:
+            self._fail(f"无法解析 API 响应为 JSON: {e}")
+            return None
+
+        audio_url = response_json.get("audio_url") if isinstance(response_json, dict) else None
+        if not audio_url:
+            self._fail(f"API 未返回 audio_url。响应: {response_json}")
+            return None
+        # 文件保存在执行推理的后端上，下载也必须发往同一个后端
+        return self.api_client.resolve_download_url(audio_url, backend)
+
+    async def download_audio(self, audio_url: str) -> bytes | None:
+        """下载音频数据，如果失败则返回 None。"""
+        download_url = self.api_client.resolve_download_url(audio_url)
+        try:
+            async with self._use_backend(self.api_client._backend_for_url(download_url)) as backend:
+                with metrics.measure(metrics.PHASE_DOWNLOAD):
+                    async with self._request("GET", download_url, backend=backend, timeout=DEFAULT_DOWNLOAD_TIMEOUT) as response:
+                        audio_data = await response.read()
+            metrics.add_bytes(len(audio_data))
+            return audio_data
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self._fail(f"下载音频文件失败: {self._describe(e)}", e)
+            return None
+
+    async def download_audio_to_file(self, audio_url: str, output_path: str) -> bool:
+        """分块下载音频并原子写入 output_path (见 _stream_to_file)，返回是否成功。"""
+        download_url = self.api_client.resolve_download_url(audio_url)
+        try:
+            async with self._use_backend(self.api_client._backend_for_url(download_url)) as backend:
+                started = time.monotonic()
+                async with self._request("GET", download_url, backend=backend, timeout=DEFAULT_DOWNLOAD_TIMEOUT) as response:
+                    await self._stream_to_file(response, output_path, started)
+            return True
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self._fail(f"下载音频文件失败: {self._describe(e)}", e)
+            return False
+        except OSError as e:
+            self._fail(f"写入音频文件失败: {e}", e)
+            return False
+
+    async def infer_multi(self, content: str, **kwargs) -> dict | None:
+        """POST /infer_multi (inferWithMulti)。"""
+        payload = {"content": content, **kwargs}
+        return await self._call("POST", "/infer_multi", timeout=DEFAULT_INFER_TIMEOUT, json=payload)
+
+    async def infer_classic(self, **params) -> dict | None:
+        """POST /infer_classic (inferWithClassic)。"""
+        return await self._call("POST", "/infer_classic", timeout=DEFAULT_INFER_TIMEOUT, json=params)
+
+    async def openai_speech(self, model: str, input: str, voice: str, response_format: str = "wav",
+                            speed: float = 1.0, other_params: dict | None = None) -> bytes | None:
+        """POST /v1/audio/speech (openaiLikeInfer)，直接返回音频数据。"""
+        payload = {
+            "model": model,
+            "input": input,
+            "voice": voice,
+            "response_format": response_format,
+            "speed": speed,
+            "other_params": other_params if other_params else {},
+        }
+        return await self._call("POST", "/v1/audio/speech", timeout=DEFAULT_INFER_TIMEOUT, expect="bytes", json=payload)
+
+    # --- 服务信息与模型管理 ---
+
+    async def get_api_info(self) -> dict | None:
+        """GET /api"""
+        return await self._call("GET", "/api")
+
+    async def get_version(self) -> dict | None:
+        """GET /version"""
+        return await self._call("GET", "/version")
+
+    async def get_template(self, version: str) -> dict | None:
+        """POST /template"""
+        return await self._call("POST", "/template", json={"version": version})
+
+    async def get_models(self, version: str) -> dict | None:
+        """POST /models"""
+        return await self._call("POST", "/models", json={"version": version})
+
+    async def get_classic_model_list(self, version: str) -> dict | None:
+        """POST /classic_model_list"""
+        return await self._call("POST", "/classic_model_list", json={"version": version})
+
+    async def check_model(self, model_name: str, version: str = "v4", category: str = "", language: str = "") -> dict | None:
+        """POST /check_model"""
+        payload = {"version": version, "category": category, "language": language, "model_name": model_name}
+        return await self._call("POST", "/check_model", json=payload)
+
+    async def install_model(self, model_name: str, dl_url: str, version: str = "v4", category: str = "", language: str = "") -> dict | None:
+        """POST /install_model"""
+        payload = {"version": version, "category": category, "language": language, "model_name": model_name, "dl_url": dl_url}
+        return await self._call("POST", "/install_model", timeout=DEFAULT_INFER_TIMEOUT, json=payload)
+
+    async def delete_model(self, model_name: str, version: str = "v4", category: str = "", language: str = "") -> dict | None:
+        """POST /delete_model"""
+        payload = {"version": version, "category": category, "language": language, "model_name": model_name}
+        return await self._call("POST", "/delete_model", json=payload)
+
+    async def upload(self, file_path: str) -> dict | None:
+        """POST /upload (multipart/form-data)，文件在 io 线程池中读取。"""
+        try:
+            data = await self.run_io(lambda: open(file_path, 'rb').read())
+        except OSError as e:
+            self._fail(f"读取文件 {file_path} 失败: {e}", e)
+            return None
+        form = aiohttp.FormData()
+        form.add_field("file", data, filename=os.path.basename(file_path))
+        return await self._call("POST", "/upload", timeout=DEFAULT_DOWNLOAD_TIMEOUT, data=form)
+
+    async def shutdown(self, password: str) -> dict | None:
+        """POST /shutdown"""
+        return await self._call("POST", "/shutdown", json={"password": password})
+
+
+class AsyncBatchRunner:
+    """
+    用 AsyncApiClient 在一个事件循环中执行批量任务，代替 BatchGenerator 的线程池：
+    同时进行的任务数为 concurrency，而不是每条任务占用一个工作线程。
+
+    重试、熔断、缓存、任务日志、输出索引、后处理和耗时统计都沿用 generator (BatchGenerator) 的配置和状态，
+    run/cancel 的用法和返回的统计也与 BatchGenerator 相同。会阻塞的操作 (缓存、写元数据、SQLite 日志、
+    后处理) 在 AsyncApiClient 的 io 线程池中执行。不使用 /infer_multi 合并请求和推理/下载流水线：
+    协程之间本来就会让推理与下载重叠。
+    """
+
+    def __init__(self, generator, client: AsyncApiClient, event_loop: 'BackgroundEventLoop', concurrency: int):
+        """
+        :param generator: 提供配置和状态的 BatchGenerator。
+        :param client: 与 generator.api_client 共享后端的 AsyncApiClient。
+        :param event_loop: 运行任务的 BackgroundEventLoop。
+        :param concurrency: 同时进行的任务数。
+        """
+        self.generator = generator
+        self.client = client
+        self.event_loop = event_loop
+        self.concurrency = max(1, int(concurrency))
+
+    @property
+    def max_workers(self) -> int:
+        return self.concurrency
+
+    @property
+    def cancelled(self) -> bool:
+        return self.generator.cancelled
+
+    def cancel(self):
+        """请求取消：尚未开始的任务将被跳过，正在进行的请求会执行完毕。"""
+        self.generator.cancel()
+
+    def run(self, jobs, on_progress=None) -> dict:
+        """
+        阻塞执行所有任务 (不可在事件循环线程内调用)，参数和返回值同 BatchGenerator.run；
+        on_progress 在事件循环线程中调用。
+        """
+        return self.event_loop.run(self.run_async(jobs, on_progress))
+
+    async def run_async(self, jobs, on_progress=None) -> dict:
+        """run 的协程版本。"""
+        generator = self.generator
+        stats = {'total': 0, 'succeeded': 0, 'failed': 0, 'cancelled': False}
+        generator._retries = 0
+        jobs = generator._schedule(jobs, stats)
+        total = len(jobs) if hasattr(jobs, '__len__') else None
+        iterator = iter(jobs)
+        # jobs 可能是边读剧本边产生任务的生成器，在 io 线程中逐个取出，同一时间只有一个任务在取
+        next_lock = asyncio.Lock()
+
+        async def report(job, success):
+            if generator.metrics:
+                # 记录时会读取音频时长
+                await self.client.run_io(generator.metrics.record, job.dialogue_info, job.params, job.output_path,
+                                         job.trace, success)
+            stats['succeeded' if success else 'failed'] += 1
+            if on_progress:
+                on_progress(job, success, stats['succeeded'] + stats['failed'], total)
+
+        async def worker():
+            while not generator.cancelled:
+                async with next_lock:
+                    job = await self.client.run_io(next, iterator, None)
+                if job is None:
+                    return
+                stats['total'] += 1
+                try:
+                    success = await self._run_job(job)
+                except Exception as e:
+                    print(f"批量生成 '{job.dialogue_info.get('text', '')[:15]}' 时发生错误: {e}")
+                    success = False
+                if success is not None:
+                    await report(job, success)
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+
+        stats['cancelled'] = generator.cancelled
+        stats['retries'] = generator._retries
+        stats['breaker_trips'] = generator.breaker.trips
+        if generator.manifest:
+            await self.client.run_io(generator.manifest.save)
+        return stats
+
+    async def _run_job(self, job) -> bool | None:
+        """执行单条任务 (失败时重试)；返回 None 表示因取消而跳过。"""
+        generator = self.generator
+        if generator.cancelled:
+            return None
+        success = await self._attempt(job)
+        if not success:
+            return success
+        try:
+            await self.client.run_io(save_audio_metadata, job.output_path, job.params, job.signature)
+        except OSError as e:
+            print(f"写入元数据 '{job.dialogue_info.get('text', '')[:15]}' 失败: {e}")
+            return False
+        await self.client.run_io(generator._finish_job, job)
+        return True
+
+    async def _generate(self, job) -> bool:
+        cache = self.generator.cache
+        if not cache:
+            return await self.client.generate_audio_to_file(job.output_path, **job.params)
+        # 不等待正在生成的相同请求：等待会占住 io 线程，而那个请求写盘也需要 io 线程。
+        # 此时 key 为 None，自行生成且不存入缓存
+        hit, key = await self.client.run_io(cache.acquire, job.params, job.output_path, wait=False)
+        if hit:
+            return True
+        success = False
+        try:
+            success = await self.client.generate_audio_to_file(job.output_path, **job.params)
+            return success
+        finally:
+            await self.client.run_io(cache.release, key, success, job.output_path)
+
+    async def _sleep(self, delay: float) -> bool:
+        """等待 delay 秒；期间批量被取消时提前返回 False。"""
+        until = time.monotonic() + delay
+        while not self.generator.cancelled:
+            remaining = until - time.monotonic()
+            if remaining <= 0:
+                return True
+            await asyncio.sleep(min(remaining, 0.5))
+        return False
+
+    async def _attempt(self, job):
+        """同 BatchGenerator._attempt：失败时按指数退避重试，熔断期间等待，并在日志中记录每次尝试。"""
+        generator = self.generator
+        journal = generator.journal
+        attempt = 0
+        while True:
+            while delay := generator.breaker.try_pass():
+                if not await self._sleep(delay):
+                    return None
+            attempt += 1
+            self.client.clear_last_error()
+            try:
+                if journal:
+                    await self.client.run_io(journal.mark_running, job)
+                with metrics.tracing(generator._trace(job)):
+                    result = await self._generate(job)
+                error = None if result else self.client.get_last_error()
+            except Exception as e:
+                print(f"批量生成 '{job.dialogue_info.get('text', '')[:15]}' 时发生错误: {e}")
+                result = None
+                error = (str(e), True)
+            message, retryable = error if error else (None, True)
+            # 请求本身有误时不计入服务器的失败次数
+            generator.breaker.record(bool(result) or not retryable)
+            if result:
+                return result
+
+            # 取消期间失败的任务留待下次继续，而不是记为彻底失败
+            cancelled = generator.cancelled
+            final = (not retryable or attempt >= generator.max_attempts) and not cancelled
+            if journal:
+                await self.client.run_io(journal.mark_failed, job, message, final=final)
+            if cancelled:
+                return None
+            if final:
+                return False
+            delay = generator._retry_delay(attempt)
+            print(f"'{job.dialogue_info.get('text', '')[:15]}' 第 {attempt} 次生成失败，{delay:.1f} 秒后重试。")
+            if not await self._sleep(delay):
+                return None
+
+
+class BackgroundEventLoop:
+    """
+    在后台守护线程中运行的事件循环。
+    界面的按钮回调和批量线程都可以通过它向同一个 AsyncApiClient 提交协程，
+    而不必各自创建线程或事件循环。
+    """
+
+    def __init__(self, name: str = "asyncio-loop"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """
+        提交一个协程，立即返回 concurrent.futures.Future。
+        可用 future.add_done_callback 接收结果，或用 future.cancel() 取消。
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout: float | None = None):
+        """提交一个协程并阻塞等待其结果 (不可在事件循环线程内调用)。"""
+        return self.submit(coro).result(timeout)
+
+    def stop(self):
+        """停止事件循环并等待后台线程退出。"""
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
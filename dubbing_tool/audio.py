@@ -0,0 +1,102 @@
+import io
+import re
+import wave
+from dubbing_tool.utils import atomic_open
+
+# 切分长句时优先在句末标点处断开，仍然过长时再在句中标点处断开
+_SENTENCE_END = re.compile(r'(?<=[。！？!?；;…])')
+_CLAUSE_END = re.compile(r'(?<=[，,、：:])')
+
+
+def audio_duration(path: str) -> float | None:
+    """读取 WAV 文件的时长 (秒)；其他格式或无法解析时返回 None。"""
+    if not path.lower().endswith(".wav"):
+        return None
+    try:
+        with wave.open(path, 'rb') as f:
+            rate = f.getframerate()
+            return round(f.getnframes() / rate, 3) if rate else None
+    except (OSError, EOFError, wave.Error):
+        return None
+
+
+def _pack(pieces: list, max_chars: int) -> list:
+    """把相邻的片段贪心地合并为不超过 max_chars 的块。"""
+    chunks = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) > max_chars:
+            chunks.append(current)
+            current = ""
+        current += piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def split_text(text: str, max_chars: int) -> list:
+    """
+    在标点处把长文本切分为不超过 max_chars 个字符的片段。
+
+    先按句末标点 (。！？；…) 切分，单句仍然过长时按句中标点 (，、：) 切分，
+    没有标点的超长部分按 max_chars 硬切。相邻的短句会合并，使片段数尽量少。
+
+    :param text: 要切分的文本。
+    :param max_chars: 每个片段的最大字符数。
+    :return: 片段列表；文本不超过 max_chars 时只有一个元素。
+    """
+    text = text.strip()
+    if max_chars <= 0 or len(text) <= max_chars:
+        return [text]
+    pieces = []
+    for sentence in filter(None, _SENTENCE_END.split(text)):
+        if len(sentence) <= max_chars:
+            pieces.append(sentence)
+            continue
+        for clause in _pack([c for c in _CLAUSE_END.split(sentence) if c], max_chars):
+            pieces.extend(clause[i:i + max_chars] for i in range(0, len(clause), max_chars))
+    return [chunk.strip() for chunk in _pack(pieces, max_chars) if chunk.strip()]
+
+
+def silence_bytes(channels: int, sample_width: int, frame_rate: int, seconds: float) -> bytes:
+    """指定格式、时长的静音 PCM 数据。"""
+    # 8 位 PCM 是无符号的，静音值为 0x80
+    silence_byte = b'\x80' if sample_width == 1 else b'\x00'
+    return silence_byte * (int(round(seconds * frame_rate)) * channels * sample_width)
+
+
+def stitch_wav(fragments: list, output_path: str, interval: float = 0.0):
+    """
+    把多段 WAV 音频按顺序拼接为一个文件 (原子写入)，片段之间插入 interval 秒的静音。
+
+    各片段的声道数、采样宽度和采样率必须相同 (同一模型的合成结果总是如此)。
+    拼接直接在 PCM 帧的字节层面进行：静音块只构造一次，所有片段和静音块一次性 join，
+    不逐个采样地解码。
+
+    :param fragments: 各片段的 WAV 文件二进制数据。
+    :param output_path: 输出路径。
+    :param interval: 片段之间的静音时长 (秒)。
+    :raises ValueError: 片段为空或格式不一致。
+    :raises wave.Error: 片段不是有效的 WAV 数据。
+    """
+    if not fragments:
+        raise ValueError("没有可拼接的音频片段")
+    frames = []
+    audio_format = None
+    for data in fragments:
+        with wave.open(io.BytesIO(data), 'rb') as w:
+            fragment_format = (w.getnchannels(), w.getsampwidth(), w.getframerate())
+            if audio_format is None:
+                audio_format = fragment_format
+            elif fragment_format != audio_format:
+                raise ValueError(f"音频片段格式不一致: {fragment_format} != {audio_format}")
+            frames.append(w.readframes(w.getnframes()))
+
+    channels, sample_width, frame_rate = audio_format
+    silence = silence_bytes(channels, sample_width, frame_rate, interval)
+    with atomic_open(output_path, 'wb') as f:
+        with wave.open(f, 'wb') as out:
+            out.setnchannels(channels)
+            out.setsampwidth(sample_width)
+            out.setframerate(frame_rate)
+            out.writeframes(silence.join(frames))
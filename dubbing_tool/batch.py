@@ -0,0 +1,763 @@
+import os
+import json
+import time
+import hashlib
+import random
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+from threading import Event, Lock, Semaphore, Thread
+from dubbing_tool.metrics import LineTrace, tracing, measure as measure_phase, PHASE_POSTPROCESS, PHASE_QUEUE_WAIT
+from dubbing_tool.utils import atomic_open, get_output_path
+
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_DOWNLOAD_WORKERS = 2
+DEFAULT_QUEUE_SIZE = 8
+DEFAULT_MULTI_GROUP_SIZE = 8
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_BACKOFF = 2.0
+DEFAULT_RETRY_BACKOFF_MAX = 60.0
+DEFAULT_BREAKER_THRESHOLD = 5
+DEFAULT_BREAKER_COOLDOWN = 30.0
+# .json 元数据中记录音频对应的剧本对话签名的字段 (见 line_signature)
+SIGNATURE_KEY = "line_signature"
+# 计入签名的生成参数：决定这句对话说什么、由谁用什么语气说
+SIGNATURE_PARAM_KEYS = ("text", "model_name", "emotion", "text_lang", "prompt_text_lang")
+
+
+def build_generation_params(default_params: dict, text: str, model_name: str, emotion: str, **overrides) -> dict:
+    """
+    构建一次生成请求的完整参数 (同时也是保存到 .json 元数据中的内容)。
+
+    :param default_params: 全局默认推理参数。
+    :param text: 要转换为语音的文本。
+    :param model_name: 使用的声音模型。
+    :param emotion: 对话情感。
+    :param overrides: 需要覆盖默认值的参数 (如 speed_facter, seed 等)。
+    :return: 参数字典。
+    """
+    params = {
+        **default_params,
+        "text": text,
+        "model_name": model_name,
+        "emotion": emotion,
+        "speed_facter": default_params.get('speed_facter', 1.0),
+        "seed": default_params.get('seed', -1),
+        "text_lang": default_params.get('text_lang', '中文'),
+        "prompt_text_lang": default_params.get('prompt_text_lang', '中文'),
+        "top_k": default_params.get('top_k', 10),
+        "top_p": default_params.get('top_p', 1.0),
+        "temperature": default_params.get('temperature', 1.0),
+        "text_split_method": default_params.get('text_split_method', '按标点符号切'),
+        "fragment_interval": default_params.get('fragment_interval', 0.3),
+    }
+    params.update(overrides)
+    return params
+
+
+def line_signature(dialogue_info: dict, model_name: str | None, default_params: dict) -> str | None:
+    """
+    剧本中一句对话的签名：由这句对话在剧本中的文本和情感、角色的模型，以及全局的文本/参考音频语言
+    (SIGNATURE_PARAM_KEYS) 计算，任一变化时签名不同，已有的音频不能再复用 (见 manifest.sync_script_outputs)。
+    采样参数 (temperature、seed 等) 和服务相关的设置 (app_key、dl_url 等) 不计入：
+    修改它们只影响之后生成的音频，保存设置不会让整个项目的音频失效。
+
+    生成音频时把签名写入元数据 (SIGNATURE_KEY)，之后与剧本当前的签名比较。
+    签名不取自实际发送的请求，因此在详情页中修改文本或参数后生成的音频，只要剧本未变就仍然有效。
+
+    :param dialogue_info: 剧本中的对话信息 (来自 get_all_dialogues)。
+    :return: 签名；角色未配置模型时返回 None。
+    """
+    if not model_name:
+        return None
+    params = build_generation_params(default_params or {}, dialogue_info['text'], model_name, dialogue_info['emotion'])
+    content = json.dumps({key: params.get(key) for key in SIGNATURE_PARAM_KEYS}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()[:16]
+
+
+def save_audio_result(output_path: str, audio_data: bytes, params: dict, signature: str | None = None):
+    """
+    将内存中的音频数据及其生成参数写入磁盘 (原子写入)。
+
+    :param output_path: 音频文件路径，元数据会写入同名的 .json 文件。
+    :param audio_data: 音频二进制数据。
+    :param params: 生成参数。
+    :param signature: 对应剧本对话的签名 (见 line_signature)。
+    """
+    with atomic_open(output_path, 'wb') as f: f.write(audio_data)
+    save_audio_metadata(output_path, params, signature)
+
+
+def save_audio_metadata(output_path: str, params: dict, signature: str | None = None):
+    """
+    将生成参数写入音频文件同名的 .json 元数据文件 (原子写入)。
+
+    :param output_path: 音频文件路径。
+    :param params: 生成参数。
+    :param signature: 对应剧本对话的签名 (见 line_signature)，记录在 SIGNATURE_KEY 字段中。
+    """
+    metadata = {**params, SIGNATURE_KEY: signature} if signature else params
+    metadata_path = os.path.splitext(output_path)[0] + ".json"
+    with atomic_open(metadata_path, 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, ensure_ascii=False, indent=2)
+
+
+class BatchJob:
+    """
+    批量生成中的一条任务。
+    """
+
+    def __init__(self, dialogue_info: dict, params: dict, output_path: str, signature: str | None = None):
+        """
+        :param dialogue_info: 对话信息 (来自 get_all_dialogues)。
+        :param params: 传给 ApiClient.generate_audio 的完整参数。
+        :param output_path: 音频输出路径。
+        :param signature: 对话的签名 (见 line_signature)，写入音频的元数据。
+        """
+        self.dialogue_info = dialogue_info
+        self.params = params
+        self.output_path = output_path
+        self.signature = signature
+        self.trace = None  # 启用耗时统计时的 LineTrace
+
+
+def iter_batch_jobs(script_data: dict, dialogues, character_models: dict, default_params: dict, output_dir: str,
+                    on_unmapped=None):
+    """
+    惰性地为一组对话创建批量任务，dialogues 可以是流式产生对话的迭代器 (如 iter_raw_script)。
+
+    :param on_unmapped: 遇到未配置模型的对话时的回调 on_unmapped(dialogue_info)。
+    其余参数同 build_batch_jobs。
+    """
+    for info in dialogues:
+        model_name = character_models.get(info['character'])
+        if not model_name:
+            if on_unmapped:
+                on_unmapped(info)
+            continue
+        params = build_generation_params(default_params, info['text'], model_name, info['emotion'])
+        yield BatchJob(info, params, get_output_path(output_dir, script_data, info),
+                       line_signature(info, model_name, default_params))
+
+
+def build_batch_jobs(script_data: dict, dialogues, character_models: dict, default_params: dict, output_dir: str) -> tuple[list, list]:
+    """
+    为一组对话创建批量任务 (使用全局默认参数)。
+
+    :param script_data: 剧本数据，用于计算输出路径。
+    :param dialogues: 对话信息列表 (来自 get_all_dialogues)。
+    :param character_models: 角色到模型的映射。
+    :param default_params: 全局默认推理参数。
+    :param output_dir: 输出根目录。
+    :return: (jobs, unmapped)，unmapped 为未配置模型的对话列表。
+    """
+    unmapped = []
+    jobs = list(iter_batch_jobs(script_data, dialogues, character_models, default_params, output_dir,
+                                on_unmapped=unmapped.append))
+    return jobs, unmapped
+
+
+def count_model_switches(jobs) -> int:
+    """统计按顺序执行 jobs 时服务器需要切换声音模型的次数。"""
+    switches = 0
+    previous = None
+    for job in jobs:
+        model_name = job.params.get('model_name')
+        if previous is not None and model_name != previous:
+            switches += 1
+        previous = model_name
+    return switches
+
+
+def schedule_jobs_by_model(jobs, lanes: int = 1) -> tuple[list, list, dict]:
+    """
+    按模型亲和性重排任务，减少服务器切换 GPT/SoVITS 权重的次数。
+
+    同一模型的任务排在一起 (模型按首次出现的顺序)，模型内再按情感 (参考音频) 分组，
+    其余保持剧本顺序。输出路径由任务自身携带，重排不影响文件位置。
+
+    lanes > 1 时 (多个后端)，按句数把模型均衡地分到各条通道，每条通道内按模型连续排列，
+    再按各通道的完成比例交错合并，使每个后端只处理分配给它的模型且同时保持忙碌。
+
+    :param jobs: BatchJob 列表。
+    :param lanes: 通道数 (通常为健康后端的数量)。
+    :return: (ordered_jobs, lane_models, stats)。lane_models[i] 为第 i 条通道的模型列表；
+             stats 为 {'model_switches', 'model_switches_avoided'}。
+    """
+    groups = {}  # model_name -> {emotion -> [job]}，字典保持首次出现的顺序
+    for job in jobs:
+        by_emotion = groups.setdefault(job.params.get('model_name'), {})
+        by_emotion.setdefault(job.params.get('emotion'), []).append(job)
+    model_jobs = {model: [job for same in by_emotion.values() for job in same] for model, by_emotion in groups.items()}
+
+    lanes = max(1, min(int(lanes), len(model_jobs)))
+    lane_models = [[] for _ in range(lanes)]
+    lane_sizes = [0] * lanes
+    # 最长处理时间优先的贪心分配，各通道的句数尽量接近
+    for model in sorted(model_jobs, key=lambda m: len(model_jobs[m]), reverse=True):
+        lane = lane_sizes.index(min(lane_sizes))
+        lane_models[lane].append(model)
+        lane_sizes[lane] += len(model_jobs[model])
+    order = list(model_jobs)
+    for models in lane_models:
+        models.sort(key=order.index)
+
+    lane_jobs = [[job for model in models for job in model_jobs[model]] for models in lane_models]
+    ordered = []
+    taken = [0] * lanes
+    for _ in range(sum(lane_sizes)):
+        lane = min((i for i in range(lanes) if taken[i] < lane_sizes[i]), key=lambda i: taken[i] / lane_sizes[i])
+        ordered.append(lane_jobs[lane][taken[lane]])
+        taken[lane] += 1
+
+    before = count_model_switches(jobs)
+    after = sum(count_model_switches(same) for same in lane_jobs)
+    return ordered, lane_models, {'model_switches': after, 'model_switches_avoided': max(0, before - after)}
+
+
+class CircuitBreaker:
+    """
+    所有工作线程共享的熔断器。
+
+    连续失败 failure_threshold 次后断开：之后的请求在 cooldown 秒内全部等待，
+    而不是在服务器宕机时几秒内把整个队列都标记为失败。冷却结束后只放行一个试探请求，
+    成功则恢复，失败则再次断开。
+    """
+
+    def __init__(self, failure_threshold: int = DEFAULT_BREAKER_THRESHOLD, cooldown: float = DEFAULT_BREAKER_COOLDOWN):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.cooldown = float(cooldown)
+        self._lock = Lock()
+        self._failures = 0
+        self._open_until = None  # 断开时为恢复试探的时间
+        self._probing = False
+        self.trips = 0
+
+    def wait(self, cancel_event: Event | None = None) -> bool:
+        """
+        阻塞直到允许发送请求。
+
+        :return: False 表示等待期间 cancel_event 被设置。
+        """
+        while True:
+            delay = self.try_pass()
+            if not delay:
+                return True
+            if cancel_event is None:
+                time.sleep(delay)
+            elif cancel_event.wait(delay):
+                return False
+
+    def try_pass(self) -> float:
+        """
+        不阻塞地检查是否允许发送请求 (协程中使用，见 async_api_client.AsyncBatchRunner)。
+        与 wait 相同，返回 0 后必须调用 record 报告结果。
+
+        :return: 0 表示允许；否则为建议等待的秒数。
+        """
+        with self._lock:
+            if self._open_until is None:
+                return 0.0
+            remaining = self._open_until - time.monotonic()
+            if remaining <= 0 and not self._probing:
+                self._probing = True
+                return 0.0
+        # 冷却中，或者试探请求尚未返回
+        return max(remaining, 0.5)
+
+    def record(self, success: bool):
+        with self._lock:
+            if success:
+                if self._open_until is not None:
+                    print("服务器已恢复，继续批量生成。")
+                self._failures = 0
+                self._open_until = None
+                self._probing = False
+                return
+            self._failures += 1
+            if self._probing or (self._open_until is None and self._failures >= self.failure_threshold):
+                self._open_until = time.monotonic() + self.cooldown
+                self._probing = False
+                self.trips += 1
+                print(f"连续失败 {self._failures} 次，暂停请求 {self.cooldown:.0f} 秒后重试。")
+
+
+class BatchGenerator:
+    """
+    批量生成引擎，与界面代码无关。
+
+    两种执行方式：
+    - 默认：有界线程池，每个工作线程依次完成一条任务的推理和下载。
+    - 流水线 (pipeline=True)：推理线程只负责 POST /infer_single，拿到 audio_url 后
+      放入有界队列，由下载线程负责下载和写盘；推理线程随即提交下一条，
+      使服务器在下载上一条音频时已经在处理下一条。
+
+    - 多句合并 (multi=True)：同一场景、同一模型的连续任务合并为一次 /infer_multi 请求，
+      结果逐句写回各自的文件；整组失败时退回逐句的 /infer_single。
+
+    音频均以流式方式原子写入磁盘，取消或崩溃不会留下被截断的 .wav 文件。
+    提供 cache (SynthesisCache) 时，命中缓存的任务不会请求服务器，相同的并发请求只生成一次。
+    model_affinity=True 时先按模型重排任务 (见 schedule_jobs_by_model)，并把每个模型固定到一个后端。
+
+    失败的任务按指数退避重试 (最多 max_attempts 次)，请求本身有误 (如 4xx) 时不重试；
+    服务器持续失败时由熔断器暂停所有请求。提供 journal (JobJournal) 时记录每条任务的状态，
+    中断后可以从日志继续；提供 manifest (OutputManifest) 时每写完一条音频就更新输出索引。
+    提供 postprocessor (PostProcessor) 时，每条音频写入后在进程池中进行后处理，再更新索引。
+    提供 metrics (GenerationMetrics) 时记录每条任务各阶段的耗时 (见 dubbing_tool.metrics)。
+    """
+
+    def __init__(self, api_client, max_workers: int = DEFAULT_MAX_WORKERS, pipeline: bool = False,
+                 download_workers: int = DEFAULT_DOWNLOAD_WORKERS, queue_size: int = DEFAULT_QUEUE_SIZE,
+                 cache=None, multi: bool = False, multi_group_size: int = DEFAULT_MULTI_GROUP_SIZE,
+                 model_affinity: bool = False, journal=None, manifest=None, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 retry_backoff: float = DEFAULT_RETRY_BACKOFF, retry_backoff_max: float = DEFAULT_RETRY_BACKOFF_MAX,
+                 breaker_threshold: int = DEFAULT_BREAKER_THRESHOLD, breaker_cooldown: float = DEFAULT_BREAKER_COOLDOWN,
+                 postprocessor=None, metrics=None):
+        """
+        :param api_client: ApiClient 实例，所有工作线程共享。
+        :param max_workers: 并发工作线程数 (流水线模式下为推理线程数)。
+        :param pipeline: 是否启用推理/下载流水线。
+        :param download_workers: 流水线模式下的下载线程数。
+        :param queue_size: 流水线模式下等待下载的任务队列上限。
+        :param cache: 可选的 SynthesisCache 实例。
+        :param multi: 是否使用 /infer_multi 合并请求 (优先于 pipeline)。
+        :param multi_group_size: 每次 /infer_multi 请求最多包含的句数。
+        :param model_affinity: 是否按模型重排任务以减少模型切换。
+        :param journal: 可选的 JobJournal 实例。
+        :param manifest: 可选的 OutputManifest 实例。
+        :param max_attempts: 每条任务的最大尝试次数 (含第一次)。
+        :param retry_backoff: 第一次重试前的等待时间 (秒)，之后每次翻倍。
+        :param retry_backoff_max: 重试等待时间上限 (秒)。
+        :param breaker_threshold: 连续失败多少次后熔断。
+        :param breaker_cooldown: 熔断后暂停的时间 (秒)。
+        :param postprocessor: 可选的 PostProcessor 实例。
+        :param metrics: 可选的 GenerationMetrics 实例。
+        """
+        self.api_client = api_client
+        self.max_workers = max(1, int(max_workers))
+        self.pipeline = pipeline
+        self.download_workers = max(1, int(download_workers))
+        self.queue_size = max(1, int(queue_size))
+        self.cache = cache
+        self.multi = multi
+        self.multi_group_size = max(1, int(multi_group_size))
+        self.model_affinity = model_affinity
+        self.journal = journal
+        self.manifest = manifest
+        self.max_attempts = max(1, int(max_attempts))
+        self.retry_backoff = float(retry_backoff)
+        self.retry_backoff_max = float(retry_backoff_max)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self.postprocessor = postprocessor
+        self.metrics = metrics
+        self._retries = 0
+        self._lock = Lock()
+        self._cancel_event = Event()
+
+    @classmethod
+    def from_config(cls, api_client, batch_config: dict | None, cache=None, journal=None, manifest=None, postprocessor=None,
+                    metrics=None):
+        """
+        根据 config.yaml 中的 batch 配置段创建实例。
+        """
+        batch_config = batch_config if batch_config else {}
+        return cls(
+            api_client,
+            max_workers=batch_config.get('max_workers', DEFAULT_MAX_WORKERS),
+            pipeline=batch_config.get('pipeline', False),
+            download_workers=batch_config.get('download_workers', DEFAULT_DOWNLOAD_WORKERS),
+            queue_size=batch_config.get('queue_size', DEFAULT_QUEUE_SIZE),
+            cache=cache,
+            multi=batch_config.get('multi', False),
+            multi_group_size=batch_config.get('multi_group_size', DEFAULT_MULTI_GROUP_SIZE),
+            model_affinity=batch_config.get('model_affinity', False),
+            journal=journal,
+            manifest=manifest,
+            max_attempts=batch_config.get('max_attempts', DEFAULT_MAX_ATTEMPTS),
+            retry_backoff=batch_config.get('retry_backoff', DEFAULT_RETRY_BACKOFF),
+            retry_backoff_max=batch_config.get('retry_backoff_max', DEFAULT_RETRY_BACKOFF_MAX),
+            breaker_threshold=batch_config.get('breaker_threshold', DEFAULT_BREAKER_THRESHOLD),
+            breaker_cooldown=batch_config.get('breaker_cooldown', DEFAULT_BREAKER_COOLDOWN),
+            postprocessor=postprocessor,
+            metrics=metrics,
+        )
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        """请求取消：尚未开始的任务将被跳过，正在进行的任务会执行完毕。"""
+        self._cancel_event.set()
+
+    def run(self, jobs, on_progress=None) -> dict:
+        """
+        阻塞执行所有任务，直到完成或被取消。
+
+        任务按顺序逐个取出，同时在途的任务数有上限，
+        因此 jobs 也可以是一个惰性生成的迭代器 (启用 model_affinity 时会先全部取出再重排)。
+
+        :param jobs: BatchJob 的可迭代对象。
+        :param on_progress: 每条任务结束时的回调 on_progress(job, success, done, total)，
+                            在工作线程中调用；total 在 jobs 没有长度时为 None。
+        :return: 统计信息字典 {'total', 'succeeded', 'failed', 'cancelled', 'retries', 'breaker_trips'}；
+                 启用 model_affinity 时还包括 'model_switches' 和 'model_switches_avoided'。
+        """
+        stats = {'total': 0, 'succeeded': 0, 'failed': 0, 'cancelled': False}
+        self._retries = 0
+        jobs = self._schedule(jobs, stats)
+        total = len(jobs) if hasattr(jobs, '__len__') else None
+        lock = Lock()
+
+        def report(job, success):
+            if self.metrics:
+                self.metrics.record(job.dialogue_info, job.params, job.output_path, job.trace, success)
+            with lock:
+                stats['succeeded' if success else 'failed'] += 1
+                done = stats['succeeded'] + stats['failed']
+            if on_progress:
+                on_progress(job, success, done, total)
+
+        if self.multi:
+            self._run_pooled(self._group_jobs(jobs), stats, report, self._run_group)
+        elif self.pipeline and self.api_client.two_step:
+            self._run_pipelined(jobs, stats, report)
+        else:
+            self._run_pooled(jobs, stats, report, self._run_job)
+
+        stats['cancelled'] = self.cancelled
+        stats['retries'] = self._retries
+        stats['breaker_trips'] = self.breaker.trips
+        if self.manifest:
+            self.manifest.save()
+        return stats
+
+    def _schedule(self, jobs, stats: dict):
+        """启用 model_affinity 时按模型重排任务，并把各模型固定到后端；调度统计写入 stats。"""
+        if not self.model_affinity:
+            return jobs
+        lanes = self.api_client.healthy_backend_count() if hasattr(self.api_client, 'healthy_backend_count') else 1
+        jobs, lane_models, schedule_stats = schedule_jobs_by_model(list(jobs), lanes)
+        stats.update(schedule_stats)
+        if len(lane_models) > 1:
+            self.api_client.pin_models(lane_models)
+        return jobs
+
+    def _retry_delay(self, attempt: int) -> float:
+        """第 attempt 次失败后重试前的等待时间，并计入重试次数。"""
+        # 指数退避，加入随机抖动避免所有工作线程同时重试
+        delay = min(self.retry_backoff * 2 ** (attempt - 1), self.retry_backoff_max) * random.uniform(0.5, 1.0)
+        with self._lock:
+            self._retries += 1
+        return delay
+
+    def _attempt(self, job: BatchJob, operation, cancellable: bool = True):
+        """
+        执行 operation()，失败时按指数退避重试，并在日志中记录每次尝试。
+        成功后由调用者在写完元数据后调用 _finish_job。
+
+        :param operation: 无参回调，返回真值表示成功 (如 True 或 audio_url)。
+        :param cancellable: 为 False 时取消批量不会中断正在等待熔断器的这次操作 (用于已完成推理的下载)，
+                            但失败后同样不再重试。
+        :return: operation 的返回值；失败时为 False，因取消而放弃时为 None (任务在日志中保持 queued，下次继续)。
+        """
+        attempt = 0
+        while True:
+            if not self.breaker.wait(self._cancel_event if cancellable else None):
+                return None
+            attempt += 1
+            self.api_client.clear_last_error()
+            if self.journal:
+                self.journal.mark_running(job)
+            try:
+                with tracing(self._trace(job)):
+                    result = operation()
+                error = None if result else self.api_client.get_last_error()
+            except Exception as e:
+                print(f"批量生成 '{job.dialogue_info.get('text', '')[:15]}' 时发生错误: {e}")
+                result = None
+                error = (str(e), True)
+            message, retryable = error if error else (None, True)
+            # 请求本身有误时不计入服务器的失败次数
+            self.breaker.record(bool(result) or not retryable)
+            if result:
+                return result
+
+            # 取消期间失败的任务留待下次继续，而不是记为彻底失败
+            cancelled = self.cancelled
+            final = (not retryable or attempt >= self.max_attempts) and not cancelled
+            if self.journal:
+                self.journal.mark_failed(job, message, final=final)
+            if cancelled:
+                return None
+            if final:
+                return False
+            delay = self._retry_delay(attempt)
+            print(f"'{job.dialogue_info.get('text', '')[:15]}' 第 {attempt} 次生成失败，{delay:.1f} 秒后重试。")
+            if self._cancel_event.wait(delay) and cancellable:
+                return None
+
+    def _trace(self, job: BatchJob) -> LineTrace | None:
+        """启用耗时统计时返回该任务的 LineTrace (第一次调用时创建，从此刻开始计时)。"""
+        if self.metrics and job.trace is None:
+            job.trace = LineTrace()
+        return job.trace
+
+    def _finish_job(self, job: BatchJob):
+        """音频和元数据都已写入后调用：后处理音频，更新输出索引和任务日志。"""
+        if self.postprocessor:
+            # 在进程池中处理，当前线程只等待结果；失败时保留原始音频
+            with tracing(self._trace(job)), measure_phase(PHASE_POSTPROCESS):
+                self.postprocessor.process(job.output_path)
+        if self.manifest:
+            self.manifest.record(job.output_path, job.dialogue_info.get('line_id'), job.params)
+        if self.journal:
+            self.journal.mark_done(job)
+
+    def _run_pooled(self, units, stats, report, run_unit):
+        """
+        在线程池中执行 units；每个 unit 是一条任务 (run_unit=_run_job) 或一组任务 (run_unit=_run_group)。
+        run_unit 返回 True/False 表示单条任务的结果，返回 None 表示已自行上报或被跳过。
+        """
+        slots = Semaphore(self.max_workers * 2)
+
+        def run_safely(unit):
+            # 结果在工作线程中上报：done 回调中抛出的异常会被 concurrent.futures 吞掉，任务就不会被计入进度
+            reported = []
+
+            def report_once(job, success):
+                reported.append(job)
+                report(job, success)
+
+            try:
+                success = run_unit(unit, report_once)
+                if success is not None:
+                    report_once(unit, success)
+            except Exception as e:
+                print(f"批量生成时发生错误: {e}")
+                # 尚未上报的任务 (如 /infer_multi 结果处理或任务日志出错) 计为失败
+                for job in unit if isinstance(unit, list) else [unit]:
+                    if not any(job is done for done in reported):
+                        report_once(job, False)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="batch") as executor:
+            for unit in units:
+                slots.acquire()
+                if self.cancelled:
+                    slots.release()
+                    break
+                stats['total'] += len(unit) if isinstance(unit, list) else 1
+                future = executor.submit(run_safely, unit)
+                future.add_done_callback(lambda f: slots.release())
+
+    def _should_split(self, job: BatchJob) -> bool:
+        """该任务是否为需要在客户端切分合成的长句 (见 ApiClient.split_max_chars)。"""
+        should_split = getattr(self.api_client, 'should_split', None)
+        return bool(should_split) and should_split(job.params.get('text', ''), job.params.get('media_type'))
+
+    def _group_jobs(self, jobs):
+        """
+        将连续的、属于同一场景和同一模型的任务合并为一组，每组不超过 multi_group_size 条。
+        需要切分合成的长句单独成组 (逐句合成时会被切分并行合成)。
+        """
+        group = []
+        group_key = None
+        for job in jobs:
+            if self._should_split(job):
+                if group:
+                    yield group
+                    group, group_key = [], None
+                yield [job]
+                continue
+            key = (job.dialogue_info.get('scene_idx'), job.params.get('model_name'))
+            if group and (key != group_key or len(group) >= self.multi_group_size):
+                yield group
+                group = []
+            group.append(job)
+            group_key = key
+        if group:
+            yield group
+
+    def _run_group(self, group: list, report) -> None:
+        """执行一组任务：命中缓存的直接写出，其余合并为一次 /infer_multi 请求，失败时逐句合成。"""
+        pending = []
+        for job in group:
+            if self.cancelled:
+                break
+            cache_key = None
+            if self.cache:
+                # 同一组内可能有重复的句子，不能等待自己持有的占位
+                hit, cache_key = self.cache.acquire(job.params, job.output_path, wait=False)
+                if hit:
+                    save_audio_metadata(job.output_path, job.params, job.signature)
+                    self._finish_job(job)
+                    report(job, True)
+                    continue
+            pending.append((job, cache_key))
+        if not pending:
+            return None
+
+        results = None
+        group_trace = None
+        try:
+            if len(pending) > 1 and self.breaker.wait(self._cancel_event):
+                if self.journal:
+                    for job, _ in pending:
+                        self.journal.mark_running(job)
+                lines = [{"text": job.params['text'], "model_name": job.params['model_name'], "emotion": job.params['emotion']}
+                         for job, _ in pending]
+                group_params = {k: v for k, v in pending[0][0].params.items() if k not in ("text", "model_name", "emotion")}
+                group_trace = LineTrace() if self.metrics else None
+                self.api_client.clear_last_error()
+                try:
+                    with tracing(group_trace):
+                        results = self.api_client.generate_multi_to_files(lines, [job.output_path for job, _ in pending], **group_params)
+                    error = None if results is not None else self.api_client.get_last_error()
+                except Exception as e:
+                    print(f"/infer_multi 合成时发生错误: {e}")
+                    results = None
+                    error = (str(e), True)
+                # wait() 可能让这次请求占用了熔断器的试探名额，必须记录结果，否则其他线程会一直等待
+                self.breaker.record(results is not None or not (error[1] if error else True))
+                if results is None:
+                    print(f"/infer_multi 合成 {len(pending)} 句失败，改为逐句合成。")
+
+            for i, (job, cache_key) in enumerate(pending):
+                if results is not None and results[i]:
+                    success = True
+                    if group_trace is not None:
+                        job.trace = group_trace.share(len(pending))
+                elif self.cancelled:
+                    if self.journal:
+                        error = self.api_client.get_last_error() if results is None else None
+                        self.journal.mark_failed(job, error[0] if error else None, final=False)
+                    continue
+                else:
+                    success = self._attempt(job, lambda: self.api_client.generate_audio_to_file(job.output_path, **job.params))
+                    if success is None:
+                        continue
+                if success:
+                    save_audio_metadata(job.output_path, job.params, job.signature)
+                    self._finish_job(job)
+                if self.cache:
+                    self.cache.release(cache_key, success, job.output_path)
+                    pending[i] = (job, None)
+                report(job, success)
+        finally:
+            # 出错或取消时释放尚未释放的缓存占位，避免其他线程一直等待
+            if self.cache:
+                for job, cache_key in pending:
+                    self.cache.release(cache_key, False, job.output_path)
+        return None
+
+    def _run_pipelined(self, jobs, stats, report):
+        download_queue = Queue(maxsize=self.queue_size)
+        job_iter = iter(jobs)
+        iter_lock = Lock()
+
+        def next_job():
+            with iter_lock:
+                if self.cancelled:
+                    return None
+                job = next(job_iter, None)
+                if job is not None:
+                    stats['total'] += 1
+                return job
+
+        def infer_one(job) -> bool | None:
+            """
+            推理一条任务。返回 True/False 表示已有结果，None 表示已放入下载队列或因取消而跳过。
+            出错时释放尚未交给下载线程的缓存占位。
+            """
+            cache_key = None
+            queued = False
+            success = False
+            try:
+                if self.cache:
+                    hit, cache_key = self.cache.acquire(job.params, job.output_path)
+                    if hit:
+                        cache_key = None
+                        save_audio_metadata(job.output_path, job.params, job.signature)
+                        self._finish_job(job)
+                        return True
+                if self._should_split(job):
+                    # 长句的各片段在推理线程中并行合成并拼接，不经过下载队列
+                    success = self._attempt(job, lambda: self.api_client.generate_audio_to_file(job.output_path, **job.params))
+                    if success:
+                        save_audio_metadata(job.output_path, job.params, job.signature)
+                        self._finish_job(job)
+                    return None if success is None else bool(success)
+                audio_url = self._attempt(job, lambda: self.api_client.request_audio_url(**job.params))
+                if not audio_url:
+                    return None if audio_url is None else False
+                # 队列已满时阻塞，避免推理远远领先于下载
+                download_queue.put((job, audio_url, cache_key, time.monotonic()))
+                queued = True
+                return None
+            finally:
+                if self.cache and not queued:
+                    self.cache.release(cache_key, bool(success), job.output_path)
+
+        def infer_worker():
+            while (job := next_job()) is not None:
+                try:
+                    success = infer_one(job)
+                except Exception as e:
+                    # 任何一步出错都不能让推理线程退出，否则该任务不会被计入进度
+                    print(f"批量生成 '{job.dialogue_info.get('text', '')[:15]}' 时发生错误: {e}")
+                    success = False
+                if success is not None:
+                    report(job, success)
+
+        def download_worker():
+            # 已完成推理的任务即使在取消后也会下载完毕，避免浪费服务器算力
+            while (item := download_queue.get()) is not None:
+                job, audio_url, cache_key, enqueued = item
+                if job.trace is not None:
+                    job.trace.add(PHASE_QUEUE_WAIT, time.monotonic() - enqueued)
+                success = False
+                try:
+                    success = self._attempt(
+                        job, lambda: self.api_client.download_audio_to_file(audio_url, job.output_path), cancellable=False)
+                    if success:
+                        save_audio_metadata(job.output_path, job.params, job.signature)
+                        self._finish_job(job)
+                except Exception as e:
+                    print(f"批量下载 '{job.dialogue_info.get('text', '')[:15]}' 时发生错误: {e}")
+                    success = False
+                finally:
+                    if self.cache:
+                        self.cache.release(cache_key, bool(success), job.output_path)
+                # 取消期间下载失败的任务 (None) 与其他被取消的任务一样不计入结果
+                if success is not None:
+                    report(job, bool(success))
+
+        infer_threads = [Thread(target=infer_worker, name=f"batch-infer-{i}", daemon=True) for i in range(self.max_workers)]
+        download_threads = [Thread(target=download_worker, name=f"batch-download-{i}", daemon=True) for i in range(self.download_workers)]
+        for t in infer_threads + download_threads:
+            t.start()
+        for t in infer_threads:
+            t.join()
+        for _ in download_threads:
+            download_queue.put(None)
+        for t in download_threads:
+            t.join()
+
+    def _run_job(self, job: BatchJob, report=None) -> bool | None:
+        """执行单条任务 (失败时重试)；返回 None 表示因取消而跳过。"""
+        if self.cancelled:
+            return None
+        generate = lambda: self.api_client.generate_audio_to_file(job.output_path, **job.params)
+        if self.cache:
+            operation = lambda: self.cache.get_or_generate(job.params, job.output_path, generate)
+        else:
+            operation = generate
+        success = self._attempt(job, operation)
+        if not success:
+            return success
+        try:
+            save_audio_metadata(job.output_path, job.params, job.signature)
+        except OSError as e:
+            print(f"写入元数据 '{job.dialogue_info.get('text', '')[:15]}' 失败: {e}")
+            return False
+        self._finish_job(job)
+        return True
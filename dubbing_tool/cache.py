@@ -0,0 +1,225 @@
+import os
+import re
+import json
+import shutil
+import hashlib
+import uuid
+from collections import OrderedDict
+from threading import Event, Lock
+
+DEFAULT_MAX_SIZE_MB = 2048
+# 缓存文件名为参数的 SHA-256 (见 hash_params)，存放在以其前两位命名的分片目录中
+_KEY_PATTERN = re.compile(r'[0-9a-f]{64}')
+_SHARD_PATTERN = re.compile(r'[0-9a-f]{2}')
+
+
+def hash_params(params: dict) -> str:
+    """
+    计算生成参数的内容哈希 (键排序后的 JSON 的 SHA-256)。
+    """
+    canonical = json.dumps(params, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def link_or_copy(src: str, dst: str):
+    """
+    将 src 原子地放到 dst：优先创建硬链接，跨设备等不支持的情况下退回为复制。
+    """
+    directory = os.path.dirname(dst) or '.'
+    os.makedirs(directory, exist_ok=True)
+    temp_path = os.path.join(directory, f".{os.path.basename(dst)}.{uuid.uuid4().hex[:8]}.part")
+    try:
+        try:
+            os.link(src, temp_path)
+        except OSError:
+            shutil.copyfile(src, temp_path)
+        os.replace(temp_path, dst)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+class SynthesisCache:
+    """
+    以生成参数内容哈希为键的本地合成缓存。
+
+    - 只有固定种子 (seed >= 0) 的请求才会被缓存，seed 为 -1 时每次结果都不同。
+    - 总大小超过上限时按最近最少使用 (LRU) 淘汰，使用顺序通过文件 mtime 持久化。
+    - 命中时把缓存文件硬链接 (或复制) 到输出路径。
+    - 同一批次中相同的并发请求会被合并，只向服务器发送一次。
+    """
+
+    def __init__(self, cache_dir: str, max_size_mb: float = DEFAULT_MAX_SIZE_MB):
+        """
+        :param cache_dir: 缓存目录。
+        :param max_size_mb: 缓存总大小上限 (MB)。
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        self._lock = Lock()
+        self._entries = OrderedDict()  # key -> 文件大小，按最近使用排序
+        self._total_bytes = 0
+        self._inflight = {}  # key -> Event
+        self.stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'evictions': 0}
+        self._load()
+
+    @classmethod
+    def from_config(cls, cache_config: dict | None, base_dir: str):
+        """
+        根据 config.yaml 中的 cache 配置段创建实例；未启用时返回 None。
+
+        :param base_dir: 相对路径的基准目录。
+        """
+        if not cache_config or not cache_config.get('enabled', False):
+            return None
+        cache_dir = cache_config.get('dir', 'cache')
+        if not os.path.isabs(cache_dir):
+            cache_dir = os.path.join(base_dir, cache_dir)
+        return cls(cache_dir, cache_config.get('max_size_mb', DEFAULT_MAX_SIZE_MB))
+
+    @staticmethod
+    def is_cacheable(params: dict) -> bool:
+        try:
+            return int(params.get('seed', -1)) >= 0
+        except (TypeError, ValueError):
+            return False
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _load(self):
+        """扫描缓存目录，按 mtime 重建 LRU 顺序。"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        found = []
+        for shard in os.scandir(self.cache_dir):
+            # 只有以键的前两位命名的子目录是缓存分片；其他目录 (如旧版本放在这里的剧本解析缓存 scripts/) 不计入
+            if not shard.is_dir() or not _SHARD_PATTERN.fullmatch(shard.name):
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.is_file() and entry.name.startswith(shard.name) and _KEY_PATTERN.fullmatch(entry.name):
+                    st = entry.stat()
+                    found.append((st.st_mtime, entry.name, st.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {**self.stats, 'entries': len(self._entries), 'size_bytes': self._total_bytes}
+
+    def acquire(self, params: dict, output_path: str, wait: bool = True) -> tuple[bool, str | None]:
+        """
+        尝试从缓存写出 output_path。
+
+        如果有相同的请求正在生成，wait 为 True 时会阻塞等待其结束后再查缓存；
+        为 False 时直接返回 (False, None)，由调用者自行生成 (用于一次持有多个占位的调用者，避免自我死锁)。
+
+        :return: (hit, key)。hit 为 True 表示已从缓存写出；否则调用者负责生成，
+                 并在结束后调用 release(key, success, output_path)。key 为 None 表示该请求不可缓存。
+        """
+        if not self.is_cacheable(params):
+            return False, None
+        key = hash_params(params)
+        waited = False
+        while True:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    if waited:
+                        self.stats['coalesced'] += 1
+                    hit = True
+                else:
+                    hit = False
+                    event = self._inflight.get(key)
+                    if event is None:
+                        self._inflight[key] = Event()
+                        self.stats['misses'] += 1
+                        return False, key
+                    if not wait:
+                        self.stats['misses'] += 1
+                        return False, None
+            if hit:
+                if self._materialize(key, output_path):
+                    return True, key
+                continue
+            event.wait()
+            waited = True
+
+    def release(self, key: str | None, success: bool, output_path: str):
+        """
+        结束由 acquire 领取的生成任务；成功时将输出文件存入缓存。
+        """
+        if key is None:
+            return
+        try:
+            if success:
+                self._store(key, output_path)
+        finally:
+            with self._lock:
+                event = self._inflight.pop(key, None)
+            if event:
+                event.set()
+
+    def get_or_generate(self, params: dict, output_path: str, generate) -> bool:
+        """
+        命中缓存时直接写出 output_path，否则调用 generate() 生成并存入缓存。
+
+        :param generate: 无参回调，负责把音频写入 output_path，返回是否成功。
+        """
+        hit, key = self.acquire(params, output_path)
+        if hit:
+            return True
+        success = False
+        try:
+            success = generate()
+            return success
+        finally:
+            self.release(key, success, output_path)
+
+    def _materialize(self, key: str, output_path: str) -> bool:
+        entry_path = self._entry_path(key)
+        try:
+            os.utime(entry_path)
+            link_or_copy(entry_path, output_path)
+            return True
+        except OSError as e:
+            # 缓存文件被外部删除或损坏，移出索引后按未命中处理
+            print(f"读取缓存 {key[:12]} 失败: {e}")
+            with self._lock:
+                size = self._entries.pop(key, None)
+                if size is not None:
+                    self._total_bytes -= size
+            return False
+
+    def _store(self, key: str, output_path: str):
+        entry_path = self._entry_path(key)
+        try:
+            link_or_copy(output_path, entry_path)
+            size = os.path.getsize(entry_path)
+        except OSError as e:
+            print(f"写入缓存 {key[:12]} 失败: {e}")
+            return
+        with self._lock:
+            self._total_bytes += size - self._entries.get(key, 0)
+            self._entries[key] = size
+            self._entries.move_to_end(key)
+            evicted = self._evict()
+        for evicted_key in evicted:
+            try:
+                os.remove(self._entry_path(evicted_key))
+            except OSError:
+                pass
+
+    def _evict(self) -> list:
+        """在持有锁时调用：淘汰最久未使用的条目，直到总大小不超过上限 (至少保留最新一条)。"""
+        evicted = []
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.stats['evictions'] += 1
+            evicted.append(key)
+        return evicted
@@ -0,0 +1,517 @@
+"""
+无界面的命令行批量生成入口。
+
+用法:
+    python -m dubbing_tool batch <script.yaml|script.txt> [--workers N | --async N] [--force | --resume] [--stream] [--scene 名称或序号 ...]
+    python -m dubbing_tool export <script.yaml|script.txt> [--line-gap 秒] [--scene-gap 秒] [--scene 名称或序号 ...]
+    python -m dubbing_tool postprocess <script.yaml|script.txt> [--workers N] [--scene 名称或序号 ...]
+    python -m dubbing_tool takes <script.yaml|script.txt> --line 句子 [--line ...] [--count N] [--vary seed|temperature]
+    python -m dubbing_tool takes <script.yaml|script.txt> --line 句子 --promote 版本号
+
+进度以 JSON Lines 的形式输出到 stdout (每行一个事件)，其他提示信息输出到 stderr。
+此模块不导入任何界面相关的库，可以在没有图形环境的 Linux 机器或定时任务中运行。
+"""
+import os
+import sys
+import json
+import argparse
+import sqlite3
+import wave
+from threading import Lock, Thread
+from dubbing_tool.api_client import ApiClient
+from dubbing_tool.async_api_client import AsyncApiClient, AsyncBatchRunner, BackgroundEventLoop
+from dubbing_tool.batch import BatchGenerator, build_batch_jobs, build_generation_params, iter_batch_jobs, line_signature
+from dubbing_tool.cache import SynthesisCache
+from dubbing_tool.export import export_masters, DEFAULT_LINE_GAP, DEFAULT_SCENE_GAP
+from dubbing_tool.journal import JobJournal
+from dubbing_tool.manifest import OutputManifest, expected_outputs, sync_script_outputs
+from dubbing_tool.metrics import GenerationMetrics, script_metrics_dir, KIND_TAKES
+from dubbing_tool.postprocess import PostProcessor
+from dubbing_tool.script_parser import parse_script, get_all_dialogues, is_raw_script, iter_raw_script, raw_script_header
+from dubbing_tool.takes import generate_takes, list_takes, promote_take, take_path, DEFAULT_TAKE_COUNT, VARY_MODES
+from dubbing_tool.utils import load_config, get_app_dir, get_output_path
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_CANCELLED = 130
+
+
+class ProgressPrinter:
+    """
+    线程安全地向 stdout 输出 JSON Lines 进度事件。
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream if stream else sys.stdout
+        self._lock = Lock()
+
+    def emit(self, event: str, **fields):
+        line = json.dumps({"event": event, **fields}, ensure_ascii=False)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+
+def error(message: str):
+    print(message, file=sys.stderr)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m dubbing_tool", description="GPT-SoVITS 批量配音工具 (命令行)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    batch = subparsers.add_parser("batch", help="批量生成剧本中的音频")
+    batch.add_argument("script", help="剧本文件路径 (YAML 剧本或 \"角色：台词\" 格式的 .txt 原始剧本)")
+    batch.add_argument("--config", help="配置文件路径 (默认为程序目录下的 config.yaml)")
+    batch.add_argument("--output-dir", help="输出目录 (默认使用配置文件中的 output_dir)")
+    batch.add_argument("-w", "--workers", type=int, help="并发工作线程数 (默认使用配置文件中的 batch.max_workers)")
+    batch.add_argument("--async", dest="async_concurrency", type=int, metavar="N",
+                       help="改用 asyncio 客户端，在一个事件循环中同时进行 N 条任务 (默认使用配置文件中的 batch.async_concurrency，0 表示使用线程池)")
+    mode = batch.add_mutually_exclusive_group()
+    mode.add_argument("--only-missing", dest="force", action="store_false", help="只生成缺失的音频 (默认)")
+    mode.add_argument("--force", dest="force", action="store_true", help="重新生成所有音频，覆盖已有文件")
+    mode.add_argument("--resume", action="store_true",
+                      help="只继续任务日志中上次未完成的任务，不重新扫描输出目录")
+    batch.add_argument("--scene", action="append", default=[], metavar="SCENE",
+                       help="只处理指定场景，可以是场景名或从 0 开始的序号；可重复指定")
+    batch.add_argument("--stream", action="store_true",
+                       help="边读取 .txt 原始剧本边生成，不等待整个文件解析完 (不做按模型重排和剧本修改同步)")
+    batch.add_argument("--no-cache", action="store_true", help="不使用合成缓存")
+    batch.add_argument("--no-postprocess", action="store_true", help="不进行音频后处理 (即使配置中已启用)")
+    batch.add_argument("--metrics-dir", help="耗时报告的输出目录 (默认为剧本输出目录下的 .metrics)")
+    batch.add_argument("--no-metrics", action="store_true", help="不记录耗时报告")
+    batch.set_defaults(force=False)
+
+    export = subparsers.add_parser("export", help="把已生成的单句音频拼接为场景整轨和剧本整轨，并写出时间轴")
+    export.add_argument("script", help="剧本文件路径 (YAML 剧本或 .txt 原始剧本)")
+    export.add_argument("--config", help="配置文件路径 (默认为程序目录下的 config.yaml)")
+    export.add_argument("--output-dir", help="单句音频的输出目录 (默认使用配置文件中的 output_dir)")
+    export.add_argument("--export-dir", help="整轨的导出目录 (默认使用配置文件中的 export.dir)")
+    export.add_argument("--line-gap", type=float, help="句间静音秒数 (默认使用配置文件中的 export.line_gap)")
+    export.add_argument("--scene-gap", type=float, help="剧本整轨中场景之间的静音秒数 (默认使用配置文件中的 export.scene_gap)")
+    export.add_argument("--scene", action="append", default=[], metavar="SCENE",
+                        help="只导出指定场景，可以是场景名或从 0 开始的序号；可重复指定")
+
+    postprocess = subparsers.add_parser("postprocess", help="对已生成的音频进行后处理 (响度归一化、静音裁剪、重采样)")
+    postprocess.add_argument("script", help="剧本文件路径 (YAML 剧本或 .txt 原始剧本)")
+    postprocess.add_argument("--config", help="配置文件路径 (默认为程序目录下的 config.yaml)")
+    postprocess.add_argument("--output-dir", help="输出目录 (默认使用配置文件中的 output_dir)")
+    postprocess.add_argument("-w", "--workers", type=int, help="进程数 (默认使用配置文件中的 postprocess.workers 或 CPU 核数)")
+    postprocess.add_argument("--scene", action="append", default=[], metavar="SCENE",
+                             help="只处理指定场景，可以是场景名或从 0 开始的序号；可重复指定")
+
+    takes = subparsers.add_parser("takes", help="为指定的句子并发生成多个候选版本，或把某个版本设为正式音频")
+    takes.add_argument("script", help="剧本文件路径 (YAML 剧本或 .txt 原始剧本)")
+    takes.add_argument("--config", help="配置文件路径 (默认为程序目录下的 config.yaml)")
+    takes.add_argument("--output-dir", help="输出目录 (默认使用配置文件中的 output_dir)")
+    takes.add_argument("--line", action="append", required=True, metavar="LINE",
+                       help="句子的 line_id，或 \"场景序号:对话序号\" (从 0 开始)；可重复指定")
+    takes.add_argument("-n", "--count", type=int, help="每句生成的版本数 (默认使用配置文件中的 takes.count)")
+    takes.add_argument("--vary", choices=VARY_MODES, help="版本之间变化的参数 (默认使用配置文件中的 takes.vary)")
+    takes.add_argument("--seed", type=int, help="起始种子 (默认使用 inference_defaults.seed，为 -1 时随机)")
+    takes.add_argument("--promote", type=int, metavar="N", help="不合成，把第 N 个版本设为正式音频")
+    takes.add_argument("--no-cache", action="store_true", help="不使用合成缓存")
+    takes.add_argument("--no-postprocess", action="store_true", help="不进行音频后处理 (即使配置中已启用)")
+    takes.add_argument("--no-metrics", action="store_true", help="不记录耗时报告")
+    return parser
+
+
+def scene_matches(info: dict, scene_filters) -> bool:
+    return not scene_filters or info['scene_name'] in scene_filters or str(info['scene_idx']) in scene_filters
+
+
+def select_scenes(dialogues: list, scene_filters: list) -> list:
+    """按场景名或序号筛选对话；未指定筛选条件时返回全部。"""
+    if not scene_filters:
+        return dialogues
+    names = set(scene_filters)
+    return [info for info in dialogues if scene_matches(info, names)]
+
+
+def resolve_dir(path: str, from_args: bool, config_dir: str) -> str:
+    """命令行指定的相对路径基于当前目录，配置文件中的相对路径基于配置文件所在目录。"""
+    if os.path.isabs(path):
+        return path
+    return os.path.join(os.getcwd() if from_args else config_dir, path)
+
+
+def load_cli_config(args) -> tuple[dict | None, str]:
+    """加载 --config 指定的 (或程序目录下的) 配置文件，返回 (config, 配置文件所在目录)。"""
+    config_path = args.config if args.config else os.path.join(get_app_dir(), 'config.yaml')
+    config = load_config(config_path)
+    if config is None:
+        error(f"无法加载配置文件: {config_path}")
+    return config, os.path.dirname(os.path.abspath(config_path))
+
+
+def run_export(args, progress: ProgressPrinter) -> int:
+    config, config_dir = load_cli_config(args)
+    if config is None:
+        return EXIT_USAGE
+    export_config = config.get('export', {})
+    output_dir = resolve_dir(args.output_dir or config.get('output_dir', 'output'), bool(args.output_dir), config_dir)
+    export_dir = resolve_dir(args.export_dir or export_config.get('dir', 'export'), bool(args.export_dir), config_dir)
+
+    script_data = parse_script(args.script, character_models=config.get('character_models', {}))
+    if not script_data:
+        error(f"无法解析剧本: {args.script}")
+        return EXIT_USAGE
+    dialogues = select_scenes(get_all_dialogues(script_data), args.scene)
+    if not dialogues:
+        error(f"没有匹配的场景: {', '.join(args.scene)}" if args.scene else "剧本中没有对话。")
+        return EXIT_USAGE
+
+    line_gap = args.line_gap if args.line_gap is not None else export_config.get('line_gap', DEFAULT_LINE_GAP)
+    scene_gap = args.scene_gap if args.scene_gap is not None else export_config.get('scene_gap', DEFAULT_SCENE_GAP)
+    progress.emit("start", script=script_data.get('script_name', ''), total=len(dialogues), export_dir=export_dir)
+    try:
+        result = export_masters(script_data, dialogues, output_dir, export_dir, float(line_gap), float(scene_gap))
+    except (OSError, EOFError, wave.Error) as e:
+        error(f"导出失败: {e}")
+        return EXIT_FAILED
+    progress.emit("finish", **result)
+    if not result['exported']:
+        error("没有可导出的音频。")
+        return EXIT_FAILED
+    return EXIT_OK
+
+
+def run_postprocess(args, progress: ProgressPrinter) -> int:
+    config, config_dir = load_cli_config(args)
+    if config is None:
+        return EXIT_USAGE
+    output_dir = resolve_dir(args.output_dir or config.get('output_dir', 'output'), bool(args.output_dir), config_dir)
+
+    # 命令行显式调用时不要求配置中启用后处理，只使用其中的参数
+    postprocess_config = {**config.get('postprocess', {}), 'enabled': True}
+    if args.workers:
+        postprocess_config['workers'] = args.workers
+    postprocessor = PostProcessor.from_config(postprocess_config)
+    if postprocessor is None:
+        return EXIT_USAGE
+
+    script_data = parse_script(args.script, character_models=config.get('character_models', {}))
+    if not script_data:
+        error(f"无法解析剧本: {args.script}")
+        return EXIT_USAGE
+    manifest = OutputManifest.for_script(output_dir, script_data)
+    outputs = [(get_output_path(output_dir, script_data, info), info['line_id'])
+               for info in select_scenes(get_all_dialogues(script_data), args.scene)]
+    outputs = [(path, line_id) for path, line_id in outputs if path in manifest and path.lower().endswith(".wav")]
+    total = len(outputs)
+
+    progress.emit("start", script=script_data.get('script_name', ''), total=total, workers=postprocessor.workers)
+    counts = {'processed': 0, 'skipped': 0, 'failed': 0}
+    futures = [(path, line_id, postprocessor.submit(path)) for path, line_id in outputs]
+    try:
+        for done, (path, line_id, future) in enumerate(futures, start=1):
+            try:
+                record = future.result()
+            except Exception as e:
+                error(f"后处理 '{os.path.basename(path)}' 失败: {e}")
+                counts['failed'] += 1
+                progress.emit("line", status="failed", done=done, total=total, output_path=path)
+                continue
+            counts['skipped' if record['skipped'] else 'processed'] += 1
+            manifest.record(path, line_id)
+            progress.emit("line", status="skipped" if record['skipped'] else "done", done=done, total=total,
+                          output_path=path, gain_db=record['gain_db'], trim_start=record['trim_start'],
+                          trim_end=record['trim_end'], sample_rate=record['sample_rate'])
+    except KeyboardInterrupt:
+        error("收到中断信号，取消尚未开始的后处理...")
+        for _, _, future in futures:
+            future.cancel()
+    finally:
+        postprocessor.close()
+        manifest.save()
+    progress.emit("finish", **counts)
+    return EXIT_FAILED if counts['failed'] else EXIT_OK
+
+
+def find_lines(dialogues: list, selectors: list) -> tuple[list, list]:
+    """
+    按 line_id 或 "场景序号:对话序号" 查找对话。
+
+    :return: (找到的对话信息列表, 未找到的选择条件列表)。
+    """
+    by_id = {info['line_id']: info for info in dialogues}
+    by_position = {f"{info['scene_idx']}:{info['dialogue_idx']}": info for info in dialogues}
+    found, missing = [], []
+    for selector in selectors:
+        info = by_id.get(selector) or by_position.get(selector)
+        if info:
+            found.append(info)
+        else:
+            missing.append(selector)
+    return found, missing
+
+
+def run_takes(args, progress: ProgressPrinter) -> int:
+    config, config_dir = load_cli_config(args)
+    if config is None:
+        return EXIT_USAGE
+    takes_config = config.get('takes', {})
+    output_dir = resolve_dir(args.output_dir or config.get('output_dir', 'output'), bool(args.output_dir), config_dir)
+
+    script_data = parse_script(args.script, character_models=config.get('character_models', {}))
+    if not script_data:
+        error(f"无法解析剧本: {args.script}")
+        return EXIT_USAGE
+    character_models = {**config.get('character_models', {}), **script_data.get('character_models', {})}
+    lines, missing = find_lines(get_all_dialogues(script_data), args.line)
+    if missing:
+        error(f"剧本中没有这些句子: {', '.join(missing)}")
+        return EXIT_USAGE
+    manifest = OutputManifest.for_script(output_dir, script_data)
+
+    if args.promote is not None:
+        counts = {'promoted': 0, 'failed': 0}
+        progress.emit("start", script=script_data.get('script_name', ''), total=len(lines), promote=args.promote)
+        for info in lines:
+            output_path = get_output_path(output_dir, script_data, info)
+            path = take_path(output_path, args.promote)
+            if os.path.exists(path) and promote_take(path, output_path):
+                manifest.record(output_path, info['line_id'])
+                counts['promoted'] += 1
+                progress.emit("promoted", line_id=info['line_id'], take=args.promote, output_path=output_path)
+            else:
+                error(f"句子 {info['line_id']} 没有版本 {args.promote}: {path}")
+                counts['failed'] += 1
+        manifest.save()
+        progress.emit("finish", **counts)
+        return EXIT_FAILED if counts['failed'] else EXIT_OK
+
+    api_config = config.get('api', {})
+    if not (api_config.get('base_urls') or api_config.get('base_url')):
+        error("配置文件中缺少 API base_url (或 base_urls)。")
+        return EXIT_USAGE
+    inference_defaults = config.get('inference_defaults', {})
+    try:
+        api_client = ApiClient.from_config(api_config, inference_defaults)
+    except ValueError as e:
+        error(f"配置错误: {e}")
+        return EXIT_USAGE
+    cache = None if args.no_cache else SynthesisCache.from_config(config.get('cache'), config_dir)
+    postprocessor = None if args.no_postprocess else PostProcessor.from_config(config.get('postprocess'))
+    count = args.count or takes_config.get('count', DEFAULT_TAKE_COUNT)
+    vary = args.vary or takes_config.get('vary', VARY_MODES[0])
+    metrics = None if args.no_metrics or not config.get('batch', {}).get('metrics', True) else GenerationMetrics(KIND_TAKES)
+
+    progress.emit("start", script=script_data.get('script_name', ''), total=len(lines), count=count, vary=vary)
+    counts = {'succeeded': 0, 'failed': 0, 'skipped': 0}
+    try:
+        for info in lines:
+            model_name = character_models.get(info['character'])
+            if not model_name:
+                progress.emit("skipped", line_id=info['line_id'], character=info['character'], reason="未配置模型")
+                counts['skipped'] += 1
+                continue
+            output_path = get_output_path(output_dir, script_data, info)
+            overrides = {} if args.seed is None else {'seed': args.seed}
+            params = build_generation_params(inference_defaults, info['text'], model_name, info['emotion'], **overrides)
+            signature = line_signature(info, model_name, inference_defaults)
+
+            def on_take(number, path, success, info=info):
+                progress.emit("take", status="done" if success else "failed", line_id=info['line_id'],
+                              take=number, output_path=path)
+
+            results = generate_takes(api_client, output_path, params, count, vary, cache=cache,
+                                     postprocessor=postprocessor, on_take=on_take, signature=signature,
+                                     metrics=metrics, dialogue_info=info)
+            for _, _, success in results:
+                counts['succeeded' if success else 'failed'] += 1
+            progress.emit("line", line_id=info['line_id'], output_path=output_path,
+                          takes=[{'take': number, 'path': path, 'seed': take_params.get('seed'),
+                                  'temperature': take_params.get('temperature')}
+                                 for number, path, take_params in list_takes(output_path, signature)])
+    except KeyboardInterrupt:
+        error("收到中断信号，已停止生成后续句子的版本。")
+    finally:
+        api_client.close()
+        if postprocessor:
+            postprocessor.close()
+    metrics_summary = None
+    if metrics and metrics.records:
+        try:
+            report_path, prometheus_path = metrics.write(script_metrics_dir(output_dir, script_data))
+            report = metrics.report()
+            metrics_summary = {'report': report_path, 'prometheus': prometheus_path, 'total': report['total'],
+                               'rtf': report['rtf']}
+        except OSError as e:
+            error(f"保存耗时报告失败: {e}")
+    progress.emit("finish", **counts, scheduler=api_client.get_scheduler_stats(), metrics=metrics_summary)
+    return EXIT_FAILED if counts['failed'] else EXIT_OK
+
+
+def run_batch(args, progress: ProgressPrinter) -> int:
+    config, config_dir = load_cli_config(args)
+    if config is None:
+        return EXIT_USAGE
+
+    api_config = config.get('api', {})
+    if not (api_config.get('base_urls') or api_config.get('base_url')):
+        error("配置文件中缺少 API base_url (或 base_urls)。")
+        return EXIT_USAGE
+
+    output_dir = resolve_dir(args.output_dir or config.get('output_dir', 'output'), bool(args.output_dir), config_dir)
+
+    if args.stream and (args.resume or not is_raw_script(args.script)):
+        error("--stream 只能用于 .txt 原始剧本，且不能与 --resume 同时使用。")
+        return EXIT_USAGE
+
+    if args.stream:
+        # 流式模式只读取剧本信息，对话在生成过程中逐行读取
+        script_data = raw_script_header(args.script, config.get('character_models', {}))
+    else:
+        script_data = parse_script(args.script, character_models=config.get('character_models', {}))
+    if not script_data:
+        error(f"无法解析剧本: {args.script}")
+        return EXIT_USAGE
+
+    # 剧本内的角色映射优先于配置文件中的全局映射
+    character_models = {**config.get('character_models', {}), **script_data.get('character_models', {})}
+
+    if args.stream:
+        dialogues = (info for info in iter_raw_script(args.script) if scene_matches(info, set(args.scene)))
+    else:
+        dialogues = select_scenes(get_all_dialogues(script_data), args.scene)
+        if args.scene and not dialogues:
+            error(f"没有匹配的场景: {', '.join(args.scene)}")
+            return EXIT_USAGE
+
+    try:
+        journal = JobJournal.for_script(output_dir, script_data)
+    except sqlite3.Error as e:
+        error(f"无法打开任务日志: {e}")
+        return EXIT_USAGE
+
+    manifest = OutputManifest.for_script(output_dir, script_data)
+    if not args.resume and not args.stream:
+        sync_counts = sync_script_outputs(manifest, script_data, get_all_dialogues(script_data), character_models,
+                                          config.get('inference_defaults', {}), output_dir)
+        if sync_counts['moved'] or sync_counts['invalidated']:
+            error(f"剧本已修改: 移动 {sync_counts['moved']} 个未改动的音频，{sync_counts['invalidated']} 个过时音频移入 _orphaned")
+            journal.discard_unfinished()
+
+    def report_unmapped(info):
+        progress.emit("skipped", scene_idx=info['scene_idx'], dialogue_idx=info['dialogue_idx'],
+                      character=info['character'], reason="未配置模型")
+
+    unmapped = []
+    if args.resume:
+        # 丢弃已在别处重新生成、或与当前剧本不再对应的任务
+        expected = expected_outputs(script_data, get_all_dialogues(script_data), character_models,
+                                    config.get('inference_defaults', {}), output_dir)
+        jobs = [job for job in journal.unfinished_jobs(manifest, expected) if scene_matches(job.dialogue_info, set(args.scene))]
+    elif args.stream:
+        if not args.force:
+            dialogues = (info for info in dialogues if get_output_path(output_dir, script_data, info) not in manifest)
+
+        def stream_jobs():
+            for job in iter_batch_jobs(script_data, dialogues, character_models,
+                                       config.get('inference_defaults', {}), output_dir, on_unmapped=report_unmapped):
+                journal.enqueue([job])
+                yield job
+        jobs = stream_jobs()
+    else:
+        if not args.force:
+            dialogues = [info for info in dialogues if get_output_path(output_dir, script_data, info) not in manifest]
+        jobs, unmapped = build_batch_jobs(script_data, dialogues, character_models,
+                                          config.get('inference_defaults', {}), output_dir)
+        journal.enqueue(jobs)
+    for info in unmapped:
+        report_unmapped(info)
+
+    batch_config = dict(config.get('batch', {}))
+    if args.workers:
+        batch_config['max_workers'] = args.workers
+    if args.async_concurrency is not None:
+        batch_config['async_concurrency'] = args.async_concurrency
+    if args.stream:
+        # 按模型重排需要先取出全部任务，流式模式下按剧本顺序边读边生成
+        batch_config['model_affinity'] = False
+
+    try:
+        api_client = ApiClient.from_config(api_config, config.get('inference_defaults', {}))
+    except ValueError as e:
+        error(f"配置错误: {e}")
+        return EXIT_USAGE
+    cache = None if args.no_cache else SynthesisCache.from_config(config.get('cache'), config_dir)
+    postprocessor = None if args.no_postprocess else PostProcessor.from_config(config.get('postprocess'))
+    metrics = None if args.no_metrics or not batch_config.get('metrics', True) else GenerationMetrics()
+    generator = BatchGenerator.from_config(api_client, batch_config, cache=cache, journal=journal, manifest=manifest,
+                                           postprocessor=postprocessor, metrics=metrics)
+    event_loop = async_client = None
+    runner = generator
+    if batch_config.get('async_concurrency', 0) > 0:
+        # 所有任务在一个后台事件循环中并发进行，与线程池共用后端、调度器、缓存和任务日志
+        event_loop = BackgroundEventLoop()
+        async_client = AsyncApiClient(api_client, max_concurrency=batch_config['async_concurrency'])
+        runner = AsyncBatchRunner(generator, async_client, event_loop, batch_config['async_concurrency'])
+
+    progress.emit("start", script=script_data.get('script_name', ''), total=len(jobs) if not args.stream else None,
+                  skipped=len(unmapped), workers=runner.max_workers, output_dir=output_dir)
+
+    def on_progress(job, success, done, total):
+        info = job.dialogue_info
+        progress.emit("line", status="done" if success else "failed", done=done, total=total,
+                      scene_idx=info['scene_idx'], dialogue_idx=info['dialogue_idx'],
+                      scene_name=info['scene_name'], character=info['character'], output_path=job.output_path)
+
+    result = {}
+    worker = Thread(target=lambda: result.update(runner.run(jobs, on_progress=on_progress)), daemon=True)
+    worker.start()
+    try:
+        while worker.is_alive():
+            worker.join(0.5)
+    except KeyboardInterrupt:
+        error("收到中断信号，等待进行中的任务结束...")
+        runner.cancel()
+        worker.join()
+    if event_loop:
+        event_loop.run(async_client.close())
+        event_loop.stop()
+
+    metrics_summary = None
+    if metrics:
+        metrics_dir = args.metrics_dir or script_metrics_dir(output_dir, script_data)
+        try:
+            report_path, prometheus_path = metrics.write(metrics_dir)
+            report = metrics.report()
+            metrics_summary = {'report': report_path, 'prometheus': prometheus_path, 'phases': report['phases'],
+                               'total': report['total'], 'rtf': report['rtf']}
+        except OSError as e:
+            error(f"保存耗时报告失败: {e}")
+
+    progress.emit("finish", **result, connections=api_client.get_connection_stats(),
+                  backends=api_client.get_backend_stats(), scheduler=api_client.get_scheduler_stats(),
+                  cache=cache.get_stats() if cache else None, metrics=metrics_summary,
+                  journal=journal.get_summary(), failures=journal.get_failures())
+    api_client.close()
+    journal.close()
+    if postprocessor:
+        postprocessor.close()
+
+    if result.get('cancelled'):
+        return EXIT_CANCELLED
+    return EXIT_FAILED if result.get('failed') else EXIT_OK
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    commands = {"batch": run_batch, "export": run_export, "postprocess": run_postprocess, "takes": run_takes}
+    if args.command not in commands:
+        return EXIT_USAGE
+
+    # 其他模块通过 print 输出的提示信息改写到 stderr，保证 stdout 上只有 JSON Lines
+    progress_stream = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        return commands[args.command](args, ProgressPrinter(progress_stream))
+    finally:
+        sys.stdout = progress_stream
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,165 @@
+import os
+import json
+import wave
+from dubbing_tool.audio import silence_bytes
+from dubbing_tool.utils import atomic_open, get_output_path, sanitize_filename
+
+DEFAULT_LINE_GAP = 0.5
+DEFAULT_SCENE_GAP = 2.0
+TIMINGS_FILENAME = "timings.json"
+# 每次从单句音频中读取的帧数：内存占用与音频总长度无关
+EXPORT_CHUNK_FRAMES = 64 * 1024
+
+
+class _MasterWriter:
+    """一条正在写入的整轨 (原子写入)，记录已写入的帧数以计算时间轴。"""
+
+    def __init__(self, path: str, audio_format: tuple):
+        self.path = path
+        self.frames = 0
+        self.channels, self.sample_width, self.frame_rate = audio_format
+        self._context = atomic_open(path, 'wb')
+        self._wav = wave.open(self._context.__enter__(), 'wb')
+        self._wav.setnchannels(self.channels)
+        self._wav.setsampwidth(self.sample_width)
+        self._wav.setframerate(self.frame_rate)
+
+    @property
+    def seconds(self) -> float:
+        return round(self.frames / self.frame_rate, 3)
+
+    def write(self, data: bytes):
+        self._wav.writeframesraw(data)
+        self.frames += len(data) // (self.channels * self.sample_width)
+
+    def write_silence(self, seconds: float):
+        if seconds > 0:
+            self.write(silence_bytes(self.channels, self.sample_width, self.frame_rate, seconds))
+
+    def close(self, success: bool = True):
+        """完成写入 (修正 WAV 头中的长度) 并重命名为目标路径；success 为 False 时丢弃。"""
+        try:
+            self._wav.close()
+        finally:
+            if success:
+                self._context.__exit__(None, None, None)
+            else:
+                self._context.__exit__(RuntimeError, RuntimeError("导出已取消"), None)
+
+
+def _read_format(path: str) -> tuple | None:
+    try:
+        with wave.open(path, 'rb') as w:
+            return (w.getnchannels(), w.getsampwidth(), w.getframerate())
+    except (OSError, EOFError, wave.Error):
+        return None
+
+
+def export_masters(script_data: dict, dialogues, output_dir: str, export_dir: str,
+                   line_gap: float = DEFAULT_LINE_GAP, scene_gap: float = DEFAULT_SCENE_GAP,
+                   on_progress=None, cancel_event=None) -> dict:
+    """
+    把已生成的单句音频按剧本顺序拼接为每个场景一条整轨，以及整个剧本一条整轨，并写出时间轴。
+
+    输出位于 <export_dir>/<剧本名>/：
+    - <场景序号>_<场景名>.wav：场景整轨，句与句之间插入 line_gap 秒静音；
+    - <剧本名>.wav：剧本整轨，同一场景内的句间隔为 line_gap，场景之间为 scene_gap；
+    - timings.json：每句对话在场景整轨和剧本整轨中的起止时间 (秒)，以及缺失或被跳过的对话。
+
+    每句音频按 EXPORT_CHUNK_FRAMES 帧分块读出，同时写入场景整轨和剧本整轨，
+    内存占用与剧本长度无关，拼接上千句也是线性时间。
+    所有音频须为相同格式的 WAV (以第一句可用的音频为准)，格式不同的句子会被跳过并记录在 timings.json 中。
+
+    :param script_data: 剧本数据。
+    :param dialogues: 要导出的对话信息 (来自 get_all_dialogues，按剧本顺序)。
+    :param output_dir: 单句音频的输出根目录。
+    :param export_dir: 整轨的导出根目录。
+    :param line_gap: 句间静音 (秒)。
+    :param scene_gap: 剧本整轨中场景之间的静音 (秒)。
+    :param on_progress: 每处理一句后的回调 on_progress(done, total)。
+    :param cancel_event: 可选的 threading.Event，被设置时中止导出 (不留下不完整的整轨)。
+    :return: {'scenes', 'exported', 'missing', 'skipped', 'duration', 'cancelled', 'dir'}。
+    """
+    script_name = sanitize_filename(script_data.get('script_name', 'UntitledScript'))
+    target_dir = os.path.join(export_dir, script_name)
+    dialogues = list(dialogues)
+    paths = [get_output_path(output_dir, script_data, info) for info in dialogues]
+
+    audio_format = next((fmt for fmt in map(_read_format, filter(os.path.exists, paths)) if fmt), None)
+    summary = {'scenes': 0, 'exported': 0, 'missing': 0, 'skipped': 0, 'duration': 0.0,
+               'cancelled': False, 'dir': target_dir}
+    if audio_format is None:
+        return summary
+
+    timings = {'script_name': script_data.get('script_name', ''), 'line_gap': line_gap, 'scene_gap': scene_gap,
+               'sample_rate': audio_format[2], 'master': f"{script_name}.wav", 'scenes': [], 'missing': [], 'skipped': []}
+    script_master = _MasterWriter(os.path.join(target_dir, f"{script_name}.wav"), audio_format)
+    scene_master = None
+    scene_entry = None
+    open_writers = [script_master]
+    success = False
+    try:
+        for done, (info, path) in enumerate(zip(dialogues, paths), start=1):
+            if cancel_event is not None and cancel_event.is_set():
+                summary['cancelled'] = True
+                return summary
+            line = {'scene_idx': info['scene_idx'], 'dialogue_idx': info['dialogue_idx'], 'line_id': info.get('line_id'),
+                    'character': info.get('character'), 'text': info.get('text'), 'file': os.path.relpath(path, output_dir)}
+            fmt = _read_format(path) if os.path.exists(path) else None
+            if fmt is None or fmt != audio_format:
+                if fmt is None:
+                    timings['missing'].append(line)
+                    summary['missing'] += 1
+                else:
+                    timings['skipped'].append({**line, 'reason': f"音频格式 {fmt} 与整轨 {audio_format} 不一致"})
+                    summary['skipped'] += 1
+                if on_progress:
+                    on_progress(done, len(dialogues))
+                continue
+
+            if scene_entry is None or scene_entry['scene_idx'] != info['scene_idx']:
+                if scene_master is not None:
+                    scene_master.close()
+                    open_writers.remove(scene_master)
+                    scene_entry['duration'] = scene_master.seconds
+                    scene_entry['script_end'] = script_master.seconds
+                    script_master.write_silence(scene_gap)
+                scene_file = f"{info['scene_idx']:02d}_{sanitize_filename(info['scene_name'])}.wav"
+                scene_master = _MasterWriter(os.path.join(target_dir, scene_file), audio_format)
+                open_writers.append(scene_master)
+                scene_entry = {'scene_idx': info['scene_idx'], 'scene_name': info['scene_name'], 'file': scene_file,
+                               'script_start': script_master.seconds, 'lines': []}
+                timings['scenes'].append(scene_entry)
+            elif line_gap > 0:
+                scene_master.write_silence(line_gap)
+                script_master.write_silence(line_gap)
+
+            line.update(start=scene_master.seconds, script_start=script_master.seconds)
+            with wave.open(path, 'rb') as clip:
+                while data := clip.readframes(EXPORT_CHUNK_FRAMES):
+                    scene_master.write(data)
+                    script_master.write(data)
+            line.update(end=scene_master.seconds, script_end=script_master.seconds)
+            scene_entry['lines'].append(line)
+            summary['exported'] += 1
+            if on_progress:
+                on_progress(done, len(dialogues))
+
+        if scene_master is not None:
+            scene_entry['duration'] = scene_master.seconds
+            scene_entry['script_end'] = script_master.seconds
+        timings['duration'] = script_master.seconds
+        for writer in open_writers:
+            writer.close()
+        open_writers.clear()
+        success = True
+
+        with atomic_open(os.path.join(target_dir, TIMINGS_FILENAME), 'w', encoding='utf-8') as f:
+            json.dump(timings, f, ensure_ascii=False, indent=2)
+        summary['scenes'] = len(timings['scenes'])
+        summary['duration'] = timings['duration']
+        return summary
+    finally:
+        # 出错或取消时丢弃尚未完成的整轨
+        for writer in open_writers:
+            writer.close(success)
@@ -1,21 +1,57 @@
 import customtkinter as ctk
 import tkinter as tk
 from tkinter import filedialog, ttk, TclError
-import json
-from dubbing_tool.script_parser import parse_script
+from dubbing_tool.script_parser import parse_script, get_all_dialogues, get_dialogue_table
 from dubbing_tool.api_client import ApiClient
-from dubbing_tool.utils import sanitize_filename
+from dubbing_tool.batch import (BatchGenerator, build_batch_jobs, build_generation_params, line_signature,
+                                save_audio_metadata)
+from dubbing_tool.export import export_masters, DEFAULT_LINE_GAP, DEFAULT_SCENE_GAP
+from dubbing_tool.journal import JobJournal
+from dubbing_tool.manifest import OutputManifest, expected_outputs, sync_script_outputs
+from dubbing_tool.prefetch import Prefetcher, DEFAULT_PREFETCH_DEPTH
+from dubbing_tool.scheduler import PRIORITY_INTERACTIVE, PRIORITY_PREFETCH
+from dubbing_tool.metrics import (GenerationMetrics, LineTrace, script_metrics_dir, tracing, measure as measure_phase,
+                                  KIND_INTERACTIVE, PHASE_POSTPROCESS)
+from dubbing_tool.takes import (generate_takes, list_takes, promote_take, DEFAULT_TAKE_COUNT,
+                                VARY_SEED, VARY_TEMPERATURE)
+from dubbing_tool.utils import get_output_path, load_config
+from dubbing_tool.virtual_list import VirtualList
+from dubbing_tool.ui_queue import (UiUpdateQueue, UI_UPDATE_INTERVAL_MS, SCHEDULER_STATS_INTERVAL_MS, format_duration,
+                                   format_scheduler_stats)
 import os
+import json
+import time
+import sqlite3
 from threading import Thread
 import winsound
 
+# 详情页中版本变化方式的显示名称
+TAKE_VARY_LABELS = {"种子": VARY_SEED, "温度": VARY_TEMPERATURE}
+
+
 class App(ctk.CTk):
-    def __init__(self, api_client, output_dir):
+    def __init__(self, api_client, output_dir, batch_config=None, cache=None, export_dir='export', export_config=None,
+                 postprocessor=None, prefetch_config=None, takes_config=None, character_models=None):
         super().__init__()
 
         self.api_client = api_client
         self.output_dir = output_dir
         self.script_character_mapping = {}
+        # 配置文件中的角色映射，原始文本剧本中未配置的角色使用它
+        self.character_models = character_models if character_models else {}
+        self.batch_config = batch_config if batch_config else {}
+        self.cache = cache
+        self.export_dir = export_dir
+        self.export_config = export_config if export_config else {}
+        self.postprocessor = postprocessor
+        prefetch_config = prefetch_config if prefetch_config else {}
+        self.prefetcher = Prefetcher(self.run_prefetch_job, prefetch_config.get('depth', DEFAULT_PREFETCH_DEPTH))
+        self.takes_config = takes_config if takes_config else {}
+        self.batch_generator = None
+        self.journal = None
+        self.manifest = None
+        # 当前剧本在界面中逐句生成 (包括预取和多版本) 的耗时记录，打开剧本时创建
+        self.line_metrics = None
 
         self.title("GPT-SoVITS 配音工具")
         self.geometry("1200x900")
@@ -25,7 +61,10 @@ class App(ctk.CTk):
         # --- 状态变量 ---
         self.script_data = None
         self.current_dialogue_info = None
-        self.overview_widgets = {}
+        self.overview_widgets = {}  # dialogue_id -> 当前显示该对话的行控件 (只包含可见的行)
+        self.overview_dialogues = []
+        # 工作线程不直接修改控件，而是通过此队列，由界面线程定时合并应用
+        self.ui_updates = UiUpdateQueue()
 
         # ---- UI布局 ----
         self.grid_columnconfigure(1, weight=1)
@@ -34,7 +73,8 @@ class App(ctk.CTk):
         # 左侧框架
         self.left_frame = ctk.CTkFrame(self, width=300, corner_radius=0)
         self.left_frame.grid(row=0, column=0, rowspan=2, sticky="nsew")
-        self.left_frame.grid_rowconfigure(2, weight=1)
+        self.left_frame.grid_rowconfigure(3, weight=1)
+        self.prefetch_var = ctk.BooleanVar(value=prefetch_config.get('enabled', False))
         
         self.open_button = ctk.CTkButton(self.left_frame, text="打开剧本 (YAML)", command=self.open_script)
         self.open_button.grid(row=0, column=0, padx=10, pady=10, sticky="ew")
@@ -42,10 +82,22 @@ class App(ctk.CTk):
         self.batch_generate_button = ctk.CTkButton(self.left_frame, text="批量生成缺失音频", command=self.batch_generate, state="disabled")
         self.batch_generate_button.grid(row=1, column=0, padx=10, pady=10, sticky="ew")
 
+        self.export_button = ctk.CTkButton(self.left_frame, text="导出场景/剧本整轨", command=self.export_masters, state="disabled")
+        self.export_button.grid(row=2, column=0, padx=10, pady=(0, 10), sticky="ew")
+
         self.tree = ttk.Treeview(self.left_frame, show="tree headings")
-        self.tree.grid(row=2, column=0, padx=10, pady=10, sticky="nsew")
+        self.tree.grid(row=3, column=0, padx=10, pady=10, sticky="nsew")
         self.tree.bind("<<TreeviewSelect>>", self.on_tree_select)
 
+        self.prefetch_switch = ctk.CTkSwitch(self.left_frame, text=f"预取后续 {self.prefetcher.depth} 句缺失音频",
+                                             variable=self.prefetch_var, command=self.on_prefetch_toggled)
+        self.prefetch_switch.grid(row=4, column=0, padx=10, pady=(0, 10), sticky="w")
+
+        # 设置了并发上限时显示各优先级的请求队列
+        self.scheduler_label = ctk.CTkLabel(self.left_frame, text="", anchor="w", justify="left", wraplength=280)
+        if self.api_client.scheduler:
+            self.scheduler_label.grid(row=5, column=0, padx=10, pady=(0, 10), sticky="ew")
+
         # 右侧主框架 (Tab视图)
         self.main_tab_view = ctk.CTkTabview(self, anchor="w")
         self.main_tab_view.grid(row=0, column=1, padx=10, pady=10, sticky="nsew")
@@ -59,10 +111,11 @@ class App(ctk.CTk):
         self.overview_info_frame = ctk.CTkFrame(self.overview_tab)
         self.overview_info_frame.pack(fill="x", padx=5, pady=(5, 0))
         
-        # 可滚动的对话列表区域
-        self.overview_scroll_frame = ctk.CTkScrollableFrame(self.overview_tab)
-        self.overview_scroll_frame.pack(fill="both", expand=True, padx=5, pady=(5, 5))
-        ctk.CTkLabel(self.overview_scroll_frame, text="请先从左侧打开一个剧本文件。").pack(pady=20)
+        # 对话列表区域（虚拟化，只为可见的行创建控件）
+        overview_columns = [("场景", 140, 0), ("角色", 90, 0), ("情感", 70, 0), ("对话", 0, 1), ("状态", 50, 0), ("", 65, 0), ("", 65, 0)]
+        self.overview_list = VirtualList(self.overview_tab, overview_columns, self.create_overview_row, self.bind_overview_row,
+                                         empty_text="请先从左侧打开一个剧本文件。")
+        self.overview_list.pack(fill="both", expand=True, padx=5, pady=(5, 5))
         
         # --- 详情页面 ---
         self.details_frame = ctk.CTkFrame(self.details_tab)
@@ -80,24 +133,80 @@ class App(ctk.CTk):
         self.status_bar = ctk.CTkLabel(self, text="准备就绪", anchor="w")
         self.status_bar.grid(row=1, column=1, rowspan=2, padx=10, pady=5, sticky="ew")
 
+        self.after(UI_UPDATE_INTERVAL_MS, self.drain_ui_updates)
+        if self.api_client.scheduler:
+            self.after(SCHEDULER_STATS_INTERVAL_MS, self.refresh_scheduler_stats)
+
+    def refresh_scheduler_stats(self):
+        """定时刷新请求队列的显示。"""
+        try:
+            stats = self.api_client.get_scheduler_stats()
+            if stats:
+                self.scheduler_label.configure(text=format_scheduler_stats(stats))
+        finally:
+            self.after(SCHEDULER_STATS_INTERVAL_MS, self.refresh_scheduler_stats)
+
+    def drain_ui_updates(self):
+        """在界面线程中定时应用工作线程积累的更新 (见 UiUpdateQueue)。"""
+        try:
+            status, generated, calls = self.ui_updates.drain()
+            for dialogue_info in generated:
+                self.mark_dialogue_generated(dialogue_info, update_details=False)
+            if generated:
+                self.update_play_button_state()
+            for func, args in calls:
+                try:
+                    func(*args)
+                except Exception as e:
+                    print(f"更新界面时出错: {e}")
+            if status is not None:
+                self.status_bar.configure(text=status)
+        finally:
+            self.after(UI_UPDATE_INTERVAL_MS, self.drain_ui_updates)
+
     def open_script(self):
         winsound.PlaySound(None, winsound.SND_PURGE)
         file_path = filedialog.askopenfilename(
-            title="选择 YAML 剧本文件",
-            filetypes=(("YAML files", "*.yaml"), ("All files", "*.*"))
+            title="选择剧本文件",
+            filetypes=(("剧本文件", "*.yaml *.yml *.txt"), ("YAML files", "*.yaml"), ("原始剧本", "*.txt"), ("All files", "*.*"))
         )
         if not file_path: return
 
-        self.script_data = parse_script(file_path)
+        self.prefetcher.cancel()
+        self.script_data = parse_script(file_path, character_models=self.character_models)
         if not self.script_data:
             self.status_bar.configure(text=f"错误: 无法解析剧本 {os.path.basename(file_path)}")
             return
         
         self.script_character_mapping = self.script_data.get('character_models', {})
+        if self.manifest:
+            self.manifest.save()
+        self.manifest = OutputManifest.for_script(self.output_dir, self.script_data)
+        self.line_metrics = GenerationMetrics(KIND_INTERACTIVE) if self.batch_config.get('metrics', True) else None
+        # 剧本修改后，把未改动对话的已有音频移到新路径，只有内容变化的对话需要重新生成
+        sync_counts = sync_script_outputs(self.manifest, self.script_data, self.get_all_dialogues(),
+                                          self.script_character_mapping, self.api_client.default_params, self.output_dir)
         self.populate_tree()
         self.populate_overview_page()
         self.batch_generate_button.configure(state="normal")
-        self.status_bar.configure(text=f"已加载剧本: {self.script_data.get('script_name', '无标题')}")
+        self.export_button.configure(state="normal")
+        status = f"已加载剧本: {self.script_data.get('script_name', '无标题')}"
+        if sync_counts['moved'] or sync_counts['invalidated']:
+            status += f" (剧本已修改: 移动 {sync_counts['moved']} 个音频，{sync_counts['invalidated']} 句需要重新生成)"
+
+        if self.journal:
+            self.journal.close()
+        try:
+            self.journal = JobJournal.for_script(self.output_dir, self.script_data)
+            if sync_counts['moved'] or sync_counts['invalidated']:
+                self.journal.discard_unfinished()
+            unfinished = len(self.resumable_jobs())
+            if unfinished:
+                status += f" (上次批量生成有 {unfinished} 句未完成，点击批量生成将继续)"
+        except sqlite3.Error as e:
+            print(f"无法打开任务日志: {e}")
+            self.journal = None
+        self.status_bar.configure(text=status)
 
     def populate_tree(self):
         for item in self.tree.get_children(): self.tree.delete(item)
@@ -112,9 +221,6 @@ class App(ctk.CTk):
         for widget in self.overview_info_frame.winfo_children(): 
             widget.destroy()
         
-        # 清空滚动区域
-        for widget in self.overview_scroll_frame.winfo_children(): 
-            widget.destroy()
         self.overview_widgets.clear()
 
         # 剧本信息区域（固定在顶部）
@@ -140,47 +246,52 @@ class App(ctk.CTk):
         ctk.CTkLabel(self.overview_info_frame, text="提示: 剧本信息请到配置文件中修改", 
                     font=ctk.CTkFont(size=12), text_color="gray").grid(row=2, column=0, columnspan=2, padx=10, pady=2, sticky="w")
 
-        # 对话列表区域（可滚动）
-        list_frame = ctk.CTkFrame(self.overview_scroll_frame)
-        list_frame.pack(fill="both", expand=True, padx=5, pady=5)
-        
-        # 为总览页的表格布局设置列配置
-        list_frame.grid_columnconfigure(0, minsize=140) # Scene
-        list_frame.grid_columnconfigure(1, minsize=90)  # Character
-        list_frame.grid_columnconfigure(2, minsize=70)  # Emotion
-        list_frame.grid_columnconfigure(3, weight=1)    # Text
-        list_frame.grid_columnconfigure(4, minsize=50)  # Status
-        list_frame.grid_columnconfigure(5, minsize=65)  # Button
-        list_frame.grid_columnconfigure(6, minsize=65)  # Button
-
-        # 添加表头
-        header_font = ctk.CTkFont(weight="bold")
-        headers = ["场景", "角色", "情感", "对话", "状态"]
-        for col, header_text in enumerate(headers):
-            ctk.CTkLabel(list_frame, text=header_text, font=header_font).grid(row=0, column=col, sticky="w", padx=5)
-        
-        for i, dialogue_info in enumerate(self.get_all_dialogues()):
-            dialogue_id = f"dialogue_{dialogue_info['scene_idx']}_{dialogue_info['dialogue_idx']}"
-            
-            ctk.CTkLabel(list_frame, text=dialogue_info['scene_name'], anchor="w").grid(row=i+1, column=0, sticky="ew", padx=5, pady=2)
-            ctk.CTkLabel(list_frame, text=dialogue_info['character'], anchor="w").grid(row=i+1, column=1, sticky="ew", padx=5, pady=2)
-            ctk.CTkLabel(list_frame, text=dialogue_info['emotion'], anchor="w").grid(row=i+1, column=2, sticky="ew", padx=5, pady=2)
-            ctk.CTkLabel(list_frame, text=dialogue_info['text'], anchor="w", wraplength=350).grid(row=i+1, column=3, sticky="ew", padx=5, pady=2)
+        # 对话列表：只需设置行数，可见的行在滚动时按需绑定
+        self.overview_dialogues = self.get_all_dialogues()
+        self.overview_list.set_count(len(self.overview_dialogues))
 
-            output_path = self.get_output_path(dialogue_info)
-            status, color = ("已生成", "green") if os.path.exists(output_path) else ("缺失", "red")
-            
-            status_label = ctk.CTkLabel(list_frame, text=status, width=40, text_color=color)
-            status_label.grid(row=i+1, column=4, padx=5, pady=2)
+    def create_overview_row(self, row_frame):
+        """创建总览列表中的一行控件 (由 VirtualList 复用)。"""
+        widgets = {
+            'scene_label': ctk.CTkLabel(row_frame, anchor="w"),
+            'character_label': ctk.CTkLabel(row_frame, anchor="w"),
+            'emotion_label': ctk.CTkLabel(row_frame, anchor="w"),
+            'text_label': ctk.CTkLabel(row_frame, anchor="w"),
+            'status_label': ctk.CTkLabel(row_frame, width=40),
+            'regen_button': ctk.CTkButton(row_frame, text="生成", width=60),
+            'play_button': ctk.CTkButton(row_frame, text="播放", width=60),
+            'dialogue_id': None,
+        }
+        widgets['scene_label'].grid(row=0, column=0, sticky="ew", padx=5, pady=2)
+        widgets['character_label'].grid(row=0, column=1, sticky="ew", padx=5, pady=2)
+        widgets['emotion_label'].grid(row=0, column=2, sticky="ew", padx=5, pady=2)
+        widgets['text_label'].grid(row=0, column=3, sticky="ew", padx=5, pady=2)
+        widgets['status_label'].grid(row=0, column=4, padx=5, pady=2)
+        widgets['regen_button'].grid(row=0, column=5, padx=5, pady=2)
+        widgets['play_button'].grid(row=0, column=6, padx=5, pady=2)
+        return widgets
 
-            regen_button = ctk.CTkButton(list_frame, text="生成", width=60, command=lambda info=dialogue_info: self.perform_audio_generation(info))
-            regen_button.grid(row=i+1, column=5, padx=5, pady=2)
+    def bind_overview_row(self, widgets, index):
+        """把一行控件绑定到第 index 条对话，并登记到 overview_widgets 以便单独更新状态。"""
+        dialogue_info = self.overview_dialogues[index]
+        dialogue_id = f"dialogue_{dialogue_info['scene_idx']}_{dialogue_info['dialogue_idx']}"
+        if widgets['dialogue_id'] and self.overview_widgets.get(widgets['dialogue_id']) is widgets:
+            del self.overview_widgets[widgets['dialogue_id']]
+        widgets['dialogue_id'] = dialogue_id
+        self.overview_widgets[dialogue_id] = widgets
 
-            play_button = ctk.CTkButton(list_frame, text="播放", width=60, command=lambda p=output_path: self.perform_audio_play(p))
-            if status == "缺失": play_button.configure(state="disabled")
-            play_button.grid(row=i+1, column=6, padx=5, pady=2)
-            
-            self.overview_widgets[dialogue_id] = {'status_label': status_label, 'play_button': play_button}
+        text = dialogue_info['text']
+        widgets['scene_label'].configure(text=dialogue_info['scene_name'])
+        widgets['character_label'].configure(text=dialogue_info['character'])
+        widgets['emotion_label'].configure(text=dialogue_info['emotion'])
+        widgets['text_label'].configure(text=text if len(text) <= 40 else text[:40] + "…")
+
+        output_path = self.get_output_path(dialogue_info)
+        generated = self.is_generated(output_path)
+        widgets['status_label'].configure(text="已生成" if generated else "缺失", text_color="green" if generated else "red")
+        widgets['regen_button'].configure(command=lambda info=dialogue_info: self.perform_audio_generation(info))
+        widgets['play_button'].configure(command=lambda p=output_path: self.perform_audio_play(p),
+                                         state="normal" if generated else "disabled")
 
     def on_tree_select(self, event):
         winsound.PlaySound(None, winsound.SND_PURGE)
@@ -188,15 +299,50 @@ class App(ctk.CTk):
         if not selected_id or not selected_id[0].startswith("dialogue_"):
             self.clear_main_frame()
             self.current_dialogue_info = None
+            self.prefetcher.cancel()
             return
         
         _, scene_idx, dialogue_idx = selected_id[0].split('_')
-        dialogue = self.script_data["scenes"][int(scene_idx)]["dialogues"][int(dialogue_idx)]
-        scene_name = self.script_data["scenes"][int(scene_idx)]["scene_name"]
-        
-        self.current_dialogue_info = {"scene_idx": int(scene_idx), "dialogue_idx": int(dialogue_idx), "scene_name": scene_name, **dialogue}
+        self.current_dialogue_info = get_dialogue_table(self.script_data).find(int(scene_idx), int(dialogue_idx))
         self.display_dialogue_details()
         self.main_tab_view.set("详情编辑")
+        self.schedule_prefetch()
+
+    def on_prefetch_toggled(self):
+        if self.prefetch_var.get():
+            self.schedule_prefetch()
+        else:
+            self.prefetcher.cancel()
+
+    def schedule_prefetch(self):
+        """把当前对话之后的 depth 句缺失音频交给后台预取 (替换之前尚未开始的预取)。"""
+        if not self.prefetch_var.get() or not self.current_dialogue_info or self.batch_generator:
+            self.prefetcher.cancel()
+            return
+        table = get_dialogue_table(self.script_data)
+        start = table.index_of(self.current_dialogue_info['scene_idx'], self.current_dialogue_info['dialogue_idx']) + 1
+        upcoming = []
+        for index in range(start, len(table)):
+            info = table[index]
+            if self.script_character_mapping.get(info.get('character')) and not self.is_generated(self.get_output_path(info)):
+                upcoming.append(info)
+                if len(upcoming) >= self.prefetcher.depth:
+                    break
+        jobs, _ = build_batch_jobs(self.script_data, upcoming, self.script_character_mapping,
+                                   self.api_client.default_params, self.output_dir)
+        self.prefetcher.schedule(jobs)
+
+    def run_prefetch_job(self, job):
+        """在预取线程中调用：生成并保存一句 (已生成的跳过)。"""
+        if self.is_generated(job.output_path):
+            return True
+        with self.api_client.request_priority(PRIORITY_PREFETCH):
+            return self.generate_and_record(job.dialogue_info, job.output_path, job.params, job.signature)
+
+    def on_details_edited(self, *args):
+        """详情页中的文本或参数被修改：用户正在调整当前句，取消尚未开始的预取。"""
+        if self.prefetcher.pending:
+            self.prefetcher.cancel()
 
     def display_dialogue_details(self):
         self.clear_main_frame()
@@ -302,49 +448,183 @@ class App(ctk.CTk):
         self.play_button = ctk.CTkButton(button_frame, text="播放音频", command=self.play_audio_for_current_details)
         self.play_button.pack(side="left", padx=10)
         self.update_play_button_state()
+
+        # 多版本：并发生成多个种子 (或温度) 的候选版本，试听后把选中的版本设为正式音频
+        takes_frame = ctk.CTkFrame(self.details_frame)
+        takes_frame.grid(row=10, column=0, columnspan=2, padx=10, pady=(0, 5), sticky="ew")
+        ctk.CTkLabel(takes_frame, text="多版本:").pack(side="left", padx=(10, 5))
+        self.take_count_var = ctk.StringVar(value=str(self.takes_config.get('count', DEFAULT_TAKE_COUNT)))
+        ctk.CTkEntry(takes_frame, textvariable=self.take_count_var, width=50).pack(side="left", padx=5)
+        vary_label = next((label for label, vary in TAKE_VARY_LABELS.items()
+                           if vary == self.takes_config.get('vary', VARY_SEED)), "种子")
+        self.take_vary_var = ctk.StringVar(value=vary_label)
+        ctk.CTkComboBox(takes_frame, variable=self.take_vary_var, values=list(TAKE_VARY_LABELS),
+                        width=80, state="readonly").pack(side="left", padx=5)
+        self.takes_button = ctk.CTkButton(takes_frame, text="生成多个版本", command=self.generate_takes_for_current_details)
+        self.takes_button.pack(side="left", padx=10, pady=5)
+
+        self.takes_list_frame = ctk.CTkFrame(self.details_frame, fg_color="transparent")
+        self.takes_list_frame.grid(row=11, column=0, columnspan=2, padx=10, pady=(0, 10), sticky="ew")
+        self.refresh_takes_list()
+
+        # 修改文本或参数时取消尚未开始的预取
+        self.text_box.bind("<KeyRelease>", self.on_details_edited, add="+")
+        self.speed_slider.configure(command=self.on_details_edited)
+        for var in (self.emotion_var, self.seed_var, self.text_lang_var, self.prompt_lang_var, self.top_k_var,
+                    self.top_p_var, self.temperature_var, self.text_split_var, self.fragment_interval_var):
+            var.trace_add("write", self.on_details_edited)
         
     def get_output_path(self, dialogue_info, ext=".wav"):
-        if not dialogue_info or not self.script_data: return None
-        script_name = sanitize_filename(self.script_data.get('script_name', 'UntitledScript'))
-        script_dir = os.path.join(self.output_dir, script_name)
-        scene_dir = os.path.join(script_dir, sanitize_filename(dialogue_info['scene_name']))
-        filename_preview = sanitize_filename(dialogue_info['text'])
-        line_num = dialogue_info['scene_idx'] * 1000 + dialogue_info['dialogue_idx']
-        filename = f"{line_num:04d}_{sanitize_filename(dialogue_info['character'])}_{filename_preview}{ext}"
-        return os.path.join(scene_dir, filename)
+        return get_output_path(self.output_dir, self.script_data, dialogue_info, ext)
 
     def get_all_dialogues(self):
-        if not self.script_data: return []
-        all_dialogues = []
-        for scene_idx, scene in enumerate(self.script_data.get("scenes", [])):
-            for dialogue_idx, dialogue in enumerate(scene.get("dialogues", [])):
-                all_dialogues.append({"scene_idx": scene_idx, "dialogue_idx": dialogue_idx, "scene_name": scene.get("scene_name"), **dialogue})
-        return all_dialogues
+        return get_all_dialogues(self.script_data)
+
+    def is_generated(self, output_path):
+        """查询输出索引 (不访问磁盘)；尚未加载索引时退回 os.path.exists。"""
+        if not output_path:
+            return False
+        if self.manifest:
+            return self.manifest.contains(output_path)
+        return os.path.exists(output_path)
+
+    def resumable_jobs(self):
+        """日志中上次未完成、且仍与当前剧本对应的任务 (已手动重新生成或剧本已修改的任务会被丢弃)。"""
+        expected = expected_outputs(self.script_data, self.get_all_dialogues(), self.script_character_mapping,
+                                    self.api_client.default_params, self.output_dir)
+        return self.journal.unfinished_jobs(self.manifest, expected)
 
     def batch_generate(self):
-        missing_dialogues = [
-            info for info in self.get_all_dialogues() 
-            if not os.path.exists(self.get_output_path(info))
-        ]
-        
-        if not missing_dialogues:
-            self.status_bar.configure(text="所有音频均已生成，无需批量生成。")
-            return
+        # 日志中有上次未完成的任务时直接继续，不重新扫描输出目录
+        jobs = self.resumable_jobs() if self.journal else []
+        unmapped = []
+        if not jobs:
+            missing_dialogues = [
+                info for info in self.get_all_dialogues() 
+                if not self.is_generated(self.get_output_path(info))
+            ]
+            
+            if not missing_dialogues:
+                self.status_bar.configure(text="所有音频均已生成，无需批量生成。")
+                return
+
+            jobs, unmapped = build_batch_jobs(self.script_data, missing_dialogues, self.script_character_mapping,
+                                              self.api_client.default_params, self.output_dir)
+
+            if not jobs:
+                self.status_bar.configure(text=f"错误: {len(unmapped)} 句缺失音频的角色均未配置模型。")
+                return
+            if self.journal:
+                self.journal.enqueue(jobs)
 
+        metrics = GenerationMetrics() if self.batch_config.get('metrics', True) else None
+        self.batch_generator = BatchGenerator.from_config(self.api_client, self.batch_config,
+                                                          cache=self.cache, journal=self.journal, manifest=self.manifest,
+                                                          postprocessor=self.postprocessor, metrics=metrics)
+        metrics_dir = script_metrics_dir(self.output_dir, self.script_data)
+        self.prefetcher.cancel()
         self.open_button.configure(state="disabled")
-        self.batch_generate_button.configure(state="disabled")
+        self.batch_generate_button.configure(text="停止批量生成", command=self.cancel_batch_generate)
+
+        self.ui_updates.start_progress(len(jobs))
+
+        def on_progress(job, success, done, total):
+            # 在工作线程中调用：只写入更新队列
+            if success:
+                self.ui_updates.mark_generated(job.dialogue_info)
+            self.ui_updates.report_progress(success, done, total, f"{job.dialogue_info['text'][:15]}...")
+
+        def task():
+            stats = self.batch_generator.run(jobs, on_progress=on_progress)
+            summary = f"成功 {stats['succeeded']}，失败 {stats['failed']}"
+            if unmapped:
+                summary += f"，未配置模型 {len(unmapped)}"
+            if stats.get('retries'):
+                summary += f"，重试 {stats['retries']} 次"
+            if stats.get('model_switches_avoided'):
+                summary += f"，减少模型切换 {stats['model_switches_avoided']} 次"
+            conn_stats = self.api_client.get_connection_stats()
+            summary += f"，连接复用 {conn_stats['connections_reused']}/{conn_stats['requests']}"
+            backend_stats = self.api_client.get_backend_stats()
+            if len(backend_stats) > 1:
+                healthy = sum(1 for backend in backend_stats if backend['healthy'])
+                summary += f"，可用后端 {healthy}/{len(backend_stats)}"
+            if self.cache:
+                summary += f"，缓存命中 {self.cache.get_stats()['hits']}"
+            scheduler_stats = self.api_client.get_scheduler_stats()
+            if scheduler_stats and scheduler_stats['batch']['requests']:
+                summary += f"，批量请求平均排队 {scheduler_stats['batch']['avg_wait']:.1f}s"
+            if metrics:
+                try:
+                    report_path, _ = metrics.write(metrics_dir)
+                    rtf = metrics.report()['rtf']
+                    if rtf['count']:
+                        summary += f"，实时率中位数 {rtf['p50']:.2f}"
+                    print(f"耗时报告已保存至: {report_path}")
+                except OSError as e:
+                    print(f"保存耗时报告失败: {e}")
+            progress = self.ui_updates.finish_progress()
+            if progress and progress.done:
+                elapsed = time.monotonic() - progress.started_at
+                summary += f"，用时 {format_duration(elapsed)}"
+            if stats['cancelled']:
+                self.ui_updates.set_status(f"批量生成已取消 ({summary})")
+            else:
+                self.ui_updates.set_status(f"批量生成完成！({summary})")
+            self.ui_updates.call(self.on_batch_finished)
+
+        Thread(target=task, daemon=True).start()
+
+    def export_masters(self):
+        """在后台线程中把已生成的音频拼接为场景整轨和剧本整轨 (见 export.export_masters)。"""
+        if not self.script_data: return
+        dialogues = list(self.get_all_dialogues())
+        script_data = self.script_data
+        self.export_button.configure(state="disabled")
+        self.ui_updates.set_status("正在导出整轨...")
+
+        def on_progress(done, total):
+            self.ui_updates.set_status(f"正在导出整轨 {done}/{total}")
 
         def task():
-            total = len(missing_dialogues)
-            for i, info in enumerate(missing_dialogues):
-                self.status_bar.configure(text=f"批量生成中 ({i+1}/{total}): {info['text'][:15]}...")
-                self.perform_audio_generation(info, blocking=True)
-            self.status_bar.configure(text="批量生成完成！")
-            self.open_button.configure(state="normal")
-            self.batch_generate_button.configure(state="normal")
+            try:
+                result = export_masters(script_data, dialogues, self.output_dir, self.export_dir,
+                                        float(self.export_config.get('line_gap', DEFAULT_LINE_GAP)),
+                                        float(self.export_config.get('scene_gap', DEFAULT_SCENE_GAP)),
+                                        on_progress=on_progress)
+                if result['exported']:
+                    status = (f"整轨导出完成: {result['scenes']} 个场景，{result['exported']} 句，"
+                              f"总时长 {format_duration(result['duration'])}，缺失 {result['missing']} 句 -> {result['dir']}")
+                else:
+                    status = "没有可导出的音频，请先生成。"
+            except Exception as e:
+                status = f"导出整轨失败: {e}"
+            self.ui_updates.set_status(status)
+            self.ui_updates.call(lambda: self.export_button.configure(state="normal"))
 
         Thread(target=task, daemon=True).start()
 
+    def on_batch_finished(self):
+        self.batch_generator = None
+        self.open_button.configure(state="normal")
+        self.batch_generate_button.configure(text="批量生成缺失音频", command=self.batch_generate, state="normal")
+
+    def cancel_batch_generate(self):
+        if not self.batch_generator: return
+        self.batch_generator.cancel()
+        self.batch_generate_button.configure(state="disabled")
+        self.status_bar.configure(text="正在取消批量生成，等待进行中的任务结束...")
+
+    def mark_dialogue_generated(self, dialogue_info, update_details=True):
+        """只能在界面线程中调用；工作线程请使用 self.ui_updates.mark_generated。"""
+        dialogue_id = f"dialogue_{dialogue_info['scene_idx']}_{dialogue_info['dialogue_idx']}"
+        if dialogue_id in self.overview_widgets:
+            widgets = self.overview_widgets[dialogue_id]
+            widgets['status_label'].configure(text="已生成", text_color="green")
+            widgets['play_button'].configure(state="normal")
+        if update_details:
+            self.update_play_button_state()
+
     def generate_audio_for_current_details(self):
         if not self.current_dialogue_info: return
         self.perform_audio_generation(self.current_dialogue_info)
@@ -354,7 +634,12 @@ class App(ctk.CTk):
         output_path = self.get_output_path(self.current_dialogue_info)
         self.perform_audio_play(output_path)
 
-    def perform_audio_generation(self, dialogue_info, blocking=False):
+    def collect_generation_params(self, dialogue_info):
+        """
+        读取一句的生成参数：当前详情页的对话使用详情页中的文本和参数，其他对话使用全局默认参数。
+
+        :return: 完整的生成参数 (见 build_generation_params)；参数无效或角色未配置模型时在状态栏提示并返回 None。
+        """
         character = dialogue_info['character']
         
         # 获取参数：从详情编辑页面或使用对话信息本身
@@ -387,7 +672,7 @@ class App(ctk.CTk):
                     
             except (AttributeError, ValueError) as e:
                 self.status_bar.configure(text=f"错误: 参数无效 - {e}")
-                return
+                return None
         else:
             text = dialogue_info['text']
             emotion = dialogue_info['emotion']
@@ -405,58 +690,94 @@ class App(ctk.CTk):
         model_name = self.script_character_mapping.get(character)
         if not model_name:
             self.status_bar.configure(text=f"错误: 未找到角色 '{character}' 的模型。")
+            return None
+
+        return build_generation_params(
+            self.api_client.default_params, text, model_name, emotion,
+            speed_facter=speed,
+            seed=seed,
+            text_lang=text_lang,
+            prompt_text_lang=prompt_text_lang,
+            top_k=top_k,
+            top_p=top_p,
+            temperature=temperature,
+            text_split_method=text_split_method,
+            fragment_interval=fragment_interval
+        )
+
+    def perform_audio_generation(self, dialogue_info, blocking=False):
+        params_to_save = self.collect_generation_params(dialogue_info)
+        if params_to_save is None:
             return
-        
         output_path = self.get_output_path(dialogue_info)
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        
-        params_to_save = {
-            **self.api_client.default_params,
-            "text": text,
-            "model_name": model_name,
-            "emotion": emotion,
-            "speed_facter": speed,
-            "seed": seed,
-            "text_lang": text_lang,
-            "prompt_text_lang": prompt_text_lang,
-            "top_k": top_k,
-            "top_p": top_p,
-            "temperature": temperature,
-            "text_split_method": text_split_method,
-            "fragment_interval": fragment_interval
-        }
+        signature = self.get_line_signature(dialogue_info)
+
+        # 手动生成的句子不再预取；正在预取时等它完成，避免预取结果覆盖手动生成的音频
+        self.prefetcher.discard(output_path)
 
         def task():
             if not blocking:
-                self.status_bar.configure(text=f"正在为 '{dialogue_info['text'][:10]}...' 生成音频...")
-            
-            audio_data = self.api_client.generate_audio(**params_to_save)
-            
-            if audio_data:
-                with open(output_path, 'wb') as f: f.write(audio_data)
-                
-                metadata_path = self.get_output_path(dialogue_info, ext=".json")
-                with open(metadata_path, 'w', encoding='utf-8') as f:
-                    json.dump(params_to_save, f, ensure_ascii=False, indent=2)
-
-                if not blocking:
-                    self.status_bar.configure(text=f"音频已保存至: {os.path.basename(output_path)}")
-                
-                dialogue_id = f"dialogue_{dialogue_info['scene_idx']}_{dialogue_info['dialogue_idx']}"
-                if dialogue_id in self.overview_widgets:
-                    widgets = self.overview_widgets[dialogue_id]
-                    widgets['status_label'].configure(text="已生成", text_color="green")
-                    widgets['play_button'].configure(state="normal")
-                self.update_play_button_state()
-            else:
-                 if not blocking:
-                    self.status_bar.configure(text="错误: API 调用失败。")
+                self.ui_updates.set_status(f"正在为 '{dialogue_info['text'][:10]}...' 生成音频...")
+            self.prefetcher.wait_idle(output_path)
+            # 交互式生成优先于预取和批量任务获得请求名额
+            with self.api_client.request_priority(PRIORITY_INTERACTIVE):
+                success = self.generate_and_record(dialogue_info, output_path, params_to_save, signature)
+            if not blocking:
+                if success:
+                    self.ui_updates.set_status(f"音频已保存至: {os.path.basename(output_path)}")
+                else:
+                    self.ui_updates.set_status("错误: API 调用失败。")
         
         if blocking:
             task()
         else:
             Thread(target=task, daemon=True).start()
 
+    def get_line_signature(self, dialogue_info):
+        """剧本中这句对话的签名 (见 batch.line_signature)，与详情页中修改的文本和参数无关。"""
+        model_name = self.script_character_mapping.get(dialogue_info['character'])
+        return line_signature(dialogue_info, model_name, self.api_client.default_params)
+
+    def generate_and_record(self, dialogue_info, output_path, params, signature=None) -> bool:
+        """
+        生成一句音频并保存元数据 (包括对话签名)、后处理、更新输出索引 (在工作线程中调用)。
+        启用耗时统计时记录到 line_metrics 中。
+        """
+        metrics = self.line_metrics
+        trace = LineTrace() if metrics else None
+        generate = lambda: self.api_client.generate_audio_to_file(output_path, **params)
+        with tracing(trace):
+            if self.cache:
+                success = self.cache.get_or_generate(params, output_path, generate)
+            else:
+                success = generate()
+            if success:
+                save_audio_metadata(output_path, params, signature)
+                if self.postprocessor:
+                    with measure_phase(PHASE_POSTPROCESS):
+                        self.postprocessor.process(output_path)
+        if metrics:
+            metrics.record(dialogue_info, params, output_path, trace, bool(success))
+            self.save_line_metrics(metrics)
+        if not success:
+            return False
+
+        if self.manifest:
+            self.manifest.record(output_path, dialogue_info.get('line_id'), params)
+            self.manifest.save()
+        self.ui_updates.mark_generated(dialogue_info)
+        return True
+
+    def save_line_metrics(self, metrics):
+        """写出界面中逐句生成的耗时报告 (每个剧本一份，随生成更新)。"""
+        # 生成期间已切换到另一个剧本：旧剧本的报告在上一次记录时已经写出
+        if not self.script_data or metrics is not self.line_metrics:
+            return
+        try:
+            metrics.write(script_metrics_dir(self.output_dir, self.script_data))
+        except OSError as e:
+            print(f"保存耗时报告失败: {e}")
+
     def perform_audio_play(self, output_path):
         if not output_path or not os.path.exists(output_path):
             self.status_bar.configure(text="错误: 音频文件不存在。")
@@ -464,19 +785,110 @@ class App(ctk.CTk):
         
         winsound.PlaySound(None, winsound.SND_PURGE)
         def task():
-            self.status_bar.configure(text=f"正在播放: {os.path.basename(output_path)}")
+            self.ui_updates.set_status(f"正在播放: {os.path.basename(output_path)}")
             try:
                 winsound.PlaySound(output_path, winsound.SND_FILENAME)
-                self.status_bar.configure(text="播放完毕。")
+                self.ui_updates.set_status("播放完毕。")
             except Exception as e:
-                self.status_bar.configure(text=f"错误: 无法播放音频: {e}")
+                self.ui_updates.set_status(f"错误: 无法播放音频: {e}")
+        Thread(target=task, daemon=True).start()
+
+    def generate_takes_for_current_details(self):
+        """用详情页的参数并发生成当前句的多个候选版本 (见 takes.generate_takes)。"""
+        info = self.current_dialogue_info
+        if not info: return
+        try:
+            count = int(self.take_count_var.get())
+        except ValueError:
+            self.status_bar.configure(text="错误: 版本数必须是整数。")
+            return
+        params = self.collect_generation_params(info)
+        if params is None:
+            return
+        output_path = self.get_output_path(info)
+        signature = self.get_line_signature(info)
+        vary = TAKE_VARY_LABELS.get(self.take_vary_var.get(), VARY_SEED)
+        self.takes_button.configure(state="disabled")
+        self.status_bar.configure(text=f"正在为 '{info['text'][:10]}...' 生成 {count} 个版本...")
+
+        def on_take(number, path, success):
+            # 在工作线程中调用：每完成一个版本就刷新列表，可以边生成边试听
+            if success:
+                self.ui_updates.call(self.refresh_takes_list, info)
+
+        def task():
+            with self.api_client.request_priority(PRIORITY_INTERACTIVE):
+                results = generate_takes(self.api_client, output_path, params, count, vary, cache=self.cache,
+                                         postprocessor=self.postprocessor, on_take=on_take, signature=signature,
+                                         metrics=self.line_metrics, dialogue_info=info)
+            if self.line_metrics:
+                self.save_line_metrics(self.line_metrics)
+            succeeded = sum(1 for _, _, success in results if success)
+            self.ui_updates.set_status(f"已生成 {succeeded}/{len(results)} 个版本。")
+            self.ui_updates.call(self.on_takes_finished, info)
+
+        Thread(target=task, daemon=True).start()
+
+    def on_takes_finished(self, dialogue_info):
+        if dialogue_info is self.current_dialogue_info and self.takes_button.winfo_exists():
+            self.takes_button.configure(state="normal")
+        self.refresh_takes_list(dialogue_info)
+
+    def refresh_takes_list(self, dialogue_info=None):
+        """重新列出当前句的候选版本 (只能在界面线程中调用)。"""
+        info = self.current_dialogue_info
+        if not info or (dialogue_info is not None and dialogue_info is not info):
+            return
+        if not hasattr(self, 'takes_list_frame') or not self.takes_list_frame.winfo_exists():
+            return
+        for widget in self.takes_list_frame.winfo_children():
+            widget.destroy()
+
+        output_path = self.get_output_path(info)
+        signature = self.get_line_signature(info)
+        try:
+            with open(os.path.splitext(output_path)[0] + ".json", 'r', encoding='utf-8') as f:
+                promoted_from = json.load(f).get('promoted_from')
+        except (OSError, ValueError, AttributeError):
+            promoted_from = None
+
+        for row, (number, path, params) in enumerate(list_takes(output_path, signature)):
+            text = f"版本 {number:02d}    种子 {params.get('seed', '?')}    温度 {params.get('temperature', '?')}"
+            if os.path.basename(path) == promoted_from:
+                text += "    (正式)"
+            ctk.CTkLabel(self.takes_list_frame, text=text, anchor="w").grid(row=row, column=0, padx=5, pady=2, sticky="w")
+            ctk.CTkButton(self.takes_list_frame, text="播放", width=60,
+                          command=lambda p=path: self.perform_audio_play(p)).grid(row=row, column=1, padx=5, pady=2)
+            ctk.CTkButton(self.takes_list_frame, text="设为正式", width=80,
+                          command=lambda p=path: self.promote_take_for_current(p)).grid(row=row, column=2, padx=5, pady=2)
+        self.takes_list_frame.grid_columnconfigure(0, weight=1)
+
+    def promote_take_for_current(self, path):
+        """把选中的版本复制为当前句的正式音频 (不重新合成)。"""
+        info = self.current_dialogue_info
+        if not info: return
+        output_path = self.get_output_path(info)
+        self.prefetcher.discard(output_path)
+
+        def task():
+            self.prefetcher.wait_idle(output_path)
+            if not promote_take(path, output_path):
+                self.ui_updates.set_status("错误: 设为正式音频失败。")
+                return
+            if self.manifest:
+                self.manifest.record(output_path, info.get('line_id'))
+                self.manifest.save()
+            self.ui_updates.mark_generated(info)
+            self.ui_updates.set_status(f"已将 {os.path.basename(path)} 设为正式音频。")
+            self.ui_updates.call(self.refresh_takes_list, info)
+
         Thread(target=task, daemon=True).start()
 
     def update_play_button_state(self):
         if not self.current_dialogue_info: return
         output_path = self.get_output_path(self.current_dialogue_info)
         if hasattr(self, 'play_button'):
-            state = "normal" if output_path and os.path.exists(output_path) else "disabled"
+            state = "normal" if self.is_generated(output_path) else "disabled"
             self.play_button.configure(state=state)
 
     def toggle_advanced_settings(self):
@@ -497,8 +909,9 @@ class App(ctk.CTk):
         # API设置
         ctk.CTkLabel(self.settings_frame, text="API 设置", font=ctk.CTkFont(size=18, weight="bold")).grid(row=0, column=0, columnspan=2, pady=(0, 10), sticky="w")
         
+        # 多个后端用逗号分隔
         ctk.CTkLabel(self.settings_frame, text="API 地址:").grid(row=1, column=0, padx=10, pady=5, sticky="w")
-        self.api_url_var = ctk.StringVar(value=self.api_client.base_url)
+        self.api_url_var = ctk.StringVar(value=", ".join(self.api_client.base_urls))
         self.api_url_entry = ctk.CTkEntry(self.settings_frame, textvariable=self.api_url_var, width=300)
         self.api_url_entry.grid(row=1, column=1, padx=10, pady=5, sticky="ew")
         
@@ -601,7 +1014,8 @@ class App(ctk.CTk):
         """保存全局设置到配置文件"""
         try:
             # 更新API客户端的参数
-            self.api_client.base_url = self.api_url_var.get()
+            api_urls = [url.strip() for url in self.api_url_var.get().split(',') if url.strip()]
+            self.api_client.base_urls = api_urls
             
             # 收集所有参数
             new_params = {
@@ -625,12 +1039,17 @@ class App(ctk.CTk):
             # 更新API客户端的默认参数
             self.api_client.default_params.update(new_params)
             
-            # 保存到配置文件
+            # 保存到配置文件 (保留 api/inference_defaults 之外的配置段，如 batch)
             import yaml
-            config_data = {
-                'api': {'base_url': self.api_url_var.get()},
-                'inference_defaults': {**self.api_client.default_params, **new_params}
-            }
+            config_data = load_config('config.yaml') or {}
+            api_section = dict(config_data.get('api', {}))
+            api_section['base_url'] = api_urls[0] if api_urls else api_section.get('base_url', '')
+            if len(api_urls) > 1:
+                api_section['base_urls'] = api_urls
+            else:
+                api_section.pop('base_urls', None)
+            config_data['api'] = api_section
+            config_data['inference_defaults'] = {**self.api_client.default_params, **new_params}
             
             with open('config.yaml', 'w', encoding='utf-8') as f:
                 yaml.dump(config_data, f, default_flow_style=False, allow_unicode=True)
@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import sqlite3
+from threading import Lock
+from dubbing_tool.batch import BatchJob
+from dubbing_tool.utils import sanitize_filename
+
+JOURNAL_FILENAME = ".batch_journal.sqlite3"
+
+STATE_QUEUED = "queued"
+STATE_RUNNING = "running"
+STATE_DONE = "done"
+STATE_FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    output_path   TEXT PRIMARY KEY,
+    scene_idx     INTEGER,
+    dialogue_idx  INTEGER,
+    dialogue_info TEXT NOT NULL,
+    params        TEXT NOT NULL,
+    signature     TEXT,
+    state         TEXT NOT NULL,
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    last_error    TEXT,
+    queued_at     REAL,
+    started_at    REAL,
+    finished_at   REAL,
+    duration      REAL
+)
+"""
+
+
+class JobJournal:
+    """
+    批量任务的持久化日志 (SQLite)，每个剧本的输出目录一份。
+
+    记录每条任务的状态 (queued/running/done/failed)、尝试次数、最后一次错误和耗时。
+    程序或服务器中途退出后，可以用 unfinished_jobs() 精确地继续上次的批量任务，
+    而无需重新扫描整个输出目录。上次退出时仍为 running 的任务在打开时会恢复为 queued。
+
+    输出路径以相对于日志所在目录的形式保存，移动整个输出目录后日志仍然有效。
+    所有方法都是线程安全的，可以直接在批量工作线程中调用。
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: 日志数据库文件路径。
+        """
+        self.path = path
+        self.base_dir = os.path.dirname(os.path.abspath(path))
+        os.makedirs(self.base_dir, exist_ok=True)
+        self._lock = Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(_SCHEMA)
+        # 早期版本创建的日志没有 signature 列
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if 'signature' not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN signature TEXT")
+        self.recovered = self._execute(
+            "UPDATE jobs SET state = ? WHERE state = ?", (STATE_QUEUED, STATE_RUNNING)).rowcount
+
+    @classmethod
+    def for_script(cls, output_dir: str, script_data: dict):
+        """打开 (或创建) 剧本输出目录 <output_dir>/<剧本名>/ 下的日志。"""
+        script_name = sanitize_filename(script_data.get('script_name', 'UntitledScript'))
+        return cls(os.path.join(output_dir, script_name, JOURNAL_FILENAME))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _execute(self, sql: str, args=()) -> sqlite3.Cursor:
+        with self._lock:
+            cursor = self._conn.execute(sql, args)
+            self._conn.commit()
+            return cursor
+
+    def _key(self, output_path: str) -> str:
+        return os.path.relpath(os.path.abspath(output_path), self.base_dir)
+
+    def enqueue(self, jobs):
+        """把一组任务登记为 queued (已有记录时重置尝试次数和错误)。"""
+        now = time.time()
+        rows = [
+            (self._key(job.output_path), job.dialogue_info.get('scene_idx'), job.dialogue_info.get('dialogue_idx'),
+             json.dumps(job.dialogue_info, ensure_ascii=False), json.dumps(job.params, ensure_ascii=False), job.signature,
+             STATE_QUEUED, now)
+            for job in jobs
+        ]
+        with self._lock:
+            self._conn.executemany(
+                """INSERT INTO jobs (output_path, scene_idx, dialogue_idx, dialogue_info, params, signature, state, queued_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(output_path) DO UPDATE SET
+                       scene_idx = excluded.scene_idx, dialogue_idx = excluded.dialogue_idx,
+                       dialogue_info = excluded.dialogue_info, params = excluded.params,
+                       signature = excluded.signature, state = excluded.state,
+                       attempts = 0, last_error = NULL, queued_at = excluded.queued_at,
+                       started_at = NULL, finished_at = NULL, duration = NULL""",
+                rows)
+            self._conn.commit()
+
+    def unfinished_jobs(self, manifest=None, expected: list | None = None) -> list:
+        """
+        返回尚未完成 (queued/running) 的任务，按剧本顺序排列，可直接交给 BatchGenerator.run。
+        已彻底失败 (failed) 的任务不在其中，它们的音频仍然缺失，下次批量生成缺失音频时会重新登记。
+
+        给出 manifest 和 expected 时，先从日志中删除不应再执行的任务，避免覆盖更新的音频或写出过时的内容：
+        - 登记之后输出已经写入 (如取消批量后在详情页中手动重新生成过)；
+        - 输出路径或签名与剧本当前的对话不再对应 (剧本或默认参数已修改)。
+
+        :param manifest: 剧本的 OutputManifest。
+        :param expected: 剧本当前每句对话的 [(output_path, line_id, signature)] (见 manifest.expected_outputs)。
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT output_path, dialogue_info, params, signature, queued_at FROM jobs WHERE state IN (?, ?) "
+                "ORDER BY scene_idx, dialogue_idx",
+                (STATE_QUEUED, STATE_RUNNING)).fetchall()
+        current = None
+        if expected is not None:
+            current = {os.path.normcase(os.path.abspath(path)): signature for path, _, signature in expected if path}
+
+        jobs, stale = [], []
+        for key, info, params, signature, queued_at in rows:
+            output_path = os.path.join(self.base_dir, key)
+            if current is not None:
+                entry = manifest.get(output_path) if manifest else None
+                if (not signature or current.get(os.path.normcase(os.path.abspath(output_path))) != signature
+                        or (entry and entry['mtime'] >= (queued_at or 0))):
+                    stale.append((key,))
+                    continue
+            jobs.append(BatchJob(json.loads(info), json.loads(params), output_path, signature))
+        if stale:
+            with self._lock:
+                self._conn.executemany("DELETE FROM jobs WHERE output_path = ?", stale)
+                self._conn.commit()
+        return jobs
+
+    def discard_unfinished(self) -> int:
+        """丢弃尚未完成的任务 (剧本已修改，日志中的路径和参数不再可靠时调用)。"""
+        return self._execute("DELETE FROM jobs WHERE state IN (?, ?)", (STATE_QUEUED, STATE_RUNNING)).rowcount
+
+    def mark_running(self, job):
+        """开始一次尝试：尝试次数加一并记录开始时间。"""
+        self._execute(
+            "UPDATE jobs SET state = ?, attempts = attempts + 1, started_at = ? WHERE output_path = ?",
+            (STATE_RUNNING, time.time(), self._key(job.output_path)))
+
+    def mark_done(self, job):
+        now = time.time()
+        self._execute(
+            "UPDATE jobs SET state = ?, last_error = NULL, finished_at = ?, duration = ? - started_at WHERE output_path = ?",
+            (STATE_DONE, now, now, self._key(job.output_path)))
+
+    def mark_failed(self, job, error: str | None, final: bool = True):
+        """
+        记录一次失败。final 为 False 表示之后还会重试 (或因取消而留待下次继续)，任务回到 queued。
+        """
+        now = time.time()
+        self._execute(
+            "UPDATE jobs SET state = ?, last_error = ?, finished_at = ?, duration = ? - started_at WHERE output_path = ?",
+            (STATE_FAILED if final else STATE_QUEUED, error, now, now, self._key(job.output_path)))
+
+    def get_summary(self) -> dict:
+        """返回各状态的任务数，如 {'queued': 3, 'done': 120, 'failed': 1}。"""
+        with self._lock:
+            return dict(self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+    def get_failures(self) -> list:
+        """返回彻底失败的任务 [{'output_path', 'attempts', 'last_error'}]。"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT output_path, attempts, last_error FROM jobs WHERE state = ? ORDER BY scene_idx, dialogue_idx",
+                (STATE_FAILED,)).fetchall()
+        return [{'output_path': os.path.join(self.base_dir, key), 'attempts': attempts, 'last_error': error}
+                for key, attempts, error in rows]
@@ -1,20 +1,20 @@
 import os
 import sys
+import multiprocessing
 import customtkinter as ctk
 from tkinter import messagebox
 from dubbing_tool.api_client import ApiClient
+from dubbing_tool.cache import SynthesisCache
 from dubbing_tool.gui import App
-from dubbing_tool.utils import load_config
+from dubbing_tool.postprocess import PostProcessor
+from dubbing_tool.utils import load_config, get_app_dir
 
 def main():
+    # 打包为 exe 后，后处理进程池的子进程也从这里启动
+    multiprocessing.freeze_support()
     # --- 配置和初始化 ---
     # 获取exe文件所在目录，寻找config.yaml
-    if getattr(sys, 'frozen', False):
-        # 打包后的exe环境
-        app_dir = os.path.dirname(sys.executable)
-    else:
-        # 开发环境
-        app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    app_dir = get_app_dir()
     
     config_path = os.path.join(app_dir, 'config.yaml')
     config = load_config(config_path)
@@ -30,11 +30,13 @@ def main():
     api_config = config.get('api', {})
     inference_defaults = config.get('inference_defaults', {})
     output_dir = config.get('output_dir', 'output')
+    batch_config = config.get('batch', {})
+    export_config = config.get('export', {})
 
-    if not api_config.get('base_url'):
+    if not (api_config.get('base_urls') or api_config.get('base_url')):
         root = ctk.CTk()
         root.withdraw()
-        messagebox.showerror("配置错误", "配置文件中缺少 API base_url。")
+        messagebox.showerror("配置错误", "配置文件中缺少 API base_url (或 base_urls)。")
         root.destroy()
         sys.exit(1)
 
@@ -42,19 +44,42 @@ def main():
     if not os.path.isabs(output_dir):
         output_dir = os.path.join(app_dir, output_dir)
     os.makedirs(output_dir, exist_ok=True)
+    export_dir = export_config.get('dir', 'export')
+    if not os.path.isabs(export_dir):
+        export_dir = os.path.join(app_dir, export_dir)
 
     # 初始化 API 客户端
-    api_client = ApiClient(
-        base_url=api_config['base_url'],
-        default_params=inference_defaults
-    )
+    try:
+        api_client = ApiClient.from_config(api_config, inference_defaults)
+    except ValueError as e:
+        root = ctk.CTk()
+        root.withdraw()
+        messagebox.showerror("配置错误", str(e))
+        root.destroy()
+        sys.exit(1)
+
+    # 初始化合成缓存 (未启用时为 None)
+    cache = SynthesisCache.from_config(config.get('cache'), app_dir)
+
+    # 初始化音频后处理 (未启用时为 None)
+    postprocessor = PostProcessor.from_config(config.get('postprocess'))
 
     # --- 启动 GUI ---
     app = App(
         api_client=api_client,
-        output_dir=output_dir
+        output_dir=output_dir,
+        batch_config=batch_config,
+        cache=cache,
+        export_dir=export_dir,
+        export_config=export_config,
+        postprocessor=postprocessor,
+        prefetch_config=config.get('prefetch', {}),
+        takes_config=config.get('takes', {}),
+        character_models=config.get('character_models', {})
     )
     app.mainloop()
+    if postprocessor:
+        postprocessor.close()
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
@@ -0,0 +1,358 @@
+import os
+import json
+import time
+import hashlib
+from threading import Lock
+from dubbing_tool.audio import audio_duration
+from dubbing_tool.batch import SIGNATURE_KEY, line_signature
+from dubbing_tool.cache import hash_params
+from dubbing_tool.takes import move_takes
+from dubbing_tool.utils import atomic_open, get_output_path, is_take_path, sanitize_filename
+
+MANIFEST_FILENAME = ".manifest.json"
+# 同步剧本时被替换下来的旧音频移动到剧本目录下的这个子目录，而不是直接删除
+ORPHANED_DIRNAME = "_orphaned"
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac", ".ogg", ".aac")
+# 两次写盘之间的最小间隔 (秒)，批量生成时避免每句都重写整个索引
+SAVE_INTERVAL = 2.0
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path: str) -> str:
+    """计算文件内容的 SHA-256。"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# 元数据中不属于生成请求的字段 (签名和 takes.promote_take 写入的来源)，计算请求哈希时去掉
+METADATA_EXTRA_KEYS = (SIGNATURE_KEY, "promoted_from")
+
+
+def read_metadata(audio_path: str) -> dict | None:
+    """读取音频旁的 .json 元数据；不存在或无法解析时返回 None。"""
+    metadata_path = os.path.splitext(audio_path)[0] + ".json"
+    try:
+        with open(metadata_path, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+        return metadata if isinstance(metadata, dict) else None
+    except (OSError, ValueError):
+        return None
+
+
+def read_signature(audio_path: str) -> str | None:
+    """
+    读取音频旁的 .json 元数据中记录的对话签名 (见 batch.line_signature)；
+    没有元数据或元数据中没有签名 (外部写入或早于此功能生成的文件) 时返回 None。
+    """
+    metadata = read_metadata(audio_path)
+    return metadata.get(SIGNATURE_KEY) if metadata else None
+
+
+def move_output(src: str, dst: str):
+    """移动一个音频文件及其 .json 元数据，以及它的候选版本 (见 dubbing_tool.takes)。"""
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    os.replace(src, dst)
+    src_meta = os.path.splitext(src)[0] + ".json"
+    if os.path.exists(src_meta):
+        os.replace(src_meta, os.path.splitext(dst)[0] + ".json")
+    move_takes(src, dst)
+
+
+class OutputManifest:
+    """
+    一个剧本已生成音频的索引，保存在 <output_dir>/<剧本名>/.manifest.json。
+
+    每个条目记录文件大小、mtime、内容哈希、时长、生成请求的参数哈希 (与合成缓存的键相同，见 cache.hash_params)，
+    以及对应对话的 line_id 和签名 (用于剧本修改后的同步，见 sync_script_outputs)。打开时用一次 os.scandir 遍历
+    (剧本目录及其下的场景目录) 与磁盘对账，之后的状态查询都是内存中的 O(1) 查找，
+    不再对每句对话调用 os.path.exists —— 在网络共享上打开上万句的剧本时差别很明显。
+
+    写入音频后应调用 record() 更新索引；索引在内存中立即生效，
+    磁盘上的 JSON 最多每 SAVE_INTERVAL 秒写一次 (以及调用 save() 时)。
+    """
+
+    def __init__(self, script_dir: str):
+        """
+        :param script_dir: 剧本的输出目录 (<output_dir>/<剧本名>)。
+        """
+        self.script_dir = script_dir
+        self.path = os.path.join(script_dir, MANIFEST_FILENAME)
+        self._lock = Lock()
+        self._save_lock = Lock()
+        self._entries = {}  # 相对路径 -> {'size', 'mtime', 'sha256', 'duration', 'params_hash', 'line_id', SIGNATURE_KEY}
+        self._dirty = False
+        self._last_save = 0.0
+        self._load()
+        self.reconcile()
+
+    @classmethod
+    def for_script(cls, output_dir: str, script_data: dict):
+        script_name = sanitize_filename(script_data.get('script_name', 'UntitledScript'))
+        return cls(os.path.join(output_dir, script_name))
+
+    def _key(self, path: str) -> str:
+        return os.path.normcase(os.path.relpath(os.path.abspath(path), self.script_dir))
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            if isinstance(entries, dict):
+                # 旧版本的条目中是由文本、模型和情感计算的 signature，与现在的签名不可比较；
+                # 丢弃后在下次同步时从元数据中重新读取
+                for entry in entries.values():
+                    entry.pop('signature', None)
+                self._entries = entries
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"读取输出索引失败，将重新扫描: {e}")
+
+    def reconcile(self) -> dict:
+        """
+        与磁盘对账：新增未记录的音频，更新大小或 mtime 变化的条目 (内容哈希和时长置空)，删除已不存在的条目。
+
+        :return: {'added', 'updated', 'removed'} 计数。
+        """
+        found = {}
+        pending_dirs = [self.script_dir]
+        while pending_dirs:
+            try:
+                with os.scandir(pending_dirs.pop()) as it:
+                    for entry in it:
+                        if entry.name.startswith('.'):
+                            continue
+                        if entry.is_dir():
+                            pending_dirs.append(entry.path)
+                        # 候选版本 (见 dubbing_tool.takes) 不是正式音频，不计入索引，也不参与剧本同步
+                        elif entry.name.lower().endswith(AUDIO_EXTENSIONS) and not is_take_path(entry.name):
+                            st = entry.stat()
+                            found[self._key(entry.path)] = (st.st_size, st.st_mtime)
+            except FileNotFoundError:
+                continue
+
+        counts = {'added': 0, 'updated': 0, 'removed': 0}
+        with self._lock:
+            for key in list(self._entries):
+                if key not in found:
+                    del self._entries[key]
+                    counts['removed'] += 1
+            for key, (size, mtime) in found.items():
+                entry = self._entries.get(key)
+                if entry and entry.get('size') == size and entry.get('mtime') == mtime:
+                    continue
+                counts['updated' if entry else 'added'] += 1
+                self._entries[key] = {'size': size, 'mtime': mtime, 'sha256': None, 'duration': None,
+                                      'params_hash': None, 'line_id': None, SIGNATURE_KEY: None}
+            if any(counts.values()):
+                self._dirty = True
+        self.save()
+        return counts
+
+    def contains(self, path: str) -> bool:
+        """path 是否为已生成的音频 (内存查找，不访问磁盘)。"""
+        return self._key(path) in self._entries
+
+    __contains__ = contains
+
+    def get(self, path: str) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(self._key(path))
+            return dict(entry) if entry else None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def record(self, path: str, line_id: str | None = None, params: dict | None = None):
+        """
+        在音频文件及其 .json 元数据写入完成后调用，记录其大小、mtime、内容哈希、时长、
+        生成请求的参数哈希和元数据中的对话签名。
+
+        :param line_id: 对应对话的 line_id。
+        :param params: 生成这个文件的请求参数；不提供时取自 .json 元数据。
+        """
+        metadata = read_metadata(path) or {}
+        if params is None and metadata:
+            params = {k: v for k, v in metadata.items() if k not in METADATA_EXTRA_KEYS}
+        try:
+            st = os.stat(path)
+            entry = {'size': st.st_size, 'mtime': st.st_mtime, 'sha256': hash_file(path), 'duration': audio_duration(path),
+                     'params_hash': hash_params(params) if params else None, 'line_id': line_id,
+                     SIGNATURE_KEY: metadata.get(SIGNATURE_KEY)}
+        except OSError as e:
+            print(f"更新输出索引失败: {e}")
+            return
+        with self._lock:
+            self._entries[self._key(path)] = entry
+            self._dirty = True
+        self._maybe_save()
+
+    def find_by_params(self, params: dict) -> list:
+        """返回由这组请求参数生成的音频路径 (按参数哈希匹配)。"""
+        params_hash = hash_params(params)
+        with self._lock:
+            return [self._abspath(key) for key, entry in self._entries.items() if entry.get('params_hash') == params_hash]
+
+    def remove(self, path: str):
+        with self._lock:
+            if self._entries.pop(self._key(path), None) is not None:
+                self._dirty = True
+        self._maybe_save()
+
+    def _maybe_save(self):
+        if time.monotonic() - self._last_save >= SAVE_INTERVAL:
+            self.save()
+
+    def save(self):
+        """把索引写入磁盘 (原子写入)；没有改动时什么也不做。"""
+        # 串行化写盘，避免较旧的快照覆盖较新的
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                data = json.dumps(self._entries, ensure_ascii=False)
+                self._dirty = False
+                self._last_save = time.monotonic()
+            try:
+                os.makedirs(self.script_dir, exist_ok=True)
+                with atomic_open(self.path, 'w', encoding='utf-8') as f:
+                    f.write(data)
+            except OSError as e:
+                print(f"保存输出索引失败: {e}")
+                with self._lock:
+                    self._dirty = True
+
+    def _abspath(self, key: str) -> str:
+        return os.path.join(self.script_dir, key)
+
+    def sync(self, expected: list) -> dict:
+        """
+        剧本修改后，把未改动对话的已有音频移动到它们的新路径，并把路径上内容已过时的音频移走。
+
+        :param expected: [(output_path, line_id, signature)]，每句对话当前应在的路径、稳定标识和签名 (见 batch.line_signature)。
+                         signature 为 None (如角色未配置模型) 的对话不参与匹配。
+        :return: {'moved', 'invalidated'} 计数。invalidated 为已不对应任何对话、被移到 _orphaned 目录的音频数。
+        """
+        with self._lock:
+            entries = {key: dict(entry) for key, entry in self._entries.items()}
+        # 补全缺少签名的条目 (外部写入或早于此功能生成的文件)
+        for key, entry in entries.items():
+            if entry.get(SIGNATURE_KEY) is None:
+                entry[SIGNATURE_KEY] = read_signature(self._abspath(key))
+
+        wanted = {}  # 目标 key -> (line_id, signature)
+        claimed = set()
+        for output_path, line_id, signature in expected:
+            if not output_path:
+                continue
+            if signature:
+                wanted[self._key(output_path)] = (line_id, signature)
+            elif self._key(output_path) in entries:
+                # 无法计算签名的对话 (如角色暂未配置模型)，其路径上的音频保持不动
+                claimed.add(self._key(output_path))
+
+        for key, (_, signature) in wanted.items():
+            entry = entries.get(key)
+            # 无法确定内容的旧文件保持不动
+            if entry and entry[SIGNATURE_KEY] in (None, signature):
+                claimed.add(key)
+
+        by_signature = {}
+        for key, entry in entries.items():
+            if key not in claimed and entry[SIGNATURE_KEY]:
+                by_signature.setdefault(entry[SIGNATURE_KEY], []).append(key)
+
+        moves = []  # (src key, dst key)
+        for key, (line_id, signature) in wanted.items():
+            if key in claimed:
+                continue
+            candidates = by_signature.get(signature)
+            if not candidates:
+                continue
+            # 优先选择 line_id 相同的旧文件 (剧本中写明 id 时可以精确对应)
+            source = next((src for src in candidates if entries[src].get('line_id') == line_id), candidates[0])
+            candidates.remove(source)
+            moves.append((source, key))
+            claimed.add(key)
+
+        sources = {src for src, _ in moves}
+        # 不再对应任何对话的旧音频 (包括目标路径上内容不符的) 移到 _orphaned 目录；
+        # 它们仍在索引中，剧本改回去时还可以被移回来
+        orphan_prefix = os.path.normcase(ORPHANED_DIRNAME + os.sep)
+        displaced = [key for key, entry in entries.items()
+                     if key not in claimed and key not in sources and entry[SIGNATURE_KEY]
+                     and not key.startswith(orphan_prefix)]
+        orphan_moves = [(key, os.path.join(ORPHANED_DIRNAME, key)) for key in displaced]
+
+        counts = {'moved': 0, 'invalidated': 0}
+        staged = []
+        for key, orphan_key in orphan_moves:
+            try:
+                move_output(self._abspath(key), self._abspath(orphan_key))
+                staged.append((key, orphan_key))
+                counts['invalidated'] += 1
+            except OSError as e:
+                print(f"移动过时音频 {key} 失败: {e}")
+        # 两阶段移动：先移到临时名，再移到目标路径，避免互换位置时相互覆盖
+        temp_moves = []
+        for src, dst in moves:
+            temp_key = os.path.join(os.path.dirname(src), f".{os.path.basename(src)}.moving")
+            try:
+                move_output(self._abspath(src), self._abspath(temp_key))
+                temp_moves.append((src, temp_key, dst))
+            except OSError as e:
+                print(f"移动音频 {src} 失败: {e}")
+        for src, temp_key, dst in temp_moves:
+            try:
+                move_output(self._abspath(temp_key), self._abspath(dst))
+                staged.append((src, dst))
+                counts['moved'] += 1
+            except OSError as e:
+                print(f"移动音频 {src} 失败: {e}")
+                try:
+                    move_output(self._abspath(temp_key), self._abspath(src))
+                except OSError:
+                    pass
+
+        with self._lock:
+            for key, entry in entries.items():
+                if key in self._entries:
+                    self._entries[key][SIGNATURE_KEY] = entry[SIGNATURE_KEY]
+            moved_entries = {src: self._entries.pop(src) for src, _ in staged if src in self._entries}
+            for src, dst in staged:
+                if src in moved_entries:
+                    self._entries[dst] = moved_entries[src]
+            for key, (line_id, _) in wanted.items():
+                if key in self._entries and key in claimed:
+                    self._entries[key]['line_id'] = line_id
+            self._dirty = True
+        self.save()
+        return counts
+
+
+def expected_outputs(script_data: dict, dialogues, character_models: dict, default_params: dict, output_dir: str) -> list:
+    """
+    剧本中每句对话当前应有的输出：[(output_path, line_id, signature)]，signature 见 batch.line_signature。
+    """
+    return [(get_output_path(output_dir, script_data, info), info.get('line_id'),
+             line_signature(info, character_models.get(info['character']), default_params))
+            for info in dialogues]
+
+
+def sync_script_outputs(manifest: OutputManifest, script_data: dict, dialogues: list, character_models: dict,
+                        default_params: dict, output_dir: str) -> dict:
+    """
+    打开 (修改过的) 剧本时调用：把签名未变的已有音频移动到对话的新路径，
+    签名变化 (剧本中的文本、情感，角色模型或全局的语言设置) 的对话的旧音频移到 _orphaned 目录，
+    使其显示为缺失并进入下次批量生成。签名与生成音频时写入元数据的签名比较，
+    在详情页中修改文本或参数后手动生成的音频不受影响。
+
+    :param dialogues: 对话信息列表 (来自 get_all_dialogues)。
+    :param character_models: 角色到模型的映射。
+    :param default_params: 全局默认推理参数。
+    :return: {'moved', 'invalidated'} 计数。
+    """
+    return manifest.sync(expected_outputs(script_data, dialogues, character_models, default_params, output_dir))
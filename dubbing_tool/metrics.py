@@ -0,0 +1,373 @@
+import os
+import json
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from dubbing_tool.audio import audio_duration
+from dubbing_tool.utils import atomic_open, sanitize_filename
+
+# 每句记录的耗时阶段
+PHASE_QUEUE_WAIT = "queue_wait"    # 等待请求名额 (RequestScheduler) 和流水线下载队列
+PHASE_INFER = "infer"              # 推理请求 (POST) 的往返时间
+PHASE_SERVER = "server"            # 服务器处理时间 (X-Process-Time 响应头，没有时为收到响应头的时间)
+PHASE_DOWNLOAD = "download"        # 接收音频数据 (不含写盘)
+PHASE_DISK_WRITE = "disk_write"    # 写入音频文件 (包括长句片段的拼接)
+PHASE_POSTPROCESS = "postprocess"  # 音频后处理
+PHASES = (PHASE_QUEUE_WAIT, PHASE_INFER, PHASE_SERVER, PHASE_DOWNLOAD, PHASE_DISK_WRITE, PHASE_POSTPROCESS)
+
+# Prometheus 直方图的桶上限
+SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+RTF_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 5)
+# 文本长度分组 (字数上限)，用于找出哪些长度的句子合成较慢
+TEXT_LENGTH_BUCKETS = (10, 20, 50, 100, 200)
+METRICS_DIRNAME = ".metrics"
+PROMETHEUS_FILENAME = "latest.prom"
+# 报告的类别：批量生成、界面中的逐句生成 (包括预取)、多版本生成
+KIND_BATCH = "batch"
+KIND_INTERACTIVE = "interactive"
+KIND_TAKES = "takes"
+METRIC_PREFIX = "dubbing"
+
+# 当前正在记录的 LineTrace：每个线程、每个协程任务 (见 dubbing_tool.async_api_client) 各自独立
+_current_trace = ContextVar('current_trace', default=None)
+
+
+class LineTrace:
+    """
+    一句对话生成过程中各阶段的耗时和传输字节数。
+
+    同一条任务的推理和下载可能在不同线程中进行 (流水线模式)，长句的片段也在多个线程中并行合成，
+    这些线程通过 tracing() 把同一个 LineTrace 设为当前记录，因此各方法都是线程安全的。
+    并行片段的耗时按累计值记录。
+
+    synthesis 是至少有一个 HTTP 请求 (推理、下载) 在进行中的墙钟时间，并行的片段不重复计算，
+    不含排队、重试等待和写元数据、任务日志等本地操作，用于计算实时率。
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.phases = {}
+        self.bytes = 0
+        self.backend = None
+        self.synthesis = 0.0
+        self._in_flight = 0
+        self._in_flight_since = None
+        self._lock = Lock()
+
+    def add(self, phase: str, seconds: float):
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def add_bytes(self, count: int):
+        with self._lock:
+            self.bytes += count
+
+    def share(self, count: int) -> 'LineTrace':
+        """
+        把一次合并请求 (/infer_multi) 的记录平均分摊给其中的 count 句，返回其中一句的记录。
+        合并请求没有逐句的耗时，按句数平均是最接近的估计。
+        """
+        trace = LineTrace()
+        with self._lock:
+            trace.started = self.started
+            trace.phases = {phase: seconds / count for phase, seconds in self.phases.items()}
+            trace.bytes = self.bytes // count
+            trace.backend = self.backend
+            trace.synthesis = self.synthesis / count
+        return trace
+
+    @contextmanager
+    def request(self):
+        """with 块内有一个 HTTP 请求在进行中 (可以在多个线程中嵌套、并行)。"""
+        with self._lock:
+            if self._in_flight == 0:
+                self._in_flight_since = time.monotonic()
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                if self._in_flight == 0:
+                    self.synthesis += time.monotonic() - self._in_flight_since
+
+    @contextmanager
+    def measure(self, phase: str):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(phase, time.monotonic() - start)
+
+
+@contextmanager
+def tracing(trace: LineTrace | None):
+    """在 with 块内，当前线程 (或协程任务) 的请求耗时记录到 trace 中；trace 为 None 时不记录。"""
+    token = _current_trace.set(trace)
+    try:
+        yield
+    finally:
+        _current_trace.reset(token)
+
+
+def current_trace() -> LineTrace | None:
+    return _current_trace.get()
+
+
+def add_phase(phase: str, seconds: float):
+    """向当前线程的记录添加一段耗时；没有正在记录的任务时什么也不做。"""
+    trace = current_trace()
+    if trace is not None:
+        trace.add(phase, seconds)
+
+
+def add_bytes(count: int):
+    trace = current_trace()
+    if trace is not None:
+        trace.add_bytes(count)
+
+
+def set_backend(base_url: str):
+    """记录执行推理的后端。"""
+    trace = current_trace()
+    if trace is not None:
+        trace.backend = base_url
+
+
+@contextmanager
+def measure(phase: str):
+    """记录 with 块的耗时到当前线程的记录中。"""
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+    with trace.measure(phase):
+        yield
+
+
+@contextmanager
+def measure_request():
+    """把 with 块计入当前线程记录的 HTTP 请求时间 (LineTrace.synthesis)。"""
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+    with trace.request():
+        yield
+
+
+def script_metrics_dir(output_dir: str, script_data: dict) -> str:
+    """剧本的耗时报告目录：<output_dir>/<剧本名>/.metrics。"""
+    script_name = sanitize_filename(script_data.get('script_name', 'UntitledScript'))
+    return os.path.join(output_dir, script_name, METRICS_DIRNAME)
+
+
+def text_length_label(length: int) -> str:
+    """把文本长度归入 TEXT_LENGTH_BUCKETS 分组，如 "21-50"、"200+"。"""
+    lower = 0
+    for upper in TEXT_LENGTH_BUCKETS:
+        if length <= upper:
+            return f"{lower}-{upper}"
+        lower = upper + 1
+    return f"{TEXT_LENGTH_BUCKETS[-1]}+"
+
+
+def summarize(values: list) -> dict:
+    """计数、总和、平均值、分位数和最大值。"""
+    if not values:
+        return {'count': 0}
+    values = sorted(values)
+
+    def quantile(q):
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    return {'count': len(values), 'sum': round(sum(values), 3), 'mean': round(sum(values) / len(values), 3),
+            'p50': round(quantile(0.5), 3), 'p90': round(quantile(0.9), 3), 'p99': round(quantile(0.99), 3),
+            'max': round(values[-1], 3)}
+
+
+def _escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels: dict) -> str:
+    return ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels.items())
+
+
+class GenerationMetrics:
+    """
+    一次批量生成 (或界面中一个剧本的逐句生成、多版本生成) 的逐句耗时记录，
+    可导出为 JSON 报告 (report) 和 Prometheus 文本格式 (to_prometheus)。
+
+    每句记录排队等待、推理请求、服务器处理、下载、写盘和后处理的耗时，接收字节数、音频时长和实时率
+    (HTTP 合成请求的耗时 LineTrace.synthesis / 音频时长)，并以模型、角色、后端和文本长度分组标注。
+    """
+
+    def __init__(self, kind: str = KIND_BATCH):
+        """
+        :param kind: 报告的类别 (KIND_BATCH 等)，决定报告的文件名。
+        """
+        self.kind = kind
+        self._lock = Lock()
+        self.records = []
+        self.started_at = time.time()
+
+    def record(self, dialogue_info: dict, params: dict, output_path: str, trace: LineTrace | None, success: bool):
+        """
+        记录一句的结果 (在工作线程中调用)。
+
+        :param trace: 该句的 LineTrace；为 None 或没有任何请求耗时时视为命中缓存。
+        """
+        trace = trace if trace else LineTrace()
+        total = time.monotonic() - trace.started
+        phases = {phase: round(seconds, 4) for phase, seconds in trace.phases.items()}
+        duration = audio_duration(output_path) if success else None
+        text = params.get('text') or dialogue_info.get('text') or ''
+        entry = {
+            'line_id': dialogue_info.get('line_id'),
+            'scene_idx': dialogue_info.get('scene_idx'),
+            'dialogue_idx': dialogue_info.get('dialogue_idx'),
+            'model': params.get('model_name'),
+            'character': dialogue_info.get('character'),
+            'backend': trace.backend or "",
+            'text_length': len(text),
+            'success': success,
+            'cached': success and not any(phase in phases for phase in (PHASE_INFER, PHASE_DOWNLOAD)),
+            'phases': phases,
+            'total': round(total, 4),
+            'bytes': trace.bytes,
+            'synthesis': round(trace.synthesis, 4),
+            'duration': duration,
+            'rtf': round(trace.synthesis / duration, 4) if duration and trace.synthesis else None,
+        }
+        with self._lock:
+            self.records.append(entry)
+
+    def _snapshot(self) -> list:
+        with self._lock:
+            return list(self.records)
+
+    def report(self) -> dict:
+        """
+        汇总为 JSON 报告：整体的各阶段耗时分布，按模型、角色、后端和文本长度分组的耗时与实时率，以及逐句记录。
+        命中缓存的句子不计入耗时分布。
+        """
+        records = self._snapshot()
+        synthesized = [r for r in records if r['success'] and not r['cached']]
+
+        def group_summary(key):
+            groups = {}
+            for r in synthesized:
+                name = text_length_label(r['text_length']) if key == 'text_length' else r[key]
+                groups.setdefault(name or "", []).append(r)
+            return {name: {'lines': len(rows),
+                           'total': summarize([r['total'] for r in rows]),
+                           'rtf': summarize([r['rtf'] for r in rows if r['rtf'] is not None]),
+                           'audio_seconds': round(sum(r['duration'] or 0 for r in rows), 3),
+                           'bytes': sum(r['bytes'] for r in rows)}
+                    for name, rows in sorted(groups.items(), key=lambda item: str(item[0]))}
+
+        return {
+            'started_at': self.started_at,
+            'finished_at': time.time(),
+            'lines': len(records),
+            'succeeded': sum(1 for r in records if r['success']),
+            'failed': sum(1 for r in records if not r['success']),
+            'cached': sum(1 for r in records if r['cached']),
+            'bytes': sum(r['bytes'] for r in records),
+            'audio_seconds': round(sum(r['duration'] or 0 for r in records if r['success']), 3),
+            'phases': {phase: summarize([r['phases'][phase] for r in synthesized if phase in r['phases']])
+                       for phase in PHASES},
+            'total': summarize([r['total'] for r in synthesized]),
+            'synthesis': summarize([r['synthesis'] for r in synthesized]),
+            'rtf': summarize([r['rtf'] for r in synthesized if r['rtf'] is not None]),
+            'by_model': group_summary('model'),
+            'by_character': group_summary('character'),
+            'by_backend': group_summary('backend'),
+            'by_text_length': group_summary('text_length'),
+            'records': records,
+        }
+
+    def to_prometheus(self) -> str:
+        """
+        导出为 Prometheus 文本格式 (可由 node_exporter 的 textfile collector 采集)。
+        直方图以 model、character、backend、text_length 为标签。
+        """
+        records = self._snapshot()
+        histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+        counters = {}
+
+        def observe(name, buckets, labels, value):
+            key = (name, tuple(labels.items()))
+            entry = histograms.setdefault(key, [buckets, [0] * len(buckets), 0.0, 0])
+            for i, upper in enumerate(buckets):
+                if value <= upper:
+                    entry[1][i] += 1
+            entry[2] += value
+            entry[3] += 1
+
+        def increment(name, labels, value=1):
+            key = (name, tuple(labels.items()))
+            counters[key] = counters.get(key, 0) + value
+
+        for r in records:
+            labels = {'model': r['model'] or "", 'character': r['character'] or "", 'backend': r['backend'],
+                      'text_length': text_length_label(r['text_length'])}
+            status = "failed" if not r['success'] else "cached" if r['cached'] else "synthesized"
+            increment(f"{METRIC_PREFIX}_lines_total", {**labels, 'status': status})
+            increment(f"{METRIC_PREFIX}_bytes_received_total", labels, r['bytes'])
+            if status != "synthesized":
+                continue
+            for phase, seconds in r['phases'].items():
+                observe(f"{METRIC_PREFIX}_phase_seconds", SECONDS_BUCKETS, {**labels, 'phase': phase}, seconds)
+            observe(f"{METRIC_PREFIX}_line_seconds", SECONDS_BUCKETS, labels, r['total'])
+            if r['rtf'] is not None:
+                observe(f"{METRIC_PREFIX}_realtime_factor", RTF_BUCKETS, labels, r['rtf'])
+            if r['duration']:
+                increment(f"{METRIC_PREFIX}_audio_seconds_total", labels, r['duration'])
+
+        help_text = {
+            f"{METRIC_PREFIX}_lines_total": ("counter", "生成的句数 (按结果分类)"),
+            f"{METRIC_PREFIX}_bytes_received_total": ("counter", "接收的音频字节数"),
+            f"{METRIC_PREFIX}_audio_seconds_total": ("counter", "生成的音频总时长 (秒)"),
+            f"{METRIC_PREFIX}_phase_seconds": ("histogram", "每句各阶段的耗时 (秒)"),
+            f"{METRIC_PREFIX}_line_seconds": ("histogram", "每句的总耗时 (秒)"),
+            f"{METRIC_PREFIX}_realtime_factor": ("histogram", "合成耗时与音频时长之比"),
+        }
+        lines = []
+        for name, (kind, description) in help_text.items():
+            counter_rows = sorted((labels, value) for (metric, labels), value in counters.items() if metric == name)
+            histogram_rows = sorted((labels, entry) for (metric, labels), entry in histograms.items() if metric == name)
+            if not counter_rows and not histogram_rows:
+                continue
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in counter_rows:
+                lines.append(f"{name}{{{_labels(dict(labels))}}} {round(value, 4)}")
+            for labels, (buckets, counts, total, count) in histogram_rows:
+                label_text = _labels(dict(labels))
+                for upper, bucket_count in zip(buckets, counts):
+                    lines.append(f'{name}_bucket{{{label_text},le="{upper}"}} {bucket_count}')
+                lines.append(f'{name}_bucket{{{label_text},le="+Inf"}} {count}')
+                lines.append(f"{name}_sum{{{label_text}}} {round(total, 4)}")
+                lines.append(f"{name}_count{{{label_text}}} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, metrics_dir: str) -> tuple[str, str]:
+        """
+        写出 JSON 报告 (<类别>-<开始时间>.json，同一实例再次写出时覆盖) 和 Prometheus 文件 (原子写入)。
+        批量生成的 Prometheus 文件为 latest.prom，其他类别为 <类别>.prom，互不覆盖。
+
+        :return: (JSON 报告路径, Prometheus 文件路径)。
+        """
+        os.makedirs(metrics_dir, exist_ok=True)
+        report_name = time.strftime(f"{self.kind}-%Y%m%d-%H%M%S.json", time.localtime(self.started_at))
+        report_path = os.path.join(metrics_dir, report_name)
+        with atomic_open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+        prometheus_name = PROMETHEUS_FILENAME if self.kind == KIND_BATCH else f"{self.kind}.prom"
+        prometheus_path = os.path.join(metrics_dir, prometheus_name)
+        with atomic_open(prometheus_path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        return report_path, prometheus_path
@@ -0,0 +1,224 @@
+import os
+import json
+import wave
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+from dubbing_tool.utils import atomic_open
+
+try:
+    import numpy as np
+except ImportError:  # 后处理是可选功能，没有 numpy 时禁用
+    np = None
+
+DEFAULT_TARGET_LOUDNESS_DB = -20.0
+DEFAULT_PEAK_LIMIT_DB = -1.0
+DEFAULT_TRIM_THRESHOLD_DB = -50.0
+DEFAULT_TRIM_PADDING = 0.05
+# 后处理版本号：处理算法变化时递增，使旧的处理记录失效
+POSTPROCESS_VERSION = 1
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _metadata_path(audio_path: str) -> str:
+    return os.path.splitext(audio_path)[0] + ".json"
+
+
+def _db(value: float) -> float:
+    return float(20 * np.log10(max(value, 1e-10)))
+
+
+def _read_pcm(path: str):
+    """读取 WAV 为 (采样数, 声道数) 的 float32 数组，取值范围 [-1, 1]。"""
+    with wave.open(path, 'rb') as w:
+        channels, sample_width, frame_rate = w.getnchannels(), w.getsampwidth(), w.getframerate()
+        data = w.readframes(w.getnframes())
+    if sample_width == 1:
+        samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif sample_width == 2:
+        samples = np.frombuffer(data, dtype='<i2').astype(np.float32) / 32768.0
+    elif sample_width == 4:
+        samples = np.frombuffer(data, dtype='<i4').astype(np.float32) / 2147483648.0
+    else:
+        raise ValueError(f"不支持的采样宽度: {sample_width * 8} 位")
+    return samples.reshape(-1, channels), frame_rate
+
+
+def _write_pcm(path: str, samples, frame_rate: int):
+    """把 float32 数组以 16 位 PCM 原子写入 path (写入新文件后替换，不修改原文件的内容)。"""
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767.0).round().astype('<i2')
+    with atomic_open(path, 'wb') as f:
+        with wave.open(f, 'wb') as w:
+            w.setnchannels(samples.shape[1])
+            w.setsampwidth(2)
+            w.setframerate(frame_rate)
+            w.writeframes(pcm.tobytes())
+
+
+def process_audio(samples, frame_rate: int, settings: dict):
+    """
+    对 PCM 数据依次进行首尾静音裁剪、重采样和响度归一化 (全部为向量化运算)。
+
+    - 裁剪：以各声道的最大绝对值低于 trim_threshold_db 的帧为静音，保留首尾各 trim_padding 秒；
+    - 重采样：sample_rate 不为 0 且与原采样率不同时，对各声道做线性插值；
+    - 响度：把 RMS 电平调整到 target_loudness_db (dBFS)，且峰值不超过 peak_limit_db。
+
+    :return: (处理后的数据, 采样率, 处理记录)。
+    """
+    record = {'source_sample_rate': frame_rate, 'source_duration': round(len(samples) / frame_rate, 3)}
+
+    threshold = 10 ** (settings['trim_threshold_db'] / 20)
+    loud = np.flatnonzero(np.abs(samples).max(axis=1) > threshold)
+    if len(loud):
+        padding = int(settings['trim_padding'] * frame_rate)
+        start = max(0, int(loud[0]) - padding)
+        end = min(len(samples), int(loud[-1]) + 1 + padding)
+    else:
+        start, end = 0, len(samples)
+    samples = samples[start:end]
+    record['trim_start'] = round(start / frame_rate, 3)
+    record['trim_end'] = round(end / frame_rate, 3)
+
+    target_rate = int(settings['sample_rate']) or frame_rate
+    if target_rate != frame_rate and len(samples) > 1:
+        length = max(1, int(round(len(samples) * target_rate / frame_rate)))
+        positions = np.arange(length, dtype=np.float64) * (frame_rate / target_rate)
+        source = np.arange(len(samples), dtype=np.float64)
+        samples = np.stack([np.interp(positions, source, samples[:, ch]) for ch in range(samples.shape[1])],
+                           axis=1).astype(np.float32)
+    record['sample_rate'] = target_rate
+
+    gain_db = 0.0
+    if len(samples):
+        rms = float(np.sqrt(np.mean(np.square(samples, dtype=np.float64))))
+        peak = float(np.abs(samples).max())
+        if rms > 0:
+            gain_db = settings['target_loudness_db'] - _db(rms)
+            # 不让峰值超过上限
+            gain_db = min(gain_db, settings['peak_limit_db'] - _db(peak))
+            samples = samples * np.float32(10 ** (gain_db / 20))
+    record['gain_db'] = round(gain_db, 2)
+    record['duration'] = round(len(samples) / target_rate, 3)
+    return samples, target_rate, record
+
+
+def process_file(audio_path: str, settings: dict) -> dict:
+    """
+    对一个音频文件进行后处理 (在工作进程中执行)，并把处理记录写入同名 .json 元数据的 postprocess 字段。
+
+    元数据中已有相同设置的处理记录、且文件内容哈希与记录中的处理结果一致时跳过 (返回的记录中 skipped 为 True)。
+    处理结果通过原子替换写入：输出文件与合成缓存之间的硬链接被断开，缓存中的原始音频不受影响。
+
+    :param audio_path: WAV 文件路径。
+    :param settings: 后处理设置 (见 PostProcessor)。
+    :return: 处理记录。
+    """
+    metadata_path = _metadata_path(audio_path)
+    try:
+        with open(metadata_path, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+    except (OSError, ValueError):
+        metadata = {}
+    previous = metadata.get('postprocess') if isinstance(metadata, dict) else None
+
+    source_hash = _hash_file(audio_path)
+    if previous and previous.get('settings') == settings and previous.get('output_sha256') == source_hash:
+        return {**previous, 'skipped': True}
+
+    samples, frame_rate = _read_pcm(audio_path)
+    samples, frame_rate, record = process_audio(samples, frame_rate, settings)
+    _write_pcm(audio_path, samples, frame_rate)
+    record.update(settings=settings, source_sha256=source_hash, output_sha256=_hash_file(audio_path))
+
+    if isinstance(metadata, dict):
+        metadata['postprocess'] = record
+        with atomic_open(metadata_path, 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, ensure_ascii=False, indent=2)
+    return {**record, 'skipped': False}
+
+
+class PostProcessor:
+    """
+    音频后处理阶段：响度归一化、首尾静音裁剪和重采样。
+
+    处理在进程池中执行 (NumPy 向量化运算)，不受工作线程之间 GIL 的限制；
+    批量引擎的每个工作线程写完音频后提交给进程池并等待结果，多个文件同时在不同的进程中处理。
+    """
+
+    def __init__(self, target_loudness_db: float = DEFAULT_TARGET_LOUDNESS_DB,
+                 peak_limit_db: float = DEFAULT_PEAK_LIMIT_DB, trim_threshold_db: float = DEFAULT_TRIM_THRESHOLD_DB,
+                 trim_padding: float = DEFAULT_TRIM_PADDING, sample_rate: int = 0, workers: int | None = None):
+        """
+        :param target_loudness_db: 目标 RMS 电平 (dBFS)。
+        :param peak_limit_db: 峰值上限 (dBFS)。
+        :param trim_threshold_db: 低于该电平视为静音 (dBFS)。
+        :param trim_padding: 裁剪后首尾保留的静音 (秒)。
+        :param sample_rate: 目标采样率，0 表示保持原采样率。
+        :param workers: 进程数，为 None 时使用 CPU 核数。
+        """
+        self.settings = {
+            'version': POSTPROCESS_VERSION,
+            'target_loudness_db': float(target_loudness_db),
+            'peak_limit_db': float(peak_limit_db),
+            'trim_threshold_db': float(trim_threshold_db),
+            'trim_padding': float(trim_padding),
+            'sample_rate': int(sample_rate),
+        }
+        self.workers = max(1, int(workers)) if workers else (os.cpu_count() or 1)
+        self._executor = None
+        self._lock = Lock()
+
+    @classmethod
+    def from_config(cls, postprocess_config: dict | None):
+        """
+        根据 config.yaml 中的 postprocess 配置段创建实例；未启用 (或缺少 numpy) 时返回 None。
+        """
+        if not postprocess_config or not postprocess_config.get('enabled', False):
+            return None
+        if np is None:
+            print("未安装 numpy，音频后处理已禁用。")
+            return None
+        return cls(
+            target_loudness_db=postprocess_config.get('target_loudness_db', DEFAULT_TARGET_LOUDNESS_DB),
+            peak_limit_db=postprocess_config.get('peak_limit_db', DEFAULT_PEAK_LIMIT_DB),
+            trim_threshold_db=postprocess_config.get('trim_threshold_db', DEFAULT_TRIM_THRESHOLD_DB),
+            trim_padding=postprocess_config.get('trim_padding', DEFAULT_TRIM_PADDING),
+            sample_rate=postprocess_config.get('sample_rate', 0),
+            workers=postprocess_config.get('workers'),
+        )
+
+    def submit(self, audio_path: str):
+        """提交一个文件，返回 concurrent.futures.Future (结果为处理记录)。"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            executor = self._executor
+        return executor.submit(process_file, audio_path, self.settings)
+
+    def process(self, audio_path: str) -> dict | None:
+        """
+        处理一个文件并等待完成 (可在多个线程中同时调用)。
+
+        :return: 处理记录；非 WAV 文件或处理失败时返回 None，原文件保持不变。
+        """
+        if not audio_path.lower().endswith(".wav"):
+            return None
+        try:
+            return self.submit(audio_path).result()
+        except Exception as e:
+            print(f"后处理 '{os.path.basename(audio_path)}' 失败: {e}")
+            return None
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
@@ -0,0 +1,99 @@
+from collections import deque
+from threading import Condition, Thread
+
+DEFAULT_PREFETCH_DEPTH = 3
+
+
+class Prefetcher:
+    """
+    审听时在后台预先生成接下来的几句缺失音频。
+
+    只有一个后台线程，一次只发出一个预取请求，尽量不与交互式的生成争抢服务器。
+    每次 schedule() 都会用新的任务列表替换尚未开始的预取 (用户跳到别处时旧的预取随之取消)；
+    已经发出的请求无法中途取消，会正常完成并保存。
+    """
+
+    def __init__(self, run_job, depth: int = DEFAULT_PREFETCH_DEPTH):
+        """
+        :param run_job: run_job(job) -> bool，在后台线程中生成并保存一条任务 (BatchJob)。
+        :param depth: 最多预取的句数。
+        """
+        self.run_job = run_job
+        self.depth = max(1, int(depth))
+        self._cond = Condition()
+        self._queue = deque()
+        self._running = None  # 正在生成的任务的输出路径
+        self._thread = None
+        self._stopped = False
+        self.stats = {'scheduled': 0, 'completed': 0, 'failed': 0, 'cancelled': 0}
+
+    def schedule(self, jobs):
+        """用 jobs 的前 depth 条替换尚未开始的预取。"""
+        with self._cond:
+            if self._stopped:
+                return
+            jobs = [job for job in jobs if job.output_path != self._running][:self.depth]
+            new_paths = {job.output_path for job in jobs}
+            old_paths = {job.output_path for job in self._queue}
+            self.stats['cancelled'] += len(old_paths - new_paths)
+            self.stats['scheduled'] += len(new_paths - old_paths)
+            self._queue = deque(jobs)
+            if self._thread is None:
+                self._thread = Thread(target=self._worker, name="prefetch", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def cancel(self) -> int:
+        """取消所有尚未开始的预取，返回取消的句数。"""
+        with self._cond:
+            cancelled = len(self._queue)
+            self._queue.clear()
+            self.stats['cancelled'] += cancelled
+            return cancelled
+
+    def discard(self, output_path: str):
+        """从预取队列中移除某一句 (用户手动生成该句时调用)。"""
+        with self._cond:
+            remaining = deque(job for job in self._queue if job.output_path != output_path)
+            self.stats['cancelled'] += len(self._queue) - len(remaining)
+            self._queue = remaining
+
+    def wait_idle(self, output_path: str):
+        """
+        如果该句正在预取，阻塞直到预取完成。
+        手动生成前调用，避免较晚完成的预取结果覆盖手动生成的音频。
+        """
+        with self._cond:
+            while self._running == output_path:
+                self._cond.wait()
+
+    @property
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._queue)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._queue.clear()
+            self._cond.notify_all()
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                job = self._queue.popleft()
+                self._running = job.output_path
+            success = False
+            try:
+                success = self.run_job(job)
+            except Exception as e:
+                print(f"预取 '{job.dialogue_info.get('text', '')[:15]}' 时发生错误: {e}")
+            finally:
+                with self._cond:
+                    self._running = None
+                    self.stats['completed' if success else 'failed'] += 1
+                    self._cond.notify_all()
@@ -0,0 +1,149 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager, contextmanager
+from threading import Condition
+
+# 优先级类别，数值越小越优先
+PRIORITY_INTERACTIVE = 0
+PRIORITY_PREFETCH = 1
+PRIORITY_BATCH = 2
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_PREFETCH: "prefetch", PRIORITY_BATCH: "batch"}
+
+
+class RequestScheduler:
+    """
+    所有发往推理服务的请求共享的优先级调度器。
+
+    同时在途的请求数不超过 max_concurrent。有空闲名额时，总是先放行优先级最高的等待者
+    (交互 > 预取 > 批量)，同一优先级内按先来后到。因此导演临时重新生成的一句
+    只需等待一个正在进行的请求结束，而不是排在几百条批量请求之后；批量任务会自动让路。
+
+    名额只在单次 HTTP 请求期间占用 (见 ApiClient._use_backend)，不会嵌套获取。
+    协程中的请求 (AsyncApiClient) 通过 async_slot 在同一个队列中排队。
+    """
+
+    def __init__(self, max_concurrent: int):
+        """
+        :param max_concurrent: 全局并发请求上限。
+        """
+        self.max_concurrent = max(1, int(max_concurrent))
+        self._cond = Condition()
+        self._heap = []  # (priority, ticket)
+        self._tickets = itertools.count()
+        self._active = 0
+        self._async_waiters = {}  # 条目 -> (事件循环, asyncio.Event)，见 async_slot
+        self._stats = {priority: {'queued': 0, 'active': 0, 'requests': 0, 'total_wait': 0.0, 'max_wait': 0.0}
+                       for priority in PRIORITY_NAMES}
+
+    def _enqueue(self, priority: int) -> tuple:
+        """在持有 _cond 时调用：排队，返回队列中的条目。"""
+        entry = (priority, next(self._tickets))
+        heapq.heappush(self._heap, entry)
+        self._stats[priority]['queued'] += 1
+        return entry
+
+    def _can_grant(self, entry: tuple) -> bool:
+        return self._active < self.max_concurrent and self._heap[0] == entry
+
+    def _grant(self, entry: tuple, started: float) -> float:
+        """在持有 _cond 且 _can_grant(entry) 时调用：出队并占用名额，返回排队等待的秒数。"""
+        heapq.heappop(self._heap)
+        stats = self._stats[entry[0]]
+        waited = time.monotonic() - started
+        self._active += 1
+        stats['queued'] -= 1
+        stats['active'] += 1
+        stats['requests'] += 1
+        stats['total_wait'] += waited
+        stats['max_wait'] = max(stats['max_wait'], waited)
+        # 队首变化后，其他等待者可能可以继续获取名额
+        self._notify()
+        return waited
+
+    def _abandon(self, entry: tuple):
+        """在持有 _cond 时调用：等待被中断，移出队列，否则它会一直挡在队首，后面的等待者永远拿不到名额。"""
+        self._heap.remove(entry)
+        heapq.heapify(self._heap)
+        self._stats[entry[0]]['queued'] -= 1
+        self._notify()
+
+    def _release(self, priority: int):
+        with self._cond:
+            self._active -= 1
+            self._stats[priority]['active'] -= 1
+            self._notify()
+
+    def _notify(self):
+        """在持有 _cond 时调用：唤醒所有线程和协程中的等待者。"""
+        self._cond.notify_all()
+        for loop, event in self._async_waiters.values():
+            loop.call_soon_threadsafe(event.set)
+
+    @contextmanager
+    def slot(self, priority: int = PRIORITY_BATCH):
+        """阻塞直到获得一个请求名额，退出时释放；as 子句得到排队等待的秒数。"""
+        started = time.monotonic()
+        with self._cond:
+            entry = self._enqueue(priority)
+            try:
+                while not self._can_grant(entry):
+                    self._cond.wait()
+            except BaseException:
+                self._abandon(entry)
+                raise
+            waited = self._grant(entry, started)
+        try:
+            yield waited
+        finally:
+            self._release(priority)
+
+    @asynccontextmanager
+    async def async_slot(self, priority: int = PRIORITY_BATCH):
+        """
+        slot 的协程版本 (见 dubbing_tool.async_api_client)：等待期间不阻塞事件循环，
+        与线程中的请求在同一个队列中按优先级排队。协程被取消时移出队列。
+        """
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        started = time.monotonic()
+        with self._cond:
+            entry = self._enqueue(priority)
+            self._async_waiters[entry] = (loop, event)
+        try:
+            while True:
+                with self._cond:
+                    if self._can_grant(entry):
+                        del self._async_waiters[entry]
+                        waited = self._grant(entry, started)
+                        break
+                    # 检查与清除在同一把锁内，之后的唤醒不会丢失
+                    event.clear()
+                await event.wait()
+        except BaseException:
+            with self._cond:
+                if self._async_waiters.pop(entry, None) is not None:
+                    self._abandon(entry)
+            raise
+        try:
+            yield waited
+        finally:
+            self._release(priority)
+
+    def get_stats(self) -> dict:
+        """
+        返回各优先级的队列状态：
+        {'interactive': {'queued', 'active', 'requests', 'avg_wait', 'max_wait'}, ...}
+        """
+        with self._cond:
+            return {
+                PRIORITY_NAMES[priority]: {
+                    'queued': stats['queued'],
+                    'active': stats['active'],
+                    'requests': stats['requests'],
+                    'avg_wait': round(stats['total_wait'] / stats['requests'], 3) if stats['requests'] else 0.0,
+                    'max_wait': round(stats['max_wait'], 3),
+                }
+                for priority, stats in self._stats.items()
+            }
@@ -1,22 +1,111 @@
+import os
+import re
+import sys
 import yaml
-from typing import Dict, Any
+import pickle
+import hashlib
+from array import array
+from collections.abc import Sequence
+from typing import Dict, Any, List
+from dubbing_tool.utils import atomic_open, get_app_dir
 
-def parse_script(file_path: str) -> Dict[str, Any] | None:
+# 有 libyaml 时使用 C 实现的加载器，比纯 Python 的 SafeLoader 快一个数量级
+_YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# 解析结果的磁盘缓存；格式变化时递增版本号使旧缓存失效。
+# 与合成缓存 (cache/) 分开存放，避免被计入合成缓存的容量和 LRU 淘汰
+SCRIPT_CACHE_VERSION = 1
+DEFAULT_SCRIPT_CACHE_DIR = os.path.join(get_app_dir(), 'script_cache')
+_TABLE_KEY = '_dialogue_table'
+_MISSING = None
+
+# 原始文本剧本 (.txt)：场景标题行 + "角色：台词" 行
+RAW_SCRIPT_EXTENSIONS = ('.txt',)
+RAW_DEFAULT_EMOTION = "默认"
+RAW_DEFAULT_SCENE_NAME = "未命名章节"
+# 与原始剧本同名的角色映射文件，如 青丘山剧本.txt -> 青丘山剧本.characters.yaml
+CHARACTER_SIDECAR_SUFFIX = '.characters.yaml'
+# "角色：台词" 或 "角色（情感）：台词"，冒号可以是全角或半角
+_RAW_LINE_PATTERN = re.compile(r'^(?P<character>[^：:（(]+?)\s*(?:[（(](?P<emotion>[^）)]*)[）)])?\s*[：:]\s*(?P<text>.+)$')
+
+def _load_cached(cache_path: str, stamp: tuple):
+    try:
+        with open(cache_path, 'rb') as f:
+            cached = pickle.load(f)
+        if cached.get('version') == SCRIPT_CACHE_VERSION and cached.get('stamp') == stamp:
+            return cached['script_data'], cached['table']
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"读取剧本缓存失败，将重新解析: {e}")
+    return None
+
+def _save_cached(cache_path: str, stamp: tuple, script_data: dict, table):
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with atomic_open(cache_path, 'wb') as f:
+            pickle.dump({'version': SCRIPT_CACHE_VERSION, 'stamp': stamp, 'script_data': script_data, 'table': table},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception as e:
+        print(f"写入剧本缓存失败: {e}")
+
+def is_raw_script(file_path: str) -> bool:
+    """是否为原始文本格式 (.txt) 的剧本。"""
+    return os.path.splitext(file_path)[1].lower() in RAW_SCRIPT_EXTENSIONS
+
+def _file_stamp(path: str):
+    try:
+        st = os.stat(path)
+        return (st.st_size, st.st_mtime_ns)
+    except FileNotFoundError:
+        return None
+
+def parse_script(file_path: str, cache_dir: str | None = DEFAULT_SCRIPT_CACHE_DIR,
+                 character_models: dict | None = None) -> Dict[str, Any] | None:
     """
-    解析 YAML 格式的剧本文件。
+    解析剧本文件，并构建展开后的对话表 (见 get_all_dialogues)。
+
+    支持 YAML 格式的剧本和原始文本格式 (.txt，见 iter_raw_script) 的剧本。
+    解析结果按文件路径缓存在 cache_dir 中，以文件大小和修改时间为键；
+    再次打开未修改的剧本时直接读取缓存，不再解析 YAML。
 
     :param file_path: 剧本文件的路径。
+    :param cache_dir: 解析缓存目录，为 None 时不使用缓存。
+    :param character_models: 原始文本剧本的默认角色映射 (如配置文件中的映射)，角色映射文件中的定义优先。
     :return: 包含剧本内容的字典，如果失败则返回 None。
     """
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            script_data = yaml.safe_load(f)
+        raw = is_raw_script(file_path)
+        st = os.stat(file_path)
+        stamp = (st.st_size, st.st_mtime_ns)
+        if raw:
+            # 角色映射文件和默认映射变化时缓存同样失效
+            stamp += (_file_stamp(character_sidecar_path(file_path)), sorted((character_models or {}).items()))
+        cache_path = None
+        if cache_dir:
+            path_key = hashlib.sha1(os.path.abspath(file_path).encode('utf-8')).hexdigest()
+            cache_path = os.path.join(cache_dir, path_key + '.pickle')
+            cached = _load_cached(cache_path, stamp)
+            if cached:
+                script_data, table = cached
+                script_data[_TABLE_KEY] = table
+                return script_data
+
+        if raw:
+            script_data = parse_raw_script(file_path, character_models)
+        else:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                script_data = yaml.load(f, Loader=_YamlLoader)
         
         # 基本的验证
-        if 'scenes' not in script_data or not isinstance(script_data['scenes'], list):
+        if not isinstance(script_data, dict) or 'scenes' not in script_data or not isinstance(script_data['scenes'], list):
             print(f"错误: 剧本 '{file_path}' 缺少 'scenes' 列表。")
             return None
-            
+
+        table = DialogueTable(script_data)
+        if cache_path:
+            _save_cached(cache_path, stamp, script_data, table)
+        script_data[_TABLE_KEY] = table
         return script_data
 
     except FileNotFoundError:
@@ -29,6 +118,213 @@ def parse_script(file_path: str) -> Dict[str, Any] | None:
         print(f"解析文件时发生未知错误: {e}")
         return None
 
+def line_fingerprint(dialogue: Dict[str, Any]) -> str:
+    """
+    根据角色、文本和情感计算对话的内容指纹 (与所在位置无关)。
+    """
+    content = f"{dialogue.get('character', '')}\0{dialogue.get('text', '')}\0{dialogue.get('emotion', '')}"
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()[:12]
+
+def assign_line_id(dialogue: Dict[str, Any], seen: dict) -> str:
+    """
+    返回对话的 line_id：剧本中写了 id 时直接使用，否则为内容指纹，
+    重复出现的相同对话依次加上 ~2, ~3 后缀 (seen 记录同一剧本中各指纹的出现次数)。
+    """
+    if dialogue.get('id') is not None:
+        return str(dialogue['id'])
+    line_id = line_fingerprint(dialogue)
+    seen[line_id] = seen.get(line_id, 0) + 1
+    return line_id if seen[line_id] == 1 else f"{line_id}~{seen[line_id]}"
+
+def character_sidecar_path(file_path: str) -> str:
+    return os.path.splitext(file_path)[0] + CHARACTER_SIDECAR_SUFFIX
+
+def load_character_sidecar(file_path: str) -> dict:
+    """
+    读取原始剧本旁的角色映射文件 (<剧本名>.characters.yaml)。
+    文件内容可以直接是 角色: 模型 的映射，也可以写在 character_models 键下。没有该文件时返回空字典。
+    """
+    sidecar_path = character_sidecar_path(file_path)
+    try:
+        with open(sidecar_path, 'r', encoding='utf-8') as f:
+            data = yaml.load(f, Loader=_YamlLoader) or {}
+    except FileNotFoundError:
+        return {}
+    except yaml.YAMLError as e:
+        print(f"错误: 解析角色映射文件 '{sidecar_path}' 时出错: {e}")
+        return {}
+    if isinstance(data, dict) and isinstance(data.get('character_models'), dict):
+        data = data['character_models']
+    return dict(data) if isinstance(data, dict) else {}
+
+def raw_script_header(file_path: str, character_models: dict | None = None) -> Dict[str, Any]:
+    """
+    原始剧本的剧本信息 (不含场景)：剧本名取文件名，角色映射合并默认映射和角色映射文件 (后者优先)。
+    可以直接作为 get_output_path 等函数的 script_data 使用。
+    """
+    return {
+        'script_name': os.path.splitext(os.path.basename(file_path))[0],
+        'character_models': {**(character_models or {}), **load_character_sidecar(file_path)},
+    }
+
+def _iter_raw_entries(file_path: str, default_emotion: str):
+    """逐行读取原始剧本，产生 (场景标题, None) 或 (None, 对话字典)。"""
+    with open(file_path, 'r', encoding='utf-8-sig') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            match = _RAW_LINE_PATTERN.match(line)
+            if not match:
+                yield line, None
+                continue
+            yield None, {
+                'character': sys.intern(match.group('character')),
+                'text': match.group('text').strip(),
+                'emotion': sys.intern((match.group('emotion') or '').strip() or default_emotion),
+            }
+
+def iter_raw_script(file_path: str, default_emotion: str = RAW_DEFAULT_EMOTION):
+    """
+    逐行流式解析原始文本格式的剧本，惰性地产生展开后的对话信息 (与 get_all_dialogues 的元素结构相同)。
+
+    格式为：不含冒号的非空行是场景标题，之后的 "角色：台词" 行属于该场景；
+    可以用 "角色（情感）：台词" 指定情感，未指定时使用 default_emotion。空行被忽略。
+    不需要读完整个文件就能拿到第一个场景的对话，适合超大剧本边读边生成。
+
+    :param file_path: 剧本文件的路径。
+    :param default_emotion: 未标注情感的对话使用的情感。
+    """
+    seen = {}
+    scene_idx = -1
+    scene_name = None
+    dialogue_idx = 0
+    for header, dialogue in _iter_raw_entries(file_path, default_emotion):
+        if header is not None:
+            scene_idx, scene_name, dialogue_idx = scene_idx + 1, header, 0
+            continue
+        if scene_name is None:
+            scene_idx, scene_name = 0, RAW_DEFAULT_SCENE_NAME
+        yield {"scene_idx": scene_idx, "dialogue_idx": dialogue_idx, "scene_name": scene_name,
+               "line_id": assign_line_id(dialogue, seen), **dialogue}
+        dialogue_idx += 1
+
+def parse_raw_script(file_path: str, character_models: dict | None = None,
+                     default_emotion: str = RAW_DEFAULT_EMOTION) -> Dict[str, Any]:
+    """
+    把原始文本格式的剧本整体转换为与 YAML 剧本相同结构的剧本数据。
+    没有对话的场景标题同样保留为空场景，使场景序号与 iter_raw_script 一致。
+    """
+    script_data = raw_script_header(file_path, character_models)
+    scenes = []
+    for header, dialogue in _iter_raw_entries(file_path, default_emotion):
+        if header is not None:
+            scenes.append({'scene_name': header, 'dialogues': []})
+            continue
+        if not scenes:
+            scenes.append({'scene_name': RAW_DEFAULT_SCENE_NAME, 'dialogues': []})
+        scenes[-1]['dialogues'].append(dialogue)
+    script_data['scenes'] = scenes
+    return script_data
+
+class DialogueTable(Sequence):
+    """
+    按列存储的展开对话表，每个剧本只构建一次。
+
+    行号、角色、文本等分别存放在各自的列中 (整数列使用 array，重复的角色名和情感被驻留)，
+    比每句对话一个字典紧凑得多；按下标访问时才生成该行的对话信息字典。
+    """
+
+    __slots__ = ('scene_names', 'scene_offsets', 'scene_idx', 'dialogue_idx',
+                 'character', 'text', 'emotion', 'line_id', 'extra')
+
+    def __init__(self, script_data: Dict[str, Any]):
+        self.scene_names = []
+        self.scene_offsets = array('i')
+        self.scene_idx = array('i')
+        self.dialogue_idx = array('i')
+        self.character = []
+        self.text = []
+        self.emotion = []
+        self.line_id = []
+        self.extra = []  # 角色/文本/情感之外的字段，没有时为 None
+        seen = {}
+        for scene_idx, scene in enumerate(script_data.get("scenes", [])):
+            self.scene_names.append(scene.get("scene_name"))
+            self.scene_offsets.append(len(self.text))
+            for dialogue_idx, dialogue in enumerate(scene.get("dialogues", [])):
+                line_id = assign_line_id(dialogue, seen)
+                character = dialogue.get('character', _MISSING)
+                emotion = dialogue.get('emotion', _MISSING)
+                self.scene_idx.append(scene_idx)
+                self.dialogue_idx.append(dialogue_idx)
+                self.character.append(sys.intern(character) if isinstance(character, str) else character)
+                self.text.append(dialogue.get('text', _MISSING))
+                self.emotion.append(sys.intern(emotion) if isinstance(emotion, str) else emotion)
+                self.line_id.append(line_id)
+                extra = {k: v for k, v in dialogue.items() if k not in ('character', 'text', 'emotion')}
+                self.extra.append(extra if extra else None)
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        info = {
+            "scene_idx": self.scene_idx[index],
+            "dialogue_idx": self.dialogue_idx[index],
+            "scene_name": self.scene_names[self.scene_idx[index]],
+            "line_id": self.line_id[index],
+        }
+        for key, column in (('character', self.character), ('text', self.text), ('emotion', self.emotion)):
+            if column[index] is not _MISSING:
+                info[key] = column[index]
+        if self.extra[index]:
+            info.update(self.extra[index])
+        return info
+
+    def index_of(self, scene_idx: int, dialogue_idx: int) -> int:
+        """返回某个场景中第 dialogue_idx 句对话在表中的下标。"""
+        return self.scene_offsets[scene_idx] + dialogue_idx
+
+    def find(self, scene_idx: int, dialogue_idx: int) -> Dict[str, Any]:
+        """按场景序号和对话序号取出对话信息。"""
+        return self[self.index_of(scene_idx, dialogue_idx)]
+
+    def __getstate__(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def __setstate__(self, state):
+        for slot, value in state.items():
+            setattr(self, slot, value)
+
+def get_dialogue_table(script_data: Dict[str, Any]) -> DialogueTable:
+    """返回剧本的对话表；parse_script 已构建时直接复用，否则构建一次并保存在 script_data 中。"""
+    table = script_data.get(_TABLE_KEY)
+    if table is None:
+        table = DialogueTable(script_data)
+        script_data[_TABLE_KEY] = table
+    return table
+
+def get_all_dialogues(script_data: Dict[str, Any] | None) -> Sequence:
+    """
+    将剧本中所有场景的对话展开为一个序列。
+
+    每条对话会附带 scene_idx, dialogue_idx, scene_name 和 line_id 字段。
+    line_id 是对话的稳定标识：剧本中写了 id 时直接使用，否则为内容指纹
+    (重复出现的相同对话依次加上 ~2, ~3 后缀)。在前面插入或删除对话不会改变其他对话的 line_id。
+
+    返回的是每个剧本只构建一次的 DialogueTable (可按下标访问和迭代)，界面和批量代码共享同一份。
+
+    :param script_data: parse_script 返回的剧本数据。
+    :return: 展开后的对话信息序列。
+    """
+    if not script_data: return []
+    return get_dialogue_table(script_data)
+
 if __name__ == '__main__':
     # 用于测试解析器
     test_script_path = '../raw_scripts/青丘山剧本.yaml'
@@ -0,0 +1,189 @@
+import os
+import json
+import random
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from dubbing_tool.batch import SIGNATURE_KEY, save_audio_metadata
+from dubbing_tool.metrics import LineTrace, tracing, measure as measure_phase, PHASE_POSTPROCESS
+from dubbing_tool.utils import atomic_open
+
+VARY_SEED = "seed"
+VARY_TEMPERATURE = "temperature"
+VARY_MODES = (VARY_SEED, VARY_TEMPERATURE)
+DEFAULT_TAKE_COUNT = 4
+MAX_TAKE_COUNT = 16
+# 温度扫描时各版本的温度在 基准温度 × (1 ± spread) 之间均匀分布
+DEFAULT_TEMPERATURE_SPREAD = 0.3
+
+
+def take_path(output_path: str, number: int) -> str:
+    """第 number 个版本的路径，与正式音频在同一目录。"""
+    stem, ext = os.path.splitext(output_path)
+    return f"{stem}.take{number:02d}{ext}"
+
+
+def list_takes(output_path: str, signature: str | None = None) -> list:
+    """
+    列出某句已有的候选版本。
+
+    :param output_path: 正式音频的路径。
+    :param signature: 当前对话的签名 (见 batch.line_signature)；给出时跳过元数据中的签名与之不符的过时版本
+                      (剧本修改后同一路径对应了不同的台词)。
+    :return: [(版本号, 路径, 生成参数)]，按版本号排序。
+    """
+    directory = os.path.dirname(output_path)
+    stem, ext = os.path.splitext(os.path.basename(output_path))
+    prefix = stem + ".take"
+    takes = []
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                name, entry_ext = os.path.splitext(entry.name)
+                if entry_ext != ext or not name.startswith(prefix) or not name[len(prefix):].isdigit():
+                    continue
+                try:
+                    with open(os.path.splitext(entry.path)[0] + ".json", 'r', encoding='utf-8') as f:
+                        params = json.load(f)
+                except (OSError, ValueError):
+                    params = {}
+                # 没有记录签名的旧版本无法判断是否过时，保留
+                if signature and params.get(SIGNATURE_KEY) not in (None, signature):
+                    continue
+                takes.append((int(name[len(prefix):]), entry.path, params))
+    except FileNotFoundError:
+        return []
+    return sorted(takes, key=lambda take: take[0])
+
+
+def move_takes(output_path: str, new_output_path: str) -> int:
+    """
+    正式音频移动后 (见 manifest.OutputManifest.sync)，把它的候选版本及元数据一起移到新路径下。
+    版本号保持不变；新路径下已有同号的版本时，编号接在已有版本之后。
+
+    :return: 移动的版本数。
+    """
+    takes = list_takes(output_path)
+    if not takes:
+        return 0
+    existing = {number for number, _, _ in list_takes(new_output_path)}
+    next_number = max(existing | {number for number, _, _ in takes}) + 1
+    os.makedirs(os.path.dirname(new_output_path), exist_ok=True)
+    for number, path, _ in takes:
+        if number in existing:
+            number, next_number = next_number, next_number + 1
+        new_path = take_path(new_output_path, number)
+        os.replace(path, new_path)
+        metadata_path = os.path.splitext(path)[0] + ".json"
+        if os.path.exists(metadata_path):
+            os.replace(metadata_path, os.path.splitext(new_path)[0] + ".json")
+    return len(takes)
+
+
+def take_variants(params: dict, count: int, vary: str = VARY_SEED,
+                  temperature_spread: float = DEFAULT_TEMPERATURE_SPREAD) -> list:
+    """
+    为一句生成 count 组参数。
+
+    - seed：每个版本使用不同的种子。详情页的种子为固定值时依次使用 seed, seed+1, ...，否则随机选取；
+    - temperature：所有版本使用同一个种子，温度在基准温度附近均匀分布。
+    每个版本都使用明确的种子 (不为 -1)，记录在元数据中，之后可以原样复现，也可以命中合成缓存。
+
+    :return: 参数字典列表。
+    """
+    if vary not in VARY_MODES:
+        raise ValueError(f"未知的版本变化方式: {vary}，可选: {', '.join(VARY_MODES)}")
+    count = max(1, min(int(count), MAX_TAKE_COUNT))
+    base_seed = int(params.get('seed', -1))
+    if vary == VARY_SEED:
+        seeds = ([base_seed + i for i in range(count)] if base_seed >= 0
+                 else random.sample(range(2 ** 31), count))
+        return [{**params, 'seed': seed} for seed in seeds]
+
+    seed = base_seed if base_seed >= 0 else random.randrange(2 ** 31)
+    temperature = float(params.get('temperature', 1.0))
+    if count == 1:
+        temperatures = [temperature]
+    else:
+        low, high = temperature * (1 - temperature_spread), temperature * (1 + temperature_spread)
+        temperatures = [low + (high - low) * i / (count - 1) for i in range(count)]
+    return [{**params, 'seed': seed, 'temperature': round(max(0.01, value), 3)} for value in temperatures]
+
+
+def generate_takes(api_client, output_path: str, params: dict, count: int = DEFAULT_TAKE_COUNT, vary: str = VARY_SEED,
+                   cache=None, postprocessor=None, on_take=None, signature: str | None = None, metrics=None,
+                   dialogue_info: dict | None = None) -> list:
+    """
+    并发生成一句的多个候选版本，保存为 <正式文件名>.takeNN.wav (编号接在已有版本之后，不覆盖)，
+    每个版本带有自己的 .json 元数据。正式音频不受影响，选定后用 promote_take 设为正式。
+
+    所有版本同时提交 (受 ApiClient 的全局并发上限约束)，沿用调用线程的请求优先级。
+
+    :param api_client: ApiClient 实例。
+    :param output_path: 正式音频的路径。
+    :param params: 基准生成参数 (见 build_generation_params)。
+    :param count: 版本数。
+    :param vary: 版本之间变化的参数，"seed" 或 "temperature"。
+    :param cache: 可选的 SynthesisCache。
+    :param postprocessor: 可选的 PostProcessor，对每个版本进行后处理，使试听效果与正式音频一致。
+    :param on_take: 每个版本完成后的回调 on_take(number, path, success)，在工作线程中调用。
+    :param signature: 这句对话在剧本中的签名 (见 batch.line_signature)，写入每个版本的元数据。
+    :param metrics: 可选的 GenerationMetrics，记录每个版本的耗时。
+    :param dialogue_info: 对话信息，用于耗时记录中的角色和 line_id。
+    :return: [(版本号, 路径, 是否成功)]。
+    """
+    variants = take_variants(params, count, vary)
+    existing = list_takes(output_path)
+    first = existing[-1][0] + 1 if existing else 1
+    priority = api_client.current_priority()
+
+    def run(number, take_params):
+        path = take_path(output_path, number)
+        generate = lambda: api_client.generate_audio_to_file(path, **take_params)
+        success = False
+        trace = LineTrace() if metrics else None
+        try:
+            with api_client.request_priority(priority), tracing(trace):
+                success = cache.get_or_generate(take_params, path, generate) if cache else generate()
+                if success:
+                    save_audio_metadata(path, take_params, signature)
+                    if postprocessor:
+                        with measure_phase(PHASE_POSTPROCESS):
+                            postprocessor.process(path)
+        except Exception as e:
+            print(f"生成版本 {number} 时发生错误: {e}")
+            success = False
+        if metrics:
+            metrics.record(dialogue_info or {}, take_params, path, trace, bool(success))
+        if on_take:
+            on_take(number, path, success)
+        return number, path, success
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with ThreadPoolExecutor(max_workers=len(variants), thread_name_prefix="take") as executor:
+        futures = [executor.submit(run, first + i, take_params) for i, take_params in enumerate(variants)]
+        return [future.result() for future in futures]
+
+
+def promote_take(path: str, output_path: str) -> bool:
+    """
+    把一个候选版本设为正式音频：复制音频和元数据到正式路径 (原子替换，不重新合成)，版本文件保留。
+    元数据中记录 promoted_from，注明来自哪个版本。调用者负责更新输出索引 (OutputManifest.record)。
+
+    :return: 是否成功。
+    """
+    try:
+        with open(path, 'rb') as src, atomic_open(output_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        try:
+            with open(os.path.splitext(path)[0] + ".json", 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            metadata = {}
+        if isinstance(metadata, dict):
+            metadata['promoted_from'] = os.path.basename(path)
+            with atomic_open(os.path.splitext(output_path)[0] + ".json", 'w', encoding='utf-8') as f:
+                json.dump(metadata, f, ensure_ascii=False, indent=2)
+        return True
+    except OSError as e:
+        print(f"设为正式音频失败: {e}")
+        return False
@@ -0,0 +1,134 @@
+import time
+from collections import deque
+from threading import Lock
+
+# 界面线程处理更新队列的间隔 (毫秒)
+UI_UPDATE_INTERVAL_MS = 100
+# 刷新请求队列显示的间隔 (毫秒)
+SCHEDULER_STATS_INTERVAL_MS = 1000
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(max(0, seconds))
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60:02d}:{seconds % 60:02d}"
+
+
+# 请求调度器各优先级在状态显示中的名称
+SCHEDULER_CLASS_LABELS = {"interactive": "交互", "prefetch": "预取", "batch": "批量"}
+
+
+def format_scheduler_stats(stats: dict) -> str:
+    """把 RequestScheduler.get_stats() 格式化为一行：各优先级的在途/排队数和平均等待时间。"""
+    parts = []
+    for name, label in SCHEDULER_CLASS_LABELS.items():
+        entry = stats.get(name)
+        if entry:
+            parts.append(f"{label} {entry['active']}/{entry['queued']} 等待 {entry['avg_wait']:.1f}s")
+    return "请求 (在途/排队): " + "，".join(parts)
+
+
+class BatchProgress:
+    """批量生成的累计进度：完成数、失败数、吞吐量和预计剩余时间。"""
+
+    def __init__(self, total: int | None):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.last_label = ""
+        self.started_at = time.monotonic()
+
+    def update(self, success: bool, done: int, total: int | None, label: str):
+        self.done = done
+        self.total = total
+        if not success:
+            self.failed += 1
+        self.last_label = label
+
+    def format(self) -> str:
+        elapsed = time.monotonic() - self.started_at
+        rate = self.done / elapsed * 60 if elapsed > 0 else 0.0
+        if self.total:
+            text = f"批量生成中 {self.done}/{self.total} ({self.done * 100 // self.total}%)"
+        else:
+            text = f"批量生成中 {self.done}"
+        text += f"，失败 {self.failed}，{rate:.1f} 句/分钟"
+        if self.total and self.done and self.done < self.total:
+            text += f"，预计剩余 {format_duration((self.total - self.done) / (self.done / elapsed))}"
+        if self.last_label:
+            text += f": {self.last_label}"
+        return text
+
+
+class UiUpdateQueue:
+    """
+    工作线程向界面线程传递更新的通道。
+
+    Tk 控件只能在界面线程中修改。工作线程只调用本类的方法 (线程安全、不触碰控件)，
+    界面线程每隔 UI_UPDATE_INTERVAL_MS 毫秒调用一次 drain()，把这段时间内的更新合并后一次性应用：
+    状态栏文本只保留最后一条，批量进度合并为一条汇总，同一行的多次状态变化只重绘一次。
+    几十个并发任务同时完成时，界面每个周期也只重绘一次。
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._status = None
+        self._progress = None
+        self._progress_dirty = False
+        self._generated = {}  # dialogue_id -> dialogue_info
+        self._calls = deque()
+
+    def set_status(self, text: str):
+        """设置状态栏文本 (覆盖同一周期内更早的状态和进度)。"""
+        with self._lock:
+            self._status = text
+            self._progress_dirty = False
+
+    def mark_generated(self, dialogue_info: dict):
+        """标记某句对话的音频已生成。"""
+        dialogue_id = f"dialogue_{dialogue_info['scene_idx']}_{dialogue_info['dialogue_idx']}"
+        with self._lock:
+            self._generated[dialogue_id] = dialogue_info
+
+    def call(self, func, *args):
+        """在界面线程中按顺序执行 func(*args) (用于按钮状态等一次性的界面操作)。"""
+        with self._lock:
+            self._calls.append((func, args))
+
+    def start_progress(self, total: int | None):
+        with self._lock:
+            self._progress = BatchProgress(total)
+
+    def report_progress(self, success: bool, done: int, total: int | None, label: str = ""):
+        """记录一条批量任务的结果；显示的进度文本在界面线程 drain 时才生成。"""
+        with self._lock:
+            if self._progress is None:
+                self._progress = BatchProgress(total)
+            self._progress.update(success, done, total, label)
+            self._progress_dirty = True
+            self._status = None
+
+    def finish_progress(self) -> BatchProgress | None:
+        with self._lock:
+            progress, self._progress = self._progress, None
+            self._progress_dirty = False
+            return progress
+
+    def drain(self) -> tuple[str | None, list, list]:
+        """
+        取出并清空积累的更新 (在界面线程中调用)。
+
+        :return: (status_text, generated_dialogues, calls)。status_text 为 None 表示状态栏无需更新。
+        """
+        with self._lock:
+            status = self._status
+            if status is None and self._progress_dirty and self._progress is not None:
+                status = self._progress.format()
+            self._status = None
+            self._progress_dirty = False
+            generated = list(self._generated.values())
+            self._generated.clear()
+            calls = list(self._calls)
+            self._calls.clear()
+        return status, generated, calls
@@ -1,6 +1,20 @@
-import yaml
+import os
 import re
-import customtkinter as ctk
+import sys
+import tempfile
+import yaml
+from contextlib import contextmanager
+from functools import lru_cache
+
+def get_app_dir() -> str:
+    """
+    获取程序所在目录 (config.yaml、输出目录等相对路径的基准)。
+    """
+    if getattr(sys, 'frozen', False):
+        # 打包后的exe环境
+        return os.path.dirname(sys.executable)
+    # 开发环境
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 def load_config(path='config.yaml'):
     """加载配置文件"""
@@ -16,16 +30,79 @@ def load_config(path='config.yaml'):
         print(f"加载配置文件时出错: {e}")
         return None
 
+@lru_cache(maxsize=65536)
 def sanitize_filename(text: str, max_length: int = 50) -> str:
     """
     清理字符串，使其成为有效的文件名。
     
     - 移除或替换无效字符
     - 截断到最大长度
+
+    结果会被缓存：计算每句对话的输出路径时同一个剧本名、场景名和角色名会被反复清理。
     """
     # 移除无效字符
     sanitized = re.sub(r'[\\/*?:"<>|]', "", text)
     # 替换空格
     sanitized = sanitized.replace(' ', '_')
     # 截断
-    return sanitized[:max_length] 
\ No newline at end of file
+    return sanitized[:max_length] 
+
+def get_output_path(output_dir: str, script_data: dict, dialogue_info: dict, ext: str = ".wav") -> str | None:
+    """
+    计算某条对话的输出文件路径。
+
+    目录结构为 <output_dir>/<剧本名>/<场景名>/<行号>_<角色>_<文本预览><ext>。
+
+    :param output_dir: 输出根目录。
+    :param script_data: 剧本数据字典。
+    :param dialogue_info: 对话信息 (需包含 scene_idx, dialogue_idx, scene_name, character, text)。
+    :param ext: 文件扩展名。
+    :return: 输出文件的完整路径，如果参数不完整则返回 None。
+    """
+    if not dialogue_info or not script_data: return None
+    script_name = sanitize_filename(script_data.get('script_name', 'UntitledScript'))
+    script_dir = os.path.join(output_dir, script_name)
+    scene_dir = os.path.join(script_dir, sanitize_filename(dialogue_info['scene_name']))
+    filename_preview = sanitize_filename(dialogue_info['text'])
+    line_num = dialogue_info['scene_idx'] * 1000 + dialogue_info['dialogue_idx']
+    filename = f"{line_num:04d}_{sanitize_filename(dialogue_info['character'])}_{filename_preview}{ext}"
+    return os.path.join(scene_dir, filename)
+
+
+# 一句对话的候选版本：<正式文件名>.take01.wav (见 dubbing_tool.takes)
+_TAKE_PATTERN = re.compile(r'\.take\d{2,}$')
+
+
+def is_take_path(path: str) -> bool:
+    """path 是否为某句的候选版本 (而不是正式音频)。"""
+    return bool(_TAKE_PATTERN.search(os.path.splitext(path)[0]))
+
+
+@contextmanager
+def atomic_open(path: str, mode: str = 'wb', encoding: str | None = None):
+    """
+    原子写入文件。
+
+    先写入目标目录下的临时文件 (.<文件名>.xxxx.part)，全部写完后再用 os.replace
+    重命名为目标路径；如果写入过程中出错或被中断，临时文件会被删除，
+    目标路径上不会出现被截断的文件。
+
+    :param path: 目标文件路径。
+    :param mode: 打开模式，'wb' 或 'w'。
+    :param encoding: 文本模式下的编码。
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".part")
+    try:
+        with os.fdopen(fd, mode, encoding=encoding) as f:
+            yield f
+        # mkstemp 创建的文件权限为 0600，改为普通文件的默认权限
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,143 @@
+import math
+import customtkinter as ctk
+
+
+class VirtualList(ctk.CTkFrame):
+    """
+    虚拟化 (窗口化) 的表格列表：只为可见的行创建控件。
+
+    行控件组成一个复用池，数量只取决于可见区域的高度；滚动时把池中的行重新绑定到
+    新的数据行 (bind_row)，而不是为每条数据创建控件。因此加载上万行的剧本与加载
+    几十行一样快，内存占用也不随行数增长。所有行高度固定为 row_height。
+    """
+
+    def __init__(self, master, columns: list, create_row, bind_row, row_height: int = 34,
+                 empty_text: str = "", **kwargs):
+        """
+        :param columns: 列定义 [(表头文本, 最小宽度, 权重)]。
+        :param create_row: create_row(row_frame) -> dict，在行框架中创建一行的控件 (按列用 grid 布局)。
+        :param bind_row: bind_row(widgets, index)，把一行控件绑定到第 index 条数据。
+        :param row_height: 行高 (像素)。
+        :param empty_text: 没有数据时显示的提示。
+        """
+        super().__init__(master, **kwargs)
+        self.columns = columns
+        self.create_row = create_row
+        self.bind_row = bind_row
+        self.row_height = row_height
+        self.count = 0
+        self.first = 0
+        self._rows = []  # [(row_frame, widgets)]
+
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(1, weight=1)
+
+        self.header = ctk.CTkFrame(self, fg_color="transparent")
+        self.header.grid(row=0, column=0, sticky="ew", padx=5)
+        self._configure_columns(self.header)
+        header_font = ctk.CTkFont(weight="bold")
+        for col, (title, _, _) in enumerate(columns):
+            if title:
+                ctk.CTkLabel(self.header, text=title, font=header_font).grid(row=0, column=col, sticky="w", padx=5)
+
+        self.body = ctk.CTkFrame(self, fg_color="transparent")
+        self.body.grid(row=1, column=0, sticky="nsew", padx=5)
+        self.scrollbar = ctk.CTkScrollbar(self, command=self._on_scrollbar)
+        self.scrollbar.grid(row=1, column=1, sticky="ns")
+        self.empty_label = ctk.CTkLabel(self.body, text=empty_text)
+
+        self.body.bind("<Configure>", lambda event: self._layout())
+        self._bind_wheel(self.body)
+        self._update_empty()
+
+    def _configure_columns(self, frame):
+        for col, (_, minsize, weight) in enumerate(self.columns):
+            frame.grid_columnconfigure(col, minsize=minsize, weight=weight)
+
+    def _bind_wheel(self, widget):
+        widget.bind("<MouseWheel>", self._on_wheel, add="+")
+        widget.bind("<Button-4>", lambda event: self.scroll_by(-3), add="+")
+        widget.bind("<Button-5>", lambda event: self.scroll_by(3), add="+")
+
+    def _bind_wheel_recursive(self, widget):
+        self._bind_wheel(widget)
+        for child in widget.winfo_children():
+            self._bind_wheel_recursive(child)
+
+    @property
+    def visible_rows(self) -> int:
+        height = self.body.winfo_height()
+        return max(1, math.ceil(height / self.row_height)) if height > 1 else 1
+
+    def set_count(self, count: int):
+        """设置数据行数并回到顶部重新渲染。"""
+        self.count = count
+        self.first = 0
+        self._update_empty()
+        self._layout()
+
+    def _update_empty(self):
+        if self.count == 0 and self.empty_label.cget("text"):
+            self.empty_label.place(relx=0.5, y=20, anchor="n")
+        else:
+            self.empty_label.place_forget()
+
+    def _layout(self):
+        """按可见区域高度调整行池大小，并重新绑定所有可见行。"""
+        needed = min(self.visible_rows, self.count)
+        while len(self._rows) < needed:
+            row_frame = ctk.CTkFrame(self.body, fg_color="transparent", height=self.row_height)
+            self._configure_columns(row_frame)
+            widgets = self.create_row(row_frame)
+            self._bind_wheel_recursive(row_frame)
+            self._rows.append((row_frame, widgets))
+        self.first = max(0, min(self.first, self.count - needed))
+        self.refresh()
+
+    def refresh(self):
+        """重新绑定所有可见行 (数据变化时调用)。"""
+        needed = min(self.visible_rows, self.count)
+        for i, (row_frame, widgets) in enumerate(self._rows):
+            index = self.first + i
+            if i < needed and index < self.count:
+                self.bind_row(widgets, index)
+                row_frame.place(x=0, y=i * self.row_height, relwidth=1.0, height=self.row_height)
+            else:
+                row_frame.place_forget()
+        self._update_scrollbar()
+
+    def _update_scrollbar(self):
+        if self.count == 0:
+            self.scrollbar.set(0.0, 1.0)
+            return
+        visible = min(self.visible_rows, self.count)
+        self.scrollbar.set(self.first / self.count, (self.first + visible) / self.count)
+
+    def scroll_to(self, first: int):
+        first = max(0, min(int(first), self.count - min(self.visible_rows, self.count)))
+        if first != self.first:
+            self.first = first
+            self.refresh()
+
+    def scroll_by(self, rows: int):
+        self.scroll_to(self.first + rows)
+
+    def see(self, index: int):
+        """滚动到使第 index 行可见。"""
+        visible = self.visible_rows
+        if index < self.first:
+            self.scroll_to(index)
+        elif index >= self.first + visible:
+            self.scroll_to(index - visible + 1)
+
+    def _on_wheel(self, event):
+        # Windows 上 delta 为 120 的倍数，macOS 上为较小的整数
+        steps = -int(event.delta / 120) if abs(event.delta) >= 120 else -event.delta
+        self.scroll_by(steps * 3)
+
+    def _on_scrollbar(self, action, *args):
+        if action == "moveto":
+            self.scroll_to(round(float(args[0]) * self.count))
+        elif action == "scroll":
+            amount, unit = int(args[0]), args[1]
+            self.scroll_by(amount * (self.visible_rows if unit == "pages" else 1))
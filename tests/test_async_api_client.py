@@ -0,0 +1,222 @@
+import asyncio
+import io
+import json
+import os
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Thread
+
+import pytest
+
+from dubbing_tool.api_client import ApiClient
+from dubbing_tool.async_api_client import AsyncApiClient, AsyncBatchRunner, BackgroundEventLoop
+from dubbing_tool.batch import SIGNATURE_KEY, BatchGenerator, BatchJob
+from dubbing_tool.journal import JobJournal
+from dubbing_tool.metrics import GenerationMetrics
+from dubbing_tool.scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE, RequestScheduler
+
+
+def make_wav(seconds: float) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(16000)
+        w.writeframes(b'\x01\x00' * int(16000 * seconds))
+    return buffer.getvalue()
+
+
+class InferHandler(BaseHTTPRequestHandler):
+    """
+    模拟 /infer_single：文本为 "bad" 时返回 400，"down" 时返回 500，"slow" 时推理 1 秒；
+    其余推理 0.05 秒，音频时长为 0.5 秒。
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.infer_requests += 1
+        text = payload.get('text')
+        if text == 'bad':
+            return self.send_body(400, b'{"detail": "bad request"}')
+        if text == 'down':
+            return self.send_body(500, b'{"detail": "server error"}')
+        time.sleep(1.0 if text == 'slow' else 0.05)
+        self.send_body(200, json.dumps({'audio_url': "http://0.0.0.0:9880/outputs/line.wav"}).encode('utf-8'))
+
+    def do_GET(self):
+        if self.path == '/version':
+            return self.send_body(200, b'{"version": "test"}')
+        self.send_body(200, make_wav(0.5))
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), InferHandler)
+    server.infer_requests = 0
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def event_loop_thread():
+    event_loop = BackgroundEventLoop()
+    yield event_loop
+    event_loop.stop()
+
+
+@pytest.fixture
+def clients(server, event_loop_thread):
+    api_client = ApiClient(f"http://127.0.0.1:{server.server_address[1]}", {'media_type': 'wav'},
+                           max_concurrent_requests=4)
+    async_client = AsyncApiClient(api_client, max_concurrency=16)
+    yield api_client, async_client
+    event_loop_thread.run(async_client.close())
+    api_client.close()
+
+
+def make_jobs(tmp_path, texts):
+    return [BatchJob({'line_id': f"l{i}", 'character': 'A', 'text': text, 'scene_idx': 0, 'dialogue_idx': i},
+                     {'text': text, 'model_name': 'm', 'emotion': '平静'}, str(tmp_path / f"{i}.wav"), signature=f"sig{i}")
+            for i, text in enumerate(texts)]
+
+
+def test_batch_runner_writes_outputs_through_shared_backend(tmp_path, server, clients, event_loop_thread):
+    api_client, async_client = clients
+    jobs = make_jobs(tmp_path, [f"第{i}句" for i in range(12)])
+    journal = JobJournal(str(tmp_path / "journal.sqlite3"))
+    journal.enqueue(jobs)
+    metrics = GenerationMetrics()
+    generator = BatchGenerator(api_client, journal=journal, metrics=metrics)
+    progress = []
+    stats = AsyncBatchRunner(generator, async_client, event_loop_thread, 8).run(
+        jobs, on_progress=lambda job, success, done, total: progress.append((success, done, total)))
+
+    assert stats['succeeded'] == 12 and stats['failed'] == 0 and not stats['cancelled']
+    assert [done for _, done, _ in progress] == list(range(1, 13))
+    for i, job in enumerate(jobs):
+        assert os.path.getsize(job.output_path) == len(make_wav(0.5))
+        with open(os.path.splitext(job.output_path)[0] + ".json", encoding='utf-8') as f:
+            assert json.load(f)[SIGNATURE_KEY] == f"sig{i}"
+    # 没有残留的临时文件
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".part")]
+    assert journal.get_summary() == {'done': 12}
+    journal.close()
+    # 请求计入 ApiClient 的后端统计和调度器
+    backend = api_client.get_backend_stats()[0]
+    assert backend['completed'] == 24 and backend['outstanding'] == 0
+    assert api_client.get_scheduler_stats()['batch']['requests'] == 24
+    assert all(record['synthesis'] > 0 and record['backend'] for record in metrics.records)
+
+
+def test_client_errors_are_not_retried_or_counted_against_backend(tmp_path, server, clients, event_loop_thread):
+    api_client, async_client = clients
+    jobs = make_jobs(tmp_path, ['bad'])
+    generator = BatchGenerator(api_client, max_attempts=3, retry_backoff=0.01)
+    stats = AsyncBatchRunner(generator, async_client, event_loop_thread, 2).run(jobs)
+    assert stats['failed'] == 1 and stats['retries'] == 0
+    assert server.infer_requests == 1
+    backend = api_client.get_backend_stats()[0]
+    assert backend['failed'] == 0 and backend['healthy']
+    assert not os.path.exists(jobs[0].output_path)
+
+
+def test_server_errors_are_retried(tmp_path, server, clients, event_loop_thread):
+    api_client, async_client = clients
+    jobs = make_jobs(tmp_path, ['down'])
+    generator = BatchGenerator(api_client, max_attempts=3, retry_backoff=0.01)
+    stats = AsyncBatchRunner(generator, async_client, event_loop_thread, 2).run(jobs)
+    assert stats['failed'] == 1 and stats['retries'] == 2
+    assert server.infer_requests == 3
+    assert api_client.get_backend_stats()[0]['failed'] == 3
+
+
+def test_deadline_bounds_the_whole_generation(tmp_path, clients, event_loop_thread):
+    api_client, async_client = clients
+
+    async def generate():
+        success = await async_client.generate_audio_to_file(str(tmp_path / "a.wav"), 'slow', 'm', '平静', deadline=0.2)
+        return success, async_client.get_last_error()
+
+    started = time.monotonic()
+    success, error = event_loop_thread.run(generate())
+    assert not success
+    assert time.monotonic() - started < 0.9
+    assert error[1]  # 超时可以重试
+    assert not os.listdir(tmp_path)
+
+
+def test_cancel_skips_remaining_jobs(tmp_path, clients, event_loop_thread):
+    api_client, async_client = clients
+    jobs = make_jobs(tmp_path, [f"第{i}句" for i in range(40)])
+    generator = BatchGenerator(api_client)
+    runner = AsyncBatchRunner(generator, async_client, event_loop_thread, 2)
+
+    def on_progress(job, success, done, total):
+        if done == 2:
+            runner.cancel()
+
+    stats = runner.run(jobs, on_progress=on_progress)
+    assert stats['cancelled']
+    assert 2 <= stats['succeeded'] < 40
+    assert stats['failed'] == 0
+
+
+def test_async_slot_shares_priority_queue_with_threads(event_loop_thread):
+    scheduler = RequestScheduler(1)
+    order = []
+    release = Event()
+
+    def holder():
+        with scheduler.slot(PRIORITY_BATCH):
+            release.wait()
+
+    async def waiter(priority, tag):
+        async with scheduler.async_slot(priority):
+            order.append(tag)
+
+    async def waiters():
+        batch = asyncio.ensure_future(waiter(PRIORITY_BATCH, 'batch'))
+        await asyncio.sleep(0.05)
+        interactive = asyncio.ensure_future(waiter(PRIORITY_INTERACTIVE, 'interactive'))
+        await asyncio.sleep(0.05)
+        release.set()
+        await asyncio.gather(batch, interactive)
+
+    thread = Thread(target=holder)
+    thread.start()
+    while scheduler.get_stats()['batch']['active'] == 0:
+        time.sleep(0.005)
+    event_loop_thread.run(waiters(), timeout=5)
+    thread.join(5)
+    assert order == ['interactive', 'batch']
+
+
+def test_cancelled_async_waiter_leaves_the_queue(event_loop_thread):
+    scheduler = RequestScheduler(1)
+
+    async def scenario():
+        async with scheduler.async_slot():
+            task = asyncio.ensure_future(scheduler.async_slot(PRIORITY_INTERACTIVE).__aenter__())
+            await asyncio.sleep(0.05)
+            assert scheduler.get_stats()['interactive']['queued'] == 1
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        # 被取消的等待者不再挡在队首
+        async with scheduler.async_slot() as waited:
+            return waited
+
+    assert event_loop_thread.run(scenario(), timeout=5) < 1
+    stats = scheduler.get_stats()
+    assert all(s['queued'] == 0 and s['active'] == 0 for s in stats.values())
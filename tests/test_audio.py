@@ -0,0 +1,116 @@
+import io
+import json
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+import pytest
+
+from dubbing_tool.api_client import ApiClient
+from dubbing_tool.audio import split_text, stitch_wav
+
+RATE = 16000
+
+
+def make_wav(frames: bytes, channels: int = 1, rate: int = RATE) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(frames)
+    return buffer.getvalue()
+
+
+def read_frames(path: str) -> bytes:
+    with wave.open(path, 'rb') as w:
+        return w.readframes(w.getnframes())
+
+
+def test_short_text_is_not_split():
+    assert split_text("  你好。 ", 10) == ["你好。"]
+    assert split_text("你好。再见。", 0) == ["你好。再见。"]
+
+
+def test_splits_at_sentence_ends_and_packs_short_sentences():
+    text = "第一句。第二句！第三句很长很长很长？第四句。"
+    fragments = split_text(text, 10)
+    assert fragments == ["第一句。第二句！", "第三句很长很长很长？", "第四句。"]
+    assert "".join(fragments) == text
+
+
+def test_long_sentence_splits_at_clauses_then_hard_cuts():
+    fragments = split_text("前半句，后半句。" + "长" * 25, 10)
+    assert fragments == ["前半句，后半句。", "长" * 10, "长" * 10, "长" * 5]
+    assert all(len(fragment) <= 10 for fragment in fragments)
+
+
+def test_stitch_inserts_silence_between_fragments(tmp_path):
+    first, second = b'\x01\x00' * 100, b'\x02\x00' * 50
+    path = str(tmp_path / "out.wav")
+    stitch_wav([make_wav(first), make_wav(second)], path, interval=0.01)
+    silence = b'\x00\x00' * int(RATE * 0.01)
+    assert read_frames(path) == first + silence + second
+    # 原子写入：没有残留的临时文件
+    assert [p.name for p in tmp_path.iterdir()] == ["out.wav"]
+
+
+def test_stitch_rejects_mismatched_formats(tmp_path):
+    path = str(tmp_path / "out.wav")
+    with pytest.raises(ValueError):
+        stitch_wav([make_wav(b'\x00\x00'), make_wav(b'\x00\x00', rate=22050)], path)
+    with pytest.raises(ValueError):
+        stitch_wav([], path)
+    assert not list(tmp_path.iterdir())
+
+
+class FragmentHandler(BaseHTTPRequestHandler):
+    """模拟 /infer_single：音频的每个采样值为文本的长度，便于检查拼接顺序；记录每个后端收到的文本。"""
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, body):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        text = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['text']
+        self.server.texts.append(text)
+        self.send_body(json.dumps({'audio_url': f"http://0.0.0.0/outputs/{len(text)}.wav"}).encode('utf-8'))
+
+    def do_GET(self):
+        length = int(self.path.rsplit('/', 1)[-1].split('.')[0])
+        self.send_body(make_wav(length.to_bytes(2, 'little') * 10))
+
+
+@pytest.fixture
+def servers():
+    started = []
+    for _ in range(2):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), FragmentHandler)
+        server.texts = []
+        Thread(target=server.serve_forever, daemon=True).start()
+        started.append(server)
+    yield started
+    for server in started:
+        server.shutdown()
+
+
+def test_long_line_is_synthesized_in_fragments_and_stitched(tmp_path, servers):
+    urls = [f"http://127.0.0.1:{server.server_address[1]}" for server in servers]
+    client = ApiClient(urls, {'media_type': 'wav', 'fragment_interval': 0}, split_max_chars=4, split_workers=4)
+    text = "一。二二。三三三。四四四四。"
+    path = str(tmp_path / "line.wav")
+    try:
+        assert client.generate_audio_to_file(path, text, 'm', '平静')
+    finally:
+        client.close()
+    fragments = split_text(text, 4)
+    assert read_frames(path) == b"".join(len(f).to_bytes(2, 'little') * 10 for f in fragments)
+    received = [text for server in servers for text in server.texts]
+    assert sorted(received) == sorted(fragments)
+    # 片段不受模型固定的约束，分散到两个后端
+    assert all(server.texts for server in servers)
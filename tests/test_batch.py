@@ -0,0 +1,235 @@
+import os
+import time
+from threading import Lock, Thread
+
+from dubbing_tool.batch import BatchGenerator, BatchJob, CircuitBreaker, count_model_switches, schedule_jobs_by_model
+
+
+class FlakyClient:
+    """模拟在 recover_after 秒后才恢复的推理服务。"""
+
+    def __init__(self, recover_after: float = 0.0):
+        self.recover_at = time.monotonic() + recover_after
+        self.multi_calls = 0
+        self.single_calls = 0
+        self._lock = Lock()
+
+    def _up(self) -> bool:
+        return time.monotonic() >= self.recover_at
+
+    def clear_last_error(self):
+        pass
+
+    def get_last_error(self):
+        return None if self._up() else ("服务器错误 503", True)
+
+    def generate_multi_to_files(self, lines, output_paths, **params):
+        with self._lock:
+            self.multi_calls += 1
+        if not self._up():
+            return None
+        for path in output_paths:
+            with open(path, 'wb') as f:
+                f.write(b'RIFF')
+        return [True] * len(output_paths)
+
+    def generate_audio_to_file(self, output_path, **params):
+        with self._lock:
+            self.single_calls += 1
+        if not self._up():
+            return False
+        with open(output_path, 'wb') as f:
+            f.write(b'RIFF')
+        return True
+
+
+def make_jobs(tmp_path, count, scene_idx=0):
+    jobs = []
+    for i in range(count):
+        text = f"第{i}句"
+        info = {'text': text, 'emotion': '平静', 'character': 'A', 'scene_idx': scene_idx, 'line_id': f"l{i}"}
+        params = {'text': text, 'model_name': 'm', 'emotion': '平静'}
+        jobs.append(BatchJob(info, params, os.path.join(tmp_path, f"{i}.wav")))
+    return jobs
+
+
+def run_with_timeout(generator, jobs, timeout=10.0):
+    result = {}
+    thread = Thread(target=lambda: result.update(generator.run(jobs)), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "批量生成在熔断器恢复后没有结束"
+    return result
+
+
+def test_breaker_opens_after_threshold_and_recovers():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=0.1)
+    breaker.record(False)
+    assert breaker._open_until is None
+    breaker.record(False)
+    assert breaker.trips == 1 and breaker._open_until is not None
+
+    started = time.monotonic()
+    assert breaker.wait()
+    assert time.monotonic() - started >= 0.05
+    assert breaker._probing
+    breaker.record(True)
+    assert breaker._open_until is None and not breaker._probing
+
+
+def test_breaker_failed_probe_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=0.05)
+    breaker.record(False)
+    assert breaker.wait()
+    breaker.record(False)
+    assert breaker.trips == 2 and not breaker._probing
+
+
+def test_breaker_wait_returns_false_on_cancel():
+    from threading import Event
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=30)
+    breaker.record(False)
+    cancel = Event()
+    cancel.set()
+    assert breaker.wait(cancel) is False
+
+
+def test_run_group_releases_breaker_probe(tmp_path):
+    client = FlakyClient(recover_after=0.3)
+    generator = BatchGenerator(client, max_workers=4, multi=True, multi_group_size=2, max_attempts=10,
+                               retry_backoff=0.01, breaker_threshold=2, breaker_cooldown=0.5)
+    stats = run_with_timeout(generator, make_jobs(tmp_path, 8))
+    assert stats['succeeded'] == 8 and stats['failed'] == 0
+    assert stats['breaker_trips'] >= 1
+    assert not generator.breaker._probing
+
+
+def test_run_group_falls_back_to_single_lines(tmp_path):
+    client = FlakyClient()
+    client.generate_multi_to_files = lambda lines, paths, **params: None
+    generator = BatchGenerator(client, max_workers=2, multi=True, multi_group_size=4)
+    stats = run_with_timeout(generator, make_jobs(tmp_path, 4))
+    assert stats['succeeded'] == 4
+    assert client.single_calls == 4
+
+
+def test_run_group_multi_exception_falls_back(tmp_path):
+    client = FlakyClient()
+
+    def broken(lines, paths, **params):
+        raise KeyError('text')
+
+    client.generate_multi_to_files = broken
+    generator = BatchGenerator(client, max_workers=1, multi=True, multi_group_size=4, breaker_threshold=1,
+                               breaker_cooldown=0.1)
+    stats = run_with_timeout(generator, make_jobs(tmp_path, 4))
+    assert stats['succeeded'] == 4 and stats['failed'] == 0
+
+
+class TwoStepClient(FlakyClient):
+    two_step = True
+
+    def request_audio_url(self, **params):
+        return f"http://server/{params['text']}.wav"
+
+    def download_audio_to_file(self, audio_url, output_path):
+        with open(output_path, 'wb') as f:
+            f.write(b'RIFF')
+        return True
+
+
+class BrokenManifest:
+    """第二次记录输出时抛出异常。"""
+
+    def __init__(self):
+        self.recorded = 0
+
+    def record(self, output_path, line_id=None, params=None):
+        self.recorded += 1
+        if self.recorded == 2:
+            raise OSError("磁盘已满")
+
+    def save(self):
+        pass
+
+
+def test_pipelined_reports_cache_hit_errors(tmp_path):
+    from dubbing_tool.cache import SynthesisCache
+    cache = SynthesisCache(str(tmp_path / "cache"))
+    jobs = make_jobs(tmp_path, 4)
+    for job in jobs:
+        job.params['seed'] = 1
+    # 先生成一次填充缓存
+    first = BatchGenerator(TwoStepClient(), max_workers=1, pipeline=True, cache=cache)
+    assert run_with_timeout(first, jobs)['succeeded'] == 4
+
+    generator = BatchGenerator(TwoStepClient(), max_workers=1, pipeline=True, cache=cache, manifest=BrokenManifest())
+    stats = run_with_timeout(generator, [BatchJob(j.dialogue_info, j.params, j.output_path) for j in jobs])
+    assert stats['succeeded'] == 3 and stats['failed'] == 1
+    assert cache.get_stats()['hits'] == 4
+    assert not cache._inflight
+
+
+def model_jobs(spec):
+    """spec 为 [(model_name, emotion), ...]，按顺序创建任务。"""
+    return [BatchJob({'text': f"第{i}句", 'line_id': f"l{i}"}, {'text': f"第{i}句", 'model_name': model, 'emotion': emotion},
+                     f"{i}.wav") for i, (model, emotion) in enumerate(spec)]
+
+
+def test_count_model_switches():
+    assert count_model_switches([]) == 0
+    assert count_model_switches(model_jobs([('a', 'x'), ('a', 'y'), ('b', 'x'), ('a', 'x')])) == 2
+
+
+def test_schedule_groups_by_model_then_emotion():
+    jobs = model_jobs([('a', 'x'), ('b', 'x'), ('a', 'y'), ('b', 'x'), ('a', 'x'), ('c', 'x')])
+    ordered, lane_models, stats = schedule_jobs_by_model(jobs)
+    # 模型按首次出现的顺序，模型内按情感分组，其余保持剧本顺序
+    assert [job.output_path for job in ordered] == ["0.wav", "4.wav", "2.wav", "1.wav", "3.wav", "5.wav"]
+    assert lane_models == [['a', 'b', 'c']]
+    assert stats == {'model_switches': 2, 'model_switches_avoided': 3}
+
+
+def test_schedule_balances_models_across_lanes():
+    spec = [('a', 'x')] * 6 + [('b', 'x')] * 3 + [('c', 'x')] * 3 + [('d', 'x')] * 1
+    jobs = model_jobs(spec[::2] + spec[1::2])
+    ordered, lane_models, stats = schedule_jobs_by_model(jobs, lanes=2)
+    assert sorted(job.output_path for job in ordered) == sorted(job.output_path for job in jobs)
+    assert sorted(model for models in lane_models for model in models) == ['a', 'b', 'c', 'd']
+    sizes = [sum(spec.count((model, 'x')) for model in models) for models in lane_models]
+    assert max(sizes) - min(sizes) <= 1
+    # 每条通道内模型连续，各通道交错合并
+    lane_of = {model: i for i, models in enumerate(lane_models) for model in models}
+    for lane in range(2):
+        models = [job.params['model_name'] for job in ordered if lane_of[job.params['model_name']] == lane]
+        assert count_model_switches(model_jobs([(m, 'x') for m in models])) == len(lane_models[lane]) - 1
+    assert lane_of[ordered[0].params['model_name']] != lane_of[ordered[1].params['model_name']]
+    # 每条通道内只在模型之间切换: (2 - 1) + (2 - 1)
+    assert stats['model_switches'] == 2
+
+
+def test_model_affinity_pins_models_to_backends(tmp_path):
+    class PinningClient(FlakyClient):
+        def __init__(self):
+            super().__init__()
+            self.pinned = None
+            self.order = []
+
+        def healthy_backend_count(self):
+            return 2
+
+        def pin_models(self, lane_models):
+            self.pinned = lane_models
+
+        def generate_audio_to_file(self, output_path, **params):
+            self.order.append(params['model_name'])
+            return super().generate_audio_to_file(output_path, **params)
+
+    jobs = model_jobs([('a', 'x'), ('b', 'x'), ('a', 'x'), ('b', 'x')])
+    for job in jobs:
+        job.output_path = os.path.join(tmp_path, job.output_path)
+    client = PinningClient()
+    stats = BatchGenerator(client, max_workers=1, model_affinity=True).run(jobs)
+    assert stats['succeeded'] == 4
+    assert sorted(map(sorted, client.pinned)) == [['a'], ['b']]
+    assert stats['model_switches'] == 0 and stats['model_switches_avoided'] == 3
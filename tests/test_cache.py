@@ -0,0 +1,133 @@
+import os
+import time
+from threading import Barrier, Lock, Thread
+
+from dubbing_tool.cache import SynthesisCache, hash_params
+
+PARAMS = {'text': '你好', 'model_name': 'm', 'emotion': '平静', 'seed': 42}
+
+
+def writer(data: bytes, calls: list = None):
+    """返回 make(output_path)，生成一个把 data 写入 output_path 的 generate 回调；调用时记录到 calls。"""
+    def make(output_path):
+        def generate():
+            if calls is not None:
+                calls.append(output_path)
+            with open(output_path, 'wb') as f:
+                f.write(data)
+            return True
+        return generate
+    return make
+
+
+def test_hit_materializes_without_generating(tmp_path):
+    cache = SynthesisCache(str(tmp_path / "cache"))
+    calls = []
+    make = writer(b'audio', calls)
+    first, second = str(tmp_path / "a.wav"), str(tmp_path / "b.wav")
+    assert cache.get_or_generate(PARAMS, first, make(first))
+    assert cache.get_or_generate(dict(PARAMS), second, make(second))
+    assert calls == [first]
+    with open(second, 'rb') as f:
+        assert f.read() == b'audio'
+    assert cache.get_stats()['hits'] == 1 and cache.get_stats()['misses'] == 1
+    assert os.path.exists(os.path.join(str(tmp_path / "cache"), hash_params(PARAMS)[:2], hash_params(PARAMS)))
+
+
+def test_random_seed_is_not_cached(tmp_path):
+    cache = SynthesisCache(str(tmp_path / "cache"))
+    calls = []
+    make = writer(b'audio', calls)
+    params = {**PARAMS, 'seed': -1}
+    for name in ("a.wav", "b.wav"):
+        path = str(tmp_path / name)
+        assert cache.get_or_generate(params, path, make(path))
+    assert len(calls) == 2
+    assert cache.get_stats()['entries'] == 0
+
+
+def test_failed_generation_is_not_stored(tmp_path):
+    cache = SynthesisCache(str(tmp_path / "cache"))
+    path = str(tmp_path / "a.wav")
+    assert not cache.get_or_generate(PARAMS, path, lambda: False)
+    calls = []
+    assert cache.get_or_generate(PARAMS, path, writer(b'audio', calls)(path))
+    assert calls == [path]
+
+
+def test_concurrent_identical_requests_are_coalesced(tmp_path):
+    cache = SynthesisCache(str(tmp_path / "cache"))
+    calls = []
+    lock = Lock()
+    barrier = Barrier(4)
+    results = []
+
+    def worker(i):
+        path = str(tmp_path / f"{i}.wav")
+
+        def generate():
+            with lock:
+                calls.append(path)
+            time.sleep(0.1)
+            with open(path, 'wb') as f:
+                f.write(b'audio')
+            return True
+
+        barrier.wait()
+        results.append(cache.get_or_generate(PARAMS, path, generate))
+
+    threads = [Thread(target=worker, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert results == [True] * 4
+    assert len(calls) == 1
+    assert cache.get_stats()['coalesced'] == 3
+    for i in range(4):
+        with open(tmp_path / f"{i}.wav", 'rb') as f:
+            assert f.read() == b'audio'
+
+
+def test_lru_eviction_keeps_recently_used(tmp_path):
+    cache = SynthesisCache(str(tmp_path / "cache"), max_size_mb=2.5 / 1024)  # 2.5 KB
+    data = b'x' * 1024
+    paths = {}
+    for seed in (1, 2):
+        paths[seed] = str(tmp_path / f"{seed}.wav")
+        cache.get_or_generate({**PARAMS, 'seed': seed}, paths[seed], writer(data)(paths[seed]))
+    # 使用 seed=1 的条目，使 seed=2 成为最久未使用的条目
+    assert cache.acquire({**PARAMS, 'seed': 1}, str(tmp_path / "again.wav")) == (True, hash_params({**PARAMS, 'seed': 1}))
+    path = str(tmp_path / "3.wav")
+    cache.get_or_generate({**PARAMS, 'seed': 3}, path, writer(data)(path))
+    assert cache.get_stats()['evictions'] == 1
+    calls = []
+    path = str(tmp_path / "2-again.wav")
+    cache.get_or_generate({**PARAMS, 'seed': 2}, path, writer(data, calls)(path))
+    assert calls == [path]
+
+
+def test_index_is_rebuilt_from_disk(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    path = str(tmp_path / "a.wav")
+    SynthesisCache(cache_dir).get_or_generate(PARAMS, path, writer(b'audio')(path))
+    # 其他程序放在缓存目录中的文件不计入
+    os.makedirs(os.path.join(cache_dir, "scripts"))
+    with open(os.path.join(cache_dir, "scripts", "x.pickle"), 'wb') as f:
+        f.write(b'pickle')
+    cache = SynthesisCache(cache_dir)
+    assert cache.get_stats()['entries'] == 1
+    assert cache.acquire(PARAMS, str(tmp_path / "b.wav"))[0]
+
+
+def test_missing_cache_file_falls_back_to_generation(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    cache = SynthesisCache(cache_dir)
+    path = str(tmp_path / "a.wav")
+    cache.get_or_generate(PARAMS, path, writer(b'audio')(path))
+    key = hash_params(PARAMS)
+    os.remove(os.path.join(cache_dir, key[:2], key))
+    calls = []
+    other = str(tmp_path / "b.wav")
+    assert cache.get_or_generate(PARAMS, other, writer(b'audio', calls)(other))
+    assert calls == [other]
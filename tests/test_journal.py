@@ -0,0 +1,91 @@
+import os
+import shutil
+import time
+
+from dubbing_tool.batch import build_batch_jobs
+from dubbing_tool.journal import JobJournal
+from dubbing_tool.manifest import OutputManifest, expected_outputs
+from dubbing_tool.script_parser import get_all_dialogues
+
+CHARACTER_MODELS = {'A': 'model_a'}
+DEFAULTS = {'temperature': 1.0, 'text_lang': '中文'}
+
+
+def make_script(lines):
+    return {'script_name': '测试剧本',
+            'scenes': [{'scene_name': '第一幕', 'dialogues': [{'character': 'A', 'text': t, 'emotion': '平静'} for t in lines]}]}
+
+
+def enqueue_script(output_dir, script_data):
+    journal = JobJournal.for_script(output_dir, script_data)
+    jobs, _ = build_batch_jobs(script_data, get_all_dialogues(script_data), CHARACTER_MODELS, DEFAULTS, output_dir)
+    journal.enqueue(jobs)
+    return journal, jobs
+
+
+def expected(output_dir, script_data):
+    return expected_outputs(script_data, get_all_dialogues(script_data), CHARACTER_MODELS, DEFAULTS, output_dir)
+
+
+def test_running_jobs_are_recovered_in_script_order(tmp_path):
+    output_dir = str(tmp_path)
+    script_data = make_script(['一', '二', '三'])
+    journal, jobs = enqueue_script(output_dir, script_data)
+    # 第二句执行到一半时程序退出
+    journal.mark_running(jobs[1])
+    journal.mark_running(jobs[0])
+    journal.mark_done(jobs[0])
+    journal.close()
+
+    journal = JobJournal.for_script(output_dir, script_data)
+    assert journal.recovered == 1
+    resumed = journal.unfinished_jobs()
+    assert [job.output_path for job in resumed] == [jobs[1].output_path, jobs[2].output_path]
+    assert resumed[0].params == jobs[1].params and resumed[0].signature == jobs[1].signature
+    assert journal.get_summary() == {'done': 1, 'queued': 2}
+    journal.close()
+
+
+def test_failed_jobs_are_not_resumed(tmp_path):
+    output_dir = str(tmp_path)
+    journal, jobs = enqueue_script(output_dir, make_script(['一', '二']))
+    journal.mark_running(jobs[0])
+    journal.mark_failed(jobs[0], "HTTP 500", final=False)
+    journal.mark_running(jobs[1])
+    journal.mark_failed(jobs[1], "HTTP 400", final=True)
+    assert [job.output_path for job in journal.unfinished_jobs()] == [jobs[0].output_path]
+    failures = journal.get_failures()
+    assert [(f['output_path'], f['attempts'], f['last_error']) for f in failures] == [(jobs[1].output_path, 1, "HTTP 400")]
+    journal.close()
+
+
+def test_resume_drops_outputs_written_since_and_edited_lines(tmp_path):
+    output_dir = str(tmp_path)
+    script_data = make_script(['一', '二', '三'])
+    journal, jobs = enqueue_script(output_dir, script_data)
+    time.sleep(0.01)
+    # 取消批量后，第一句在详情页中手动重新生成
+    manifest = OutputManifest.for_script(output_dir, script_data)
+    os.makedirs(os.path.dirname(jobs[0].output_path), exist_ok=True)
+    with open(jobs[0].output_path, 'wb') as f:
+        f.write(b'audio')
+    manifest.record(jobs[0].output_path, jobs[0].dialogue_info.get('line_id'))
+    # 之后第三句的文本被修改
+    edited = make_script(['一', '二', '三 (修改)'])
+
+    resumed = journal.unfinished_jobs(manifest, expected(output_dir, edited))
+    assert [job.output_path for job in resumed] == [jobs[1].output_path]
+    # 被丢弃的任务已从日志中删除
+    assert journal.get_summary() == {'queued': 1}
+    journal.close()
+
+
+def test_journal_survives_moving_the_output_dir(tmp_path):
+    script_data = make_script(['一'])
+    journal, jobs = enqueue_script(str(tmp_path / "old"), script_data)
+    journal.close()
+    shutil.move(str(tmp_path / "old"), str(tmp_path / "new"))
+    journal = JobJournal.for_script(str(tmp_path / "new"), script_data)
+    resumed = journal.unfinished_jobs()
+    assert [job.output_path for job in resumed] == [jobs[0].output_path.replace(str(tmp_path / "old"), str(tmp_path / "new"))]
+    journal.close()
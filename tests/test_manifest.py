@@ -0,0 +1,151 @@
+import os
+
+from dubbing_tool.batch import build_batch_jobs, line_signature, save_audio_metadata
+from dubbing_tool.manifest import ORPHANED_DIRNAME, OutputManifest, sync_script_outputs
+from dubbing_tool.script_parser import get_all_dialogues
+
+CHARACTER_MODELS = {'A': 'model_a'}
+DEFAULTS = {'temperature': 1.0, 'top_k': 10, 'app_key': '', 'text_lang': '中文'}
+
+
+def make_script(lines):
+    return {'script_name': '测试剧本',
+            'scenes': [{'scene_name': '第一幕', 'dialogues': [{'character': 'A', 'text': t, 'emotion': '平静'} for t in lines]}]}
+
+
+def generate_all(output_dir, script_data, defaults=DEFAULTS):
+    """模拟批量生成：写出每句的音频和带签名的元数据，返回 (manifest, jobs)。"""
+    manifest = OutputManifest.for_script(output_dir, script_data)
+    jobs, _ = build_batch_jobs(script_data, get_all_dialogues(script_data), CHARACTER_MODELS, defaults, output_dir)
+    for job in jobs:
+        os.makedirs(os.path.dirname(job.output_path), exist_ok=True)
+        with open(job.output_path, 'wb') as f:
+            f.write(job.params['text'].encode('utf-8'))
+        save_audio_metadata(job.output_path, job.params, job.signature)
+        manifest.record(job.output_path, job.dialogue_info.get('line_id'))
+    manifest.save()
+    return manifest, jobs
+
+
+def sync(output_dir, script_data, defaults=DEFAULTS):
+    manifest = OutputManifest.for_script(output_dir, script_data)
+    counts = sync_script_outputs(manifest, script_data, get_all_dialogues(script_data), CHARACTER_MODELS, defaults, output_dir)
+    return manifest, counts
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read().decode('utf-8')
+
+
+def test_signature_ignores_sampling_and_service_settings():
+    info = {'text': '你好', 'emotion': '平静'}
+    base = line_signature(info, 'model_a', DEFAULTS)
+    assert line_signature(info, 'model_a', {**DEFAULTS, 'temperature': 0.7, 'seed': 42, 'app_key': 'k', 'dl_url': 'x'}) == base
+    assert line_signature(info, 'model_a', {**DEFAULTS, 'text_lang': '英文'}) != base
+    assert line_signature(info, 'model_b', DEFAULTS) != base
+    assert line_signature({**info, 'emotion': '愤怒'}, 'model_a', DEFAULTS) != base
+    assert line_signature(info, None, DEFAULTS) is None
+
+
+def test_sync_moves_outputs_after_insert(tmp_path):
+    output_dir = str(tmp_path)
+    generate_all(output_dir, make_script(['一', '二', '三']))
+
+    edited = make_script(['零', '一', '二', '三'])
+    manifest, counts = sync(output_dir, edited)
+    assert counts == {'moved': 3, 'invalidated': 0}
+    jobs, _ = build_batch_jobs(edited, get_all_dialogues(edited), CHARACTER_MODELS, DEFAULTS, output_dir)
+    assert [job.output_path in manifest for job in jobs] == [False, True, True, True]
+    assert [read(job.output_path) for job in jobs[1:]] == ['一', '二', '三']
+
+
+def test_sync_orphans_edited_line(tmp_path):
+    output_dir = str(tmp_path)
+    manifest, jobs = generate_all(output_dir, make_script(['一', '二', '三']))
+
+    manifest, counts = sync(output_dir, make_script(['一', '贰', '三']))
+    assert counts == {'moved': 0, 'invalidated': 1}
+    assert jobs[1].output_path not in manifest
+    orphaned = os.path.join(manifest.script_dir, ORPHANED_DIRNAME, os.path.relpath(jobs[1].output_path, manifest.script_dir))
+    assert read(orphaned) == '二'
+
+
+def test_sync_keeps_outputs_when_settings_change(tmp_path):
+    output_dir = str(tmp_path)
+    script_data = make_script(['一', '二'])
+    generate_all(output_dir, script_data)
+
+    _, counts = sync(output_dir, script_data, {**DEFAULTS, 'temperature': 0.5, 'app_key': 'new'})
+    assert counts == {'moved': 0, 'invalidated': 0}
+
+
+def test_sync_keeps_files_without_signature(tmp_path):
+    output_dir = str(tmp_path)
+    script_data = make_script(['一', '二'])
+    manifest, jobs = generate_all(output_dir, script_data)
+    # 早于签名功能生成的文件：元数据中没有签名
+    os.remove(os.path.splitext(jobs[0].output_path)[0] + ".json")
+    manifest.record(jobs[0].output_path)
+    manifest.save()
+
+    manifest, counts = sync(output_dir, make_script(['零', '一', '二']))
+    assert counts['invalidated'] == 0
+    assert jobs[0].output_path in manifest
+
+
+def write_take(output_path, number, params, signature):
+    from dubbing_tool.takes import take_path
+    path = take_path(output_path, number)
+    with open(path, 'wb') as f:
+        f.write(f"take{number}".encode('utf-8'))
+    save_audio_metadata(path, params, signature)
+    return path
+
+
+def test_sync_moves_takes_with_their_line(tmp_path):
+    from dubbing_tool.takes import list_takes
+    output_dir = str(tmp_path)
+    manifest, jobs = generate_all(output_dir, make_script(['一', '二']))
+    for number in (1, 2):
+        write_take(jobs[0].output_path, number, jobs[0].params, jobs[0].signature)
+    write_take(jobs[1].output_path, 1, jobs[1].params, jobs[1].signature)
+
+    # 调换顺序：候选版本跟随正式音频移动到新路径
+    edited = make_script(['二', '一'])
+    manifest, counts = sync(output_dir, edited)
+    assert counts['moved'] == 2
+    new_jobs, _ = build_batch_jobs(edited, get_all_dialogues(edited), CHARACTER_MODELS, DEFAULTS, output_dir)
+    assert [read(path) for _, path, _ in list_takes(new_jobs[1].output_path, new_jobs[1].signature)] == ['take1', 'take2']
+    assert [read(path) for _, path, _ in list_takes(new_jobs[0].output_path, new_jobs[0].signature)] == ['take1']
+    assert list_takes(jobs[0].output_path) == [] and list_takes(jobs[1].output_path) == []
+
+
+def test_sync_orphans_takes_with_their_line(tmp_path):
+    from dubbing_tool.takes import list_takes
+    output_dir = str(tmp_path)
+    manifest, jobs = generate_all(output_dir, make_script(['一', '二']))
+    write_take(jobs[1].output_path, 1, jobs[1].params, jobs[1].signature)
+
+    manifest, counts = sync(output_dir, make_script(['一', '贰']))
+    assert counts['invalidated'] == 1
+    assert list_takes(jobs[1].output_path) == []
+    orphaned = os.path.join(manifest.script_dir, ORPHANED_DIRNAME, os.path.relpath(jobs[1].output_path, manifest.script_dir))
+    assert [number for number, _, _ in list_takes(orphaned)] == [1]
+
+
+def test_record_stores_request_hash(tmp_path):
+    from dubbing_tool.cache import hash_params
+    from dubbing_tool.takes import promote_take
+    output_dir = str(tmp_path)
+    manifest, jobs = generate_all(output_dir, make_script(['一', '二']))
+    entry = manifest.get(jobs[0].output_path)
+    assert entry['params_hash'] == hash_params(jobs[0].params)
+    assert manifest.find_by_params(jobs[1].params) == [jobs[1].output_path]
+
+    # 设为正式的版本：参数哈希取自元数据，不含签名和来源字段
+    take_params = {**jobs[0].params, 'seed': 5}
+    take = write_take(jobs[0].output_path, 1, take_params, jobs[0].signature)
+    assert promote_take(take, jobs[0].output_path)
+    manifest.record(jobs[0].output_path)
+    assert manifest.get(jobs[0].output_path)['params_hash'] == hash_params(take_params)
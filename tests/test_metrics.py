@@ -0,0 +1,136 @@
+import io
+import json
+import os
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+import pytest
+
+from dubbing_tool.api_client import ApiClient
+from dubbing_tool.batch import BatchGenerator, BatchJob
+from dubbing_tool.metrics import KIND_TAKES, GenerationMetrics, LineTrace, current_trace, tracing
+from dubbing_tool.takes import generate_takes
+
+INFER_SECONDS = 0.05
+
+
+def make_wav(seconds: float) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(16000)
+        w.writeframes(b'\x01\x00' * int(16000 * seconds))
+    return buffer.getvalue()
+
+
+class InferHandler(BaseHTTPRequestHandler):
+    """模拟 /infer_single：推理耗时 INFER_SECONDS，音频时长为 1 秒。"""
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        time.sleep(INFER_SECONDS)
+        body = json.dumps({'audio_url': "http://0.0.0.0/outputs/line.wav"}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        data = make_wav(1.0)
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def api_client():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), InferHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    client = ApiClient(f"http://127.0.0.1:{server.server_address[1]}", {'media_type': 'wav'})
+    yield client
+    client.close()
+    server.shutdown()
+
+
+def test_parallel_requests_are_not_double_counted():
+    trace = LineTrace()
+
+    def request():
+        with trace.request():
+            time.sleep(0.1)
+
+    threads = [Thread(target=request) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert 0.09 <= trace.synthesis < 0.25
+
+
+def test_rtf_excludes_local_work(tmp_path):
+    path = str(tmp_path / "a.wav")
+    with open(path, 'wb') as f:
+        f.write(make_wav(1.0))
+    trace = LineTrace()
+    with trace.request():
+        time.sleep(0.05)
+    time.sleep(0.2)  # 写元数据、任务日志等本地操作
+    metrics = GenerationMetrics()
+    metrics.record({'line_id': 'l0'}, {'text': '你好', 'model_name': 'm'}, path, trace, True)
+    record = metrics.records[0]
+    assert record['total'] >= 0.25
+    assert 0.04 <= record['rtf'] < 0.15
+
+
+def test_batch_rtf_uses_http_time(tmp_path, api_client):
+    class SlowJournal:
+        """每次记录都很慢的任务日志：不应计入实时率。"""
+
+        def mark_running(self, job):
+            time.sleep(0.1)
+
+        def mark_failed(self, job, message, final):
+            pass
+
+        def mark_done(self, job):
+            time.sleep(0.1)
+
+    jobs = [BatchJob({'line_id': f"l{i}", 'character': 'A'}, {'text': f"第{i}句", 'model_name': 'm', 'emotion': '平静'},
+                     str(tmp_path / f"{i}.wav")) for i in range(3)]
+    metrics = GenerationMetrics()
+    stats = BatchGenerator(api_client, max_workers=3, journal=SlowJournal(), metrics=metrics).run(jobs)
+    assert stats['succeeded'] == 3
+    for record in metrics.records:
+        assert record['synthesis'] >= INFER_SECONDS
+        assert record['total'] - record['synthesis'] >= 0.09
+        assert record['rtf'] == pytest.approx(record['synthesis'] / record['duration'], abs=1e-3)
+
+
+def test_takes_are_recorded(tmp_path, api_client):
+    metrics = GenerationMetrics(KIND_TAKES)
+    info = {'line_id': 'l0', 'character': 'A'}
+    results = generate_takes(api_client, str(tmp_path / "a.wav"), {'text': '你好', 'model_name': 'm', 'emotion': '平静'},
+                             count=2, metrics=metrics, dialogue_info=info)
+    assert all(success for _, _, success in results)
+    assert len(metrics.records) == 2
+    assert all(r['character'] == 'A' and r['rtf'] and not r['cached'] for r in metrics.records)
+    report_path, prometheus_path = metrics.write(str(tmp_path / ".metrics"))
+    assert os.path.basename(report_path).startswith("takes-")
+    assert os.path.basename(prometheus_path) == "takes.prom"
+
+
+def test_tracing_is_thread_local():
+    trace = LineTrace()
+    seen = []
+    with tracing(trace):
+        thread = Thread(target=lambda: seen.append(current_trace()))
+        thread.start()
+        thread.join()
+    assert seen == [None]
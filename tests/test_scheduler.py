@@ -0,0 +1,109 @@
+import time
+from threading import Event, Thread, current_thread
+
+import pytest
+
+from dubbing_tool.scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE, PRIORITY_PREFETCH, RequestScheduler
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "等待超时"
+        time.sleep(0.005)
+
+
+def test_higher_priority_waiters_go_first():
+    scheduler = RequestScheduler(1)
+    order = []
+    release = Event()
+
+    def holder():
+        with scheduler.slot(PRIORITY_BATCH):
+            release.wait()
+
+    def worker(priority, tag):
+        with scheduler.slot(priority):
+            order.append(tag)
+
+    first = Thread(target=holder)
+    first.start()
+    wait_for(lambda: scheduler.get_stats()['batch']['active'] == 1)
+    threads = []
+    for priority, tag in [(PRIORITY_BATCH, 'b1'), (PRIORITY_BATCH, 'b2'), (PRIORITY_PREFETCH, 'p'), (PRIORITY_INTERACTIVE, 'i')]:
+        thread = Thread(target=worker, args=(priority, tag))
+        thread.start()
+        threads.append(thread)
+        wait_for(lambda n=len(threads): sum(s['queued'] for s in scheduler.get_stats().values()) == n)
+    release.set()
+    for thread in [first] + threads:
+        thread.join(5)
+    assert order == ['i', 'p', 'b1', 'b2']
+    stats = scheduler.get_stats()
+    assert stats['batch']['requests'] == 3 and stats['interactive']['requests'] == 1
+    assert all(s['queued'] == 0 and s['active'] == 0 for s in stats.values())
+
+
+def test_concurrency_limit():
+    scheduler = RequestScheduler(2)
+    active = []
+    peak = []
+
+    def worker():
+        with scheduler.slot():
+            active.append(1)
+            peak.append(len(active))
+            time.sleep(0.02)
+            active.pop()
+
+    threads = [Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert max(peak) <= 2
+
+
+def test_interrupted_wait_does_not_block_later_waiters():
+    scheduler = RequestScheduler(1)
+    original_wait = scheduler._cond.wait
+
+    def interruptible_wait(*args, **kwargs):
+        if current_thread().name == "interrupted":
+            raise KeyboardInterrupt
+        return original_wait(*args, **kwargs)
+
+    scheduler._cond.wait = interruptible_wait
+    got_slot = Event()
+    errors = []
+
+    def interrupted():
+        try:
+            with scheduler.slot(PRIORITY_INTERACTIVE):
+                pass
+        except KeyboardInterrupt:
+            errors.append('interrupted')
+
+    def later():
+        with scheduler.slot(PRIORITY_BATCH):
+            got_slot.set()
+
+    with scheduler.slot(PRIORITY_BATCH):
+        thread = Thread(target=interrupted, name="interrupted")
+        thread.start()
+        thread.join(5)
+        waiter = Thread(target=later, daemon=True)
+        waiter.start()
+    assert got_slot.wait(5), "中断的等待者仍然挡在队首"
+    waiter.join(5)
+    assert errors == ['interrupted']
+    assert scheduler.get_stats()['interactive']['queued'] == 0
+
+
+def test_exception_inside_slot_releases_it():
+    scheduler = RequestScheduler(1)
+    with pytest.raises(RuntimeError):
+        with scheduler.slot():
+            raise RuntimeError("请求失败")
+    with scheduler.slot() as waited:
+        assert waited < 1
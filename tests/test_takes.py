@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+from dubbing_tool.batch import save_audio_metadata
+from dubbing_tool.takes import (VARY_SEED, VARY_TEMPERATURE, list_takes, move_takes, promote_take, take_path,
+                                take_variants)
+
+
+def write_take(output_path, number, signature=None):
+    path = take_path(output_path, number)
+    with open(path, 'wb') as f:
+        f.write(f"take{number}".encode('utf-8'))
+    save_audio_metadata(path, {'seed': number}, signature)
+    return path
+
+
+def test_take_variants_seed_sweep_is_reproducible():
+    variants = take_variants({'seed': 100, 'temperature': 1.0}, 3, VARY_SEED)
+    assert [v['seed'] for v in variants] == [100, 101, 102]
+    random_seeds = take_variants({'seed': -1}, 4, VARY_SEED)
+    assert all(v['seed'] >= 0 for v in random_seeds) and len({v['seed'] for v in random_seeds}) == 4
+
+
+def test_take_variants_temperature_sweep_shares_seed():
+    variants = take_variants({'seed': 7, 'temperature': 1.0}, 3, VARY_TEMPERATURE)
+    assert {v['seed'] for v in variants} == {7}
+    assert [v['temperature'] for v in variants] == [0.7, 1.0, 1.3]
+    with pytest.raises(ValueError):
+        take_variants({}, 2, "pitch")
+
+
+def test_list_takes_skips_stale_signatures(tmp_path):
+    output_path = str(tmp_path / "0000_A_一.wav")
+    write_take(output_path, 1, "current")
+    write_take(output_path, 2, "stale")
+    write_take(output_path, 3)
+    assert [number for number, _, _ in list_takes(output_path)] == [1, 2, 3]
+    assert [number for number, _, _ in list_takes(output_path, "current")] == [1, 3]
+
+
+def test_move_takes_renumbers_on_collision(tmp_path):
+    src = str(tmp_path / "a.wav")
+    dst = str(tmp_path / "sub" / "b.wav")
+    os.makedirs(os.path.dirname(dst))
+    write_take(src, 1)
+    write_take(src, 2)
+    write_take(dst, 1)
+    assert move_takes(src, dst) == 2
+    assert list_takes(src) == []
+    moved = list_takes(dst)
+    assert [number for number, _, _ in moved] == [1, 2, 3]
+    assert moved[2][2]['seed'] == 1
+    assert os.path.exists(os.path.splitext(take_path(dst, 3))[0] + ".json")
+
+
+def test_promote_take_copies_audio_and_metadata(tmp_path):
+    output_path = str(tmp_path / "a.wav")
+    path = write_take(output_path, 2)
+    assert promote_take(path, output_path)
+    with open(output_path, 'rb') as f:
+        assert f.read() == b"take2"
+    assert os.path.exists(path)